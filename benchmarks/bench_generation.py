@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the TXM script generation of the collectlib libraries, with a
+golden-output regression check. It does not need Sardana:
+
+    python benchmarks/bench_generation.py [--sizes xs,s,m,l] [--update]
+
+Synthetic sample lists of increasing size are generated for ManyTomos,
+SpectroTomo (in every acquisition order) and EnergyScan. For every case
+the generation time, the peak memory (traced Python allocations) and the
+output bytes are reported, and the script is compared byte for byte with
+the golden script in benchmarks/golden, if there is one. --update writes
+the golden scripts of the sizes given instead of checking them.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+from collections import OrderedDict
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2
+    tracemalloc = None
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+GOLDEN_DIR = os.path.join(BENCHMARKS_DIR, 'golden')
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARKS_DIR),
+                                'macros_lib'))
+
+from collectlib.tomoslib import ManyTomos
+from collectlib.spectrotomolib import SpectroTomo, ORDERS
+from collectlib.energyscanlib import EnergyScan
+
+
+# (samples, regions, energies, repetitions, zone plates)
+SIZES = OrderedDict([
+    ('xs', (1, 1, 1, 1, 1)),
+    ('s', (2, 2, 2, 2, 3)),
+    ('m', (4, 3, 4, 2, 3)),
+    ('l', (16, 4, 8, 3, 3)),
+    ('xl', (64, 6, 16, 5, 3)),
+])
+# sizes with a golden script
+GOLDEN_SIZES = ('xs', 's')
+DEFAULT_SIZES = ('xs', 's', 'm', 'l')
+
+# theta range of the synthetic samples, split in the angular regions
+THETA_MIN = -60.0
+THETA_MAX = 60.0
+THETA_STEP = 6
+
+
+def _theta_regions(num_regions):
+    span = (THETA_MAX - THETA_MIN) / num_regions
+    return [(THETA_MIN + span * region, THETA_MIN + span * (region + 1))
+            for region in range(num_regions)]
+
+
+def tomos_samples(num_samples, num_regions, num_energies, num_images,
+                  num_zps):
+    samples = []
+    for sample in range(num_samples):
+        energies = [[700.0 + 5 * energy, 20000.0 + 10 * energy]
+                    for energy in range(num_energies)]
+        regions = []
+        for region, (start, end) in enumerate(_theta_regions(num_regions)):
+            if region % 2:
+                # odd regions are swept downwards
+                start, end = end, start
+            zp_step = 0.5 if num_zps > 1 else 0
+            regions.append([start, end, THETA_STEP, 1 + region,
+                            50.0 + region, zp_step, num_zps])
+        samples.append(['20171124', 'sample%d' % sample, sample,
+                        2.0 * sample, 3.0 * sample, energies, regions,
+                        100.0, 200.0, 2, 10, num_images])
+    return samples
+
+
+def spectrotomo_samples(num_samples, num_regions, num_energies,
+                        num_images, num_zps):
+    samples = []
+    for sample in range(num_samples):
+        regions = [[start, end, THETA_STEP, 1 + region]
+                   for region, (start, end) in enumerate(
+                       _theta_regions(num_regions))]
+        zp_step = 0.5 if num_zps > 1 else 0
+        # energies given in decreasing order, to exercise the orders
+        energies = [[710.0 - 2.5 * energy, 20000.0 + 10 * energy,
+                     -10000.0 + energy, zp_step, 2]
+                    for energy in range(num_energies)]
+        samples.append(['sample%d' % sample, sample, 2.0 * sample,
+                        3.0 * sample, regions, energies, num_images,
+                        100.0, 200.0])
+    return samples
+
+
+def energyscan_samples(num_samples, num_regions, num_energies, num_images,
+                       num_zps):
+    samples = []
+    for sample in range(num_samples):
+        positions = [[sample + region, 2.0 * sample, 3.0 * region]
+                     for region in range(num_regions)]
+        energies = [[515.0 + 10 * energy, 524.5 + 10 * energy, 0.5, 1, 2]
+                    for energy in range(num_energies)]
+        samples.append(['sample%d' % sample, positions, energies,
+                        -10143.1, -9827.8, -1103.0, -787.8, 100.0, 200.0,
+                        num_images])
+    return samples
+
+
+def cases():
+    """OrderedDict of case name: function(samples size, file name)
+    returning the TXM commands object."""
+    result = OrderedDict()
+    result['manytomos'] = lambda size, file_name: ManyTomos(
+        tomos_samples(*size), file_name)
+    for order in ORDERS:
+        result['spectrotomo_%s' % order] = (
+            lambda size, file_name, order=order: SpectroTomo(
+                spectrotomo_samples(*size), file_name, order=order))
+    result['energyscan'] = lambda size, file_name: EnergyScan(
+        energyscan_samples(*size), file_name)
+    return result
+
+
+def golden_name(case, size_name):
+    return os.path.join(GOLDEN_DIR, '%s_%s.txt' % (case, size_name))
+
+
+def run_case(factory, size, file_name):
+    """Generate the script, returning (seconds, peak bytes). The peak
+    memory is measured in a second generation, so the tracing does not
+    slow down the timed one."""
+    txm_obj = factory(size, file_name)
+    start = timeit.default_timer()
+    # streamed, without the manifest, which needs the whole script
+    txm_obj.generate(manifest=False)
+    seconds = timeit.default_timer() - start
+    if tracemalloc is None:
+        return seconds, None
+    txm_obj = factory(size, file_name)
+    tracemalloc.start()
+    try:
+        txm_obj.generate(manifest=False)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return seconds, peak
+
+
+def check_golden(file_name, golden):
+    """'ok', 'FAILED' or '-' (no golden script)."""
+    if not os.path.exists(golden):
+        return '-'
+    with open(file_name, 'rb') as output:
+        with open(golden, 'rb') as expected:
+            if output.read() == expected.read():
+                return 'ok'
+    return 'FAILED'
+
+
+def format_bytes(num_bytes):
+    if num_bytes is None:
+        return 'n/a'
+    for unit in ('B', 'KiB', 'MiB'):
+        if num_bytes < 1024:
+            return '%.1f %s' % (num_bytes, unit)
+        num_bytes /= 1024.0
+    return '%.1f GiB' % num_bytes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', default=','.join(DEFAULT_SIZES),
+                        help='comma separated sizes among: %s'
+                        % ', '.join(SIZES))
+    parser.add_argument('--cases', default=None,
+                        help='comma separated cases (default: all)')
+    parser.add_argument('--update', action='store_true',
+                        help='write the golden scripts of the sizes given')
+    args = parser.parse_args(argv)
+    size_names = args.sizes.split(',')
+    all_cases = cases()
+    if args.cases is None:
+        case_names = list(all_cases)
+    else:
+        case_names = args.cases.split(',')
+
+    print('%-24s %-4s %10s %12s %12s %7s'
+          % ('case', 'size', 'time (s)', 'peak memory', 'output',
+             'golden'))
+    failed = False
+    directory = tempfile.mkdtemp()
+    try:
+        for case in case_names:
+            for size_name in size_names:
+                file_name = os.path.join(directory, 'script.txt')
+                seconds, peak = run_case(all_cases[case], SIZES[size_name],
+                                         file_name)
+                golden = golden_name(case, size_name)
+                if args.update and size_name in GOLDEN_SIZES:
+                    shutil.copyfile(file_name, golden)
+                    status = 'updated'
+                else:
+                    status = check_golden(file_name, golden)
+                failed = failed or status == 'FAILED'
+                print('%-24s %-4s %10.3f %12s %12s %7s'
+                      % (case, size_name, seconds, format_bytes(peak),
+                         format_bytes(os.path.getsize(file_name)), status))
+    finally:
+        shutil.rmtree(directory)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
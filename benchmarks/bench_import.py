@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+"""
+Import time budget of the collectlib modules. It does not need Sardana:
+
+    python benchmarks/bench_import.py [--repeat 5]
+
+Every module is imported in a new Python process, repeat times, and the
+fastest import time is compared with its budget. The modules must neither
+import NumPy nor Sardana: NumPy is only imported when an acquisition plan
+is built (see planner), so the macros reload and the scripts are
+generated without it. The exit status is 1 if a budget is exceeded or a
+heavy module is imported.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import OrderedDict
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+MACROS_LIB_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'macros_lib')
+
+# module: import time budget (s)
+BUDGETS = OrderedDict([
+    ('collectlib.tomoslib', 0.05),
+    ('collectlib.spectrotomolib', 0.05),
+    ('collectlib.energyscanlib', 0.05),
+    ('collectlib.batch', 0.1),
+])
+# modules which must not be imported
+HEAVY_MODULES = ('numpy', 'sardana')
+
+MEASURE = '''
+import json, sys, timeit
+start = timeit.default_timer()
+import %s
+seconds = timeit.default_timer() - start
+heavy = [name for name in %r if name in sys.modules]
+print(json.dumps([seconds, heavy]))
+'''
+
+
+def measure(module):
+    """Return (import time in s, heavy modules imported) of module, in a
+    new Python process."""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [MACROS_LIB_DIR] + [path for path in [env.get('PYTHONPATH')]
+                            if path])
+    output = subprocess.check_output(
+        [sys.executable, '-c', MEASURE % (module, HEAVY_MODULES)], env=env)
+    seconds, heavy = json.loads(output.decode().strip().splitlines()[-1])
+    return seconds, heavy
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='imports of every module, the fastest is kept')
+    args = parser.parse_args(argv)
+
+    print('%-28s %10s %10s %s' % ('module', 'time (s)', 'budget', 'status'))
+    failed = False
+    for module, budget in BUDGETS.items():
+        results = [measure(module) for _ in range(args.repeat)]
+        seconds = min(seconds for seconds, _ in results)
+        heavy = sorted(set(name for _, names in results for name in names))
+        if heavy:
+            status = 'FAILED (imports %s)' % ', '.join(heavy)
+        elif seconds > budget:
+            status = 'FAILED'
+        else:
+            status = 'ok'
+        failed = failed or status != 'ok'
+        print('%-28s %10.3f %10.3f %s' % (module, seconds, budget, status))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,12 @@
-from sardana.macroserver.macro import Macro, Type
-from collectlib.energyscanlib import EnergyScan
+import os
+
+from sardana.macroserver.macro import Macro, Type, Optional
+from collectlib.energyscanlib import EnergyScan, FF_EVERY
+from collectlib.costmodel import format_duration
+from collectlib.limits import EXPOSURE
+from collectlib.naming import FileNaming
+from collectlib.exposure import ExposurePlanner, TransmissionSpectrum
+from collectlib.macrobase import TXMMacroBase
 
 energy_def = [['E_start', Type.Float, None, 'Energy start position'],
               ['E_end', Type.Float, None, 'Energy end position'],
@@ -13,16 +20,92 @@ sample_pos_def = [['pos_x', Type.Float, None, 'Position of the X motor'],
                   ['pos_z', Type.Float, None, 'Position of the Z motor'],
                   {'min': 1, 'max': 80 }]
 
-
-class energyscanbase(object):
+class energyscanbase(TXMMacroBase):
     """Generate TXM input file for image data collection, to perform spectrum
     measurements. Keeping the same angle, and taking images at
     many different energies (energy scan).
     """
 
-    def run(self, samples, out_file):
-        energy_scan = EnergyScan(samples, out_file)
-        energy_scan.generate()
+    def _output_ff_modes(self, energy_scan, cost_model):
+        estimates = energy_scan.estimate_ff_modes(cost_model)
+        for mode, mode_estimate in estimates.items():
+            self.output("Flat fields '%s': %s (%d images, %s exposure, "
+                        "%s wait)"
+                        % (mode, format_duration(mode_estimate.total),
+                           mode_estimate.num_images,
+                           format_duration(mode_estimate.exposure),
+                           format_duration(mode_estimate.wait)))
+
+    def _get_exposure_planner(self, transmission_file):
+        if not transmission_file:
+            return None
+        spectrum = TransmissionSpectrum.from_file(transmission_file)
+        config = self._get_env("TXM_exposure")
+        if config is None:
+            raise ValueError("The target counts and the flux of the "
+                             "adaptive exposure must be given in the "
+                             "TXM_exposure environment variable")
+        config = dict(config)
+        # the detector limits of the exposure time
+        low, high = self._get_limits().limits.get(EXPOSURE, (None, None))
+        config.setdefault('min_exposure', low)
+        config.setdefault('max_exposure', high)
+        return ExposurePlanner.from_dict(config, spectrum)
+
+    def _output_exposure_saved(self, energy_scan):
+        saved = energy_scan.exposure_saved()
+        if saved >= 0:
+            self.output('Exposure time saved by the adaptive exposure: %s'
+                        % format_duration(saved))
+        else:
+            self.output('Exposure time added by the adaptive exposure: %s'
+                        % format_duration(-saved))
+
+    def run(self, samples, out_file, dry_run=False, skip_redundant=False,
+            num_chunks=1, resume_dir='', schedule=False, ff_mode=FF_EVERY,
+            ff_step=1, mosaic=False, binary_manifest=False,
+            naming='fixed', transmission_file='', compare_modes=False):
+        energy_approach = self._get_energy_approach()
+        collected = self._get_collected(resume_dir)
+        exposure_planner = self._get_exposure_planner(transmission_file)
+        energy_scan = EnergyScan(samples, out_file,
+                                 skip_redundant=skip_redundant,
+                                 energy_approach=energy_approach,
+                                 sample_delay=self._get_sample_delay(),
+                                 ff_mode=ff_mode, ff_step=ff_step,
+                                 mosaic=mosaic,
+                                 naming=FileNaming(naming),
+                                 exposure_planner=exposure_planner,
+                                 calibration=self._get_calibration())
+        cost_model = self._get_cost_model()
+        if compare_modes:
+            self._output_ff_modes(energy_scan, cost_model)
+        if schedule:
+            self._output_schedule(energy_scan, cost_model)
+        script = energy_scan.record(collected)
+        self._verify_limits(energy_scan, script)
+        self._verify_file_names(energy_scan, script)
+        estimate = energy_scan.generate(dry_run=dry_run, estimate=True,
+                                        cost_model=cost_model,
+                                        script=script)
+        self.output(estimate.report())
+        if transmission_file:
+            self._output_exposure_saved(energy_scan)
+        self._output_data_volume(energy_scan, cost_model, script)
+        if not dry_run:
+            self._write_manifest(energy_scan, out_file, script,
+                                 binary_manifest)
+        if skip_redundant:
+            self.output(energy_scan.redundant.report(cost_model))
+        if not dry_run and (ff_mode != FF_EVERY or ff_step > 1):
+            ff_name = '%s_ff.csv' % os.path.splitext(out_file)[0]
+            energy_scan.write_ff_interpolation(ff_name)
+            self.output('Flat field interpolation written to %s' % ff_name)
+        if collected is not None:
+            self.output('%d images skipped' % energy_scan.resume.num_skipped)
+        if num_chunks > 1 and not dry_run:
+            self._output_chunks(energy_scan, num_chunks, cost_model,
+                                script)
 
 
 class energyscan(energyscanbase, Macro):
@@ -34,10 +117,20 @@ class energyscan(energyscanbase, Macro):
                                                                 ' imaged')],
                      ['energy_regions', energy_def, None, ('Regions of the'
                                                            ' energy motor')],
-                     ['ZP_start', Type.Float, None, 'ZP start position'],
-                     ['ZP_end', Type.Float, None, 'ZP end position'],
-                     ['Det_start', Type.Float, None, 'Detector start position'],
-                     ['Det_end', Type.Float, None, 'Detector end position'],  
+                     ['ZP_start', Type.Float, Optional, ('ZP start position '
+                                                         '(calibrated if not '
+                                                         'given)')],
+                     ['ZP_end', Type.Float, Optional, ('ZP end position '
+                                                       '(calibrated if not '
+                                                       'given)')],
+                     ['Det_start', Type.Float, Optional, ('Detector start '
+                                                          'position '
+                                                          '(calibrated if '
+                                                          'not given)')],
+                     ['Det_end', Type.Float, Optional, ('Detector end '
+                                                        'position '
+                                                        '(calibrated if not '
+                                                        'given)')],
                      ['ff_pos_x', Type.Float, None, ('Position of the X motor'
                                                      ' for the flat field'
                                                      ' acquisition')],
@@ -48,6 +141,35 @@ class energyscan(energyscanbase, Macro):
                       'energy')]],
             None, 'List of samples'],
         ['out_file', Type.Filename, None, 'Output file name'],
+        ['dry_run', Type.Boolean, False, ('Only estimate the duration, '
+                                          'do not write the output file')],
+        ['skip_redundant', Type.Boolean, False, ('Remove the commands which '
+                                                 'do not change the TXM '
+                                                 'state')],
+        ['num_chunks', Type.Integer, 1, ('Number of chunk files of balanced '
+                                         'duration to write')],
+        ['resume_dir', Type.String, '', ('Directory of the images already '
+                                         'collected, which are skipped')],
+        ['schedule', Type.Boolean, False, ('Reorder the samples to minimize '
+                                           'the travel between them')],
+        ['ff_mode', Type.String, 'every', ("Flat fields: 'every' ff_step "
+                                           "energies, 'before' or 'after' "
+                                           "the sample sweep, or once per "
+                                           "energy 'region'")],
+        ['ff_step', Type.Integer, 1, ("Energies between flat fields in the "
+                                      "'every' mode")],
+        ['mosaic', Type.Boolean, False, ('Image every sample region at '
+                                         'every energy')],
+        ['binary_manifest', Type.Boolean, False, ('Also write the manifest '
+                                                  'of the images as .npy')],
+        ['naming', Type.String, 'fixed', ("File names: 'fixed' or "
+                                          "'adaptive' precision, or "
+                                          "'indexed' by image number")],
+        ['transmission_file', Type.String, '', ('CSV transmission spectrum '
+                                                'of the samples, adapting '
+                                                'the exposure time to it')],
+        ['compare_modes', Type.Boolean, False, ('Also estimate the other flat '
+                                                'field modes')],
     ]
 
 
@@ -1,85 +1,87 @@
-import numpy as np
-
-from sardana.macroserver.macro import Macro, Type
-from sardana.macroserver.msexception import UnknownEnv
-from collectlib.tomoslib import ManyTomos
+from sardana.macroserver.macro import Macro, Type, Optional
+from collectlib.tomoslib import ManyTomos, NAME, check_date_name
+from collectlib.thetascan import UNIDIRECTIONAL
+from collectlib.naming import FileNaming
+from collectlib.macrobase import TXMMacroBase
 
 energy_zp_def = [['energy', Type.Float, None, 'Beam energy'],
-                 ['det_z', Type.Float, None, 'Detector Z position'],
+                 ['det_z', Type.Float, Optional, ('Detector Z position '
+                                                  '(calibrated if not '
+                                                  'given)')],
                  {'min': 1}]
 
 regions_def = [['start', Type.Float, None, 'Theta start position'],
                ['end', Type.Float, None, 'Theta end position'],
                ['theta_step', Type.Integer, 1, 'Theta step'],
                ['exp_time', Type.Float, None, 'Exposure time'],
-               ['zp_z', Type.Float, None, 'ZonePlate Z position'],
+               ['zp_z', Type.Float, Optional, ('ZonePlate Z position '
+                                               '(calibrated if not given)')],
                ['zp_step', Type.Float, 0, 'ZonePlate step'],
                ['num_zps', Type.Float, 1, 'Number of ZonePlate positions'],
+               ['sampling', Type.String, 'equal', ("Angular sampling: "
+                                                   "'equal', 'golden', "
+                                                   "'slope' or 'sparse'")],
+               ['num_angles', Type.Integer, 0, ('Number of angles of the '
+                                                'other samplings, 0 as '
+                                                'equal')],
                {'min': 1, 'max': 200}]
 
-# name position in sample
-DATE = 0
-NAME = 1
-
-# angular regions position in the macro parameters
-ANGULAR_REGIONS = 6
-
 
-class manytomosbase(object):
+class manytomosbase(TXMMacroBase):
     """Generates a TXM input file with commands to perform multi-sample tomo
     data collection using the XMController Microscope Software.
     """
 
-    def _verify_dates_names(self, samples):
-        for sample in samples:
-            sample_date = sample[DATE]
-            sample_name = sample[NAME]
-            if "_" in sample_date:
-                msg = ("Date must be given in YYYYMMDD format. "
-                       "It cannot contain underscore characters ('_'). "
-                       "Please modify date '{0}' by a suitably formatted "
-                       "date without underscores")
-                raise ValueError(msg.format(sample_date))
-            if "_" in sample_name:
-                msg = ("Sample name must not contain underscore "
-                       "characters ('_'). Please, modify sample name '{0}' "
-                       "by suitably formatted name without underscores.")
-                raise ValueError(msg.format(sample_name))
+    SAMPLE_NAME = NAME
 
-    def _verify_samples(self, samples, zp_limit_neg, zp_limit_pos):
+    def _verify_dates_names(self, samples):
         for sample in samples:
-            for counter, angular_region in enumerate(sample[ANGULAR_REGIONS]):
-                zp_central_pos = angular_region[4]
-                zp_step = angular_region[5]
-                num_zps = angular_region[6]
-                if zp_step == 0:
-                    zp_positions = [zp_central_pos]
-                else:
-                    start = zp_central_pos - zp_step * (num_zps - 1) / 2.0
-                    stop = zp_central_pos + zp_step * (num_zps - 1) / 2.0
-                    zp_positions = np.linspace(start, stop, num_zps)
-                for zp_position in zp_positions:
-                    if (zp_position < zp_limit_neg or 
-                            zp_position > zp_limit_pos):
-                        msg = ("The sample {0} has the zone_plate {1} out of"
-                               " range. The accepted range is from %s to"
-                               " %s um.") % (zp_limit_neg, zp_limit_pos)
-                        date_name = sample[DATE] + sample[NAME]
-                        raise ValueError(msg.format(date_name, counter+1))
+            errors = check_date_name(sample)
+            if errors:
+                raise ValueError(errors[0])
 
-    def run(self, samples, filename):
-        try:
-            zp_limit_neg = self.getEnv("ZP_Z_limit_neg")
-        except UnknownEnv:
-            zp_limit_neg = float("-Inf")
-        try:
-            zp_limit_pos = self.getEnv("ZP_Z_limit_pos")
-        except UnknownEnv:
-            zp_limit_pos = float("Inf")
+    def run(self, samples, filename, dry_run=False, skip_redundant=False,
+            num_chunks=1, resume_dir='',
+            theta_scan=UNIDIRECTIONAL, schedule=False,
+            ff_window=0, binary_manifest=False, naming='fixed',
+            compare_modes=False):
         self._verify_dates_names(samples)
-        self._verify_samples(samples, zp_limit_neg, zp_limit_pos)
-        tomos_obj = ManyTomos(samples, filename)
-        tomos_obj.generate()
+        energy_approach = self._get_energy_approach()
+        collected = self._get_collected(resume_dir)
+        theta_scan = self._get_theta_scan(theta_scan)
+        cost_model = self._get_cost_model()
+        sample_delay = self._get_sample_delay()
+        ff_cache = self._get_ff_cache(ff_window, cost_model)
+        tomos_obj = ManyTomos(samples, filename,
+                              skip_redundant=skip_redundant,
+                              energy_approach=energy_approach,
+                              theta_scan=theta_scan,
+                              sample_delay=sample_delay,
+                              ff_cache=ff_cache,
+                              naming=FileNaming(naming),
+                              calibration=self._get_calibration())
+        if schedule:
+            self._output_schedule(tomos_obj, cost_model)
+        if compare_modes:
+            self._output_theta_scans(tomos_obj, cost_model)
+        script = tomos_obj.record(collected)
+        self._verify_limits(tomos_obj, script)
+        self._verify_file_names(tomos_obj, script)
+        estimate = tomos_obj.generate(dry_run=dry_run, estimate=True,
+                                      cost_model=cost_model, script=script)
+        self.output(estimate.report())
+        self._output_data_volume(tomos_obj, cost_model, script)
+        if not dry_run:
+            self._write_manifest(tomos_obj, filename, script,
+                                 binary_manifest)
+        if skip_redundant:
+            self.output(tomos_obj.redundant.report(cost_model))
+        if ff_window > 0:
+            self._output_ff_cache(tomos_obj, filename, dry_run)
+        if collected is not None:
+            self.output('%d images skipped' % tomos_obj.resume.num_skipped)
+        if num_chunks > 1 and not dry_run:
+            self._output_chunks(tomos_obj, num_chunks, cost_model, script)
 
 
 class manytomos(manytomosbase, Macro):
@@ -105,5 +107,31 @@ class manytomos(manytomosbase, Macro):
                                                     ' per angle')]],
             None, 'List of samples'],
         ['out_file', Type.Filename, None, 'Output file'],
+        ['dry_run', Type.Boolean, False, ('Only estimate the duration, '
+                                          'do not write the output file')],
+        ['skip_redundant', Type.Boolean, False, ('Remove the commands which '
+                                                 'do not change the TXM '
+                                                 'state')],
+        ['num_chunks', Type.Integer, 1, ('Number of chunk files of balanced '
+                                         'duration to write')],
+        ['resume_dir', Type.String, '', ('Directory of the images already '
+                                         'collected, which are skipped')],
+        ['theta_scan', Type.String, 'unidirectional', ("Theta sweeps: "
+                                                       "'unidirectional', or "
+                                                       "reversed at every "
+                                                       "'energy' or "
+                                                       "'sample'")],
+        ['schedule', Type.Boolean, False, ('Reorder the samples to minimize '
+                                           'the travel between them')],
+        ['ff_window', Type.Float, 0, ('Time window (s) reusing the '
+                                      'equivalent flat fields of previous '
+                                      'samples, 0 to not reuse them')],
+        ['binary_manifest', Type.Boolean, False, ('Also write the manifest '
+                                                  'of the images as .npy')],
+        ['naming', Type.String, 'fixed', ("File names: 'fixed' or "
+                                          "'adaptive' precision, or "
+                                          "'indexed' by image number")],
+        ['compare_modes', Type.Boolean, False, ('Also estimate the other '
+                                                'theta scan modes')],
     ]
 
@@ -1,61 +1,78 @@
-from sardana.macroserver.macro import Macro, Type
-from sardana.macroserver.msexception import UnknownEnv
+from sardana.macroserver.macro import Macro, Type, Optional
 from collectlib.spectrotomolib import SpectroTomo
+from collectlib.thetascan import UNIDIRECTIONAL
+from collectlib.costmodel import format_duration
+from collectlib.naming import FileNaming
+from collectlib.macrobase import TXMMacroBase
 
 
-# name position in sample
-NAME = 0
-
-# energy_zp position in the macro parameters
-E_ZP_ZONES = 4
-
-
-class spectrotomobase(object):
+class spectrotomobase(TXMMacroBase):
     """Generate TXM input file for image data collection, to perform
     spectral tomography measurements. Taking images at different energies
     at each individual angle. This allows to keep the same sample position,
     while changing energies.
     """
 
-    def _verify_samples(self, samples, zp_limit_neg, zp_limit_pos):
-        for sample in samples:
-            for counter, e_zp_zone in enumerate(sample[E_ZP_ZONES]):
-                zp_central_pos = e_zp_zone[2]
-                zp_step = e_zp_zone[3]
-                if zp_step == 0:
-                    zp_positions = [zp_central_pos]
-                else:
-                    zp_pos_1 = zp_central_pos - zp_step
-                    zp_pos_2 = zp_central_pos
-                    zp_pos_3 = zp_central_pos + zp_step
-                    zp_positions = [zp_pos_1, zp_pos_2, zp_pos_3]
-                for zp_position in zp_positions:
-                    if zp_position < zp_limit_neg or zp_position > zp_limit_pos:
-                        msg = ("The sample {0} has the zone_plate {1} out of"
-                               " range. The accepted range is from %s to"
-                               " %s um.") % (zp_limit_neg, zp_limit_pos)
-                        raise ValueError(msg.format(sample[NAME], zp_position))
-
-    def run(self, samples, filename):
-        try:
-            zp_limit_neg = self.getEnv("ZP_Z_limit_neg")
-        except UnknownEnv:
-            zp_limit_neg = float("-Inf")
-        try:
-            zp_limit_pos = self.getEnv("ZP_Z_limit_pos")
-        except UnknownEnv:
-            zp_limit_pos = float("Inf")
-
-        self._verify_samples(samples, zp_limit_neg, zp_limit_pos)
-        spectrotomo_obj = SpectroTomo(samples, filename)
-        spectrotomo_obj.generate()
+    def run(self, samples, filename, dry_run=False, skip_redundant=False,
+            order='angle', num_chunks=1, resume_dir='',
+            theta_scan=UNIDIRECTIONAL, schedule=False,
+            ff_window=0, binary_manifest=False, naming='fixed',
+            compare_modes=False):
+        energy_approach = self._get_energy_approach()
+        collected = self._get_collected(resume_dir)
+        theta_scan = self._get_theta_scan(theta_scan)
+        cost_model = self._get_cost_model()
+        sample_delay = self._get_sample_delay()
+        ff_cache = self._get_ff_cache(ff_window, cost_model)
+        spectrotomo_obj = SpectroTomo(samples, filename,
+                                      skip_redundant=skip_redundant,
+                                      energy_approach=energy_approach,
+                                      theta_scan=theta_scan,
+                                      order=order,
+                                      sample_delay=sample_delay,
+                                      ff_cache=ff_cache,
+                                      naming=FileNaming(naming),
+                                      calibration=self._get_calibration())
+        if schedule:
+            self._output_schedule(spectrotomo_obj, cost_model)
+        if compare_modes:
+            self._output_theta_scans(spectrotomo_obj, cost_model)
+            estimates = spectrotomo_obj.estimate_orders(cost_model)
+            for order_name, order_estimate in estimates.items():
+                duration = format_duration(order_estimate.total)
+                self.output("Order '%s': %s" % (order_name, duration))
+        script = spectrotomo_obj.record(collected)
+        self._verify_limits(spectrotomo_obj, script)
+        self._verify_file_names(spectrotomo_obj, script)
+        estimate = spectrotomo_obj.generate(dry_run=dry_run, estimate=True,
+                                            cost_model=cost_model,
+                                            script=script)
+        self.output(estimate.report())
+        self._output_data_volume(spectrotomo_obj, cost_model, script)
+        if not dry_run:
+            self._write_manifest(spectrotomo_obj, filename, script,
+                                 binary_manifest)
+        if skip_redundant:
+            self.output(spectrotomo_obj.redundant.report(cost_model))
+        if ff_window > 0:
+            self._output_ff_cache(spectrotomo_obj, filename, dry_run)
+        if collected is not None:
+            num_skipped = spectrotomo_obj.resume.num_skipped
+            self.output('%d images skipped' % num_skipped)
+        if num_chunks > 1 and not dry_run:
+            self._output_chunks(spectrotomo_obj, num_chunks, cost_model,
+                                script)
 
 
 class spectrotomo(spectrotomobase, Macro):
 
     energy_zp_def = [['energy', Type.Float, None, 'Beam energy'],
-                     ['det_z', Type.Float, None, 'Detector Z position'],
-                     ['zp_z', Type.Float, None, 'ZonePlate Z position'],
+                     ['det_z', Type.Float, Optional, ('Detector Z position '
+                                                      '(calibrated if not '
+                                                      'given)')],
+                     ['zp_z', Type.Float, Optional, ('ZonePlate Z position '
+                                                     '(calibrated if not '
+                                                     'given)')],
                      ['zp_step', Type.Float, 0, 'ZonePlate step'],
                      ['exptime_FF', Type.Float, 1, 'FF Exposure time'],
                      {'min': 1}]
@@ -64,6 +81,12 @@ class spectrotomo(spectrotomobase, Macro):
                  ['theta_end', Type.Float, None, 'Theta end position'],
                  ['theta_step', Type.Integer, 1, 'Theta step'],
                  ['exptime', Type.Float, 1, 'Exposure time'],
+                 ['sampling', Type.String, 'equal', ("Angular sampling: "
+                                                     "'equal', 'golden', "
+                                                     "'slope' or 'sparse'")],
+                 ['num_angles', Type.Integer, 0, ('Number of angles of the '
+                                                  'other samplings, 0 as '
+                                                  'equal')],
                  {'min': 1}]
 
     param_def = [
@@ -88,4 +111,33 @@ class spectrotomo(spectrotomobase, Macro):
          None, 'List of samples'],
 
         ['out_file', Type.Filename, None, 'Output file'],
+        ['dry_run', Type.Boolean, False, ('Only estimate the duration, '
+                                          'do not write the output file')],
+        ['skip_redundant', Type.Boolean, False, ('Remove the commands which '
+                                                 'do not change the TXM '
+                                                 'state')],
+        ['order', Type.String, 'angle', ("Acquisition order: 'angle', "
+                                         "'energy' or 'serpentine'")],
+        ['num_chunks', Type.Integer, 1, ('Number of chunk files of balanced '
+                                         'duration to write')],
+        ['resume_dir', Type.String, '', ('Directory of the images already '
+                                         'collected, which are skipped')],
+        ['theta_scan', Type.String, 'unidirectional', ("Theta sweeps: "
+                                                       "'unidirectional', or "
+                                                       "reversed at every "
+                                                       "'energy' or "
+                                                       "'sample'")],
+        ['schedule', Type.Boolean, False, ('Reorder the samples to minimize '
+                                           'the travel between them')],
+        ['ff_window', Type.Float, 0, ('Time window (s) reusing the '
+                                      'equivalent flat fields of previous '
+                                      'samples, 0 to not reuse them')],
+        ['binary_manifest', Type.Boolean, False, ('Also write the manifest '
+                                                  'of the images as .npy')],
+        ['naming', Type.String, 'fixed', ("File names: 'fixed' or "
+                                          "'adaptive' precision, or "
+                                          "'indexed' by image number")],
+        ['compare_modes', Type.Boolean, False, ('Also estimate the other '
+                                                'theta scan modes and '
+                                                'acquisition orders')],
     ]
\ No newline at end of file
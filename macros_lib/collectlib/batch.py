@@ -0,0 +1,484 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import timeit
+from collections import OrderedDict
+
+from .calibration import FocusCalibration
+from .costmodel import format_duration
+from .energyscanlib import EnergyScan, FF_EVERY, FF_MODES
+from .limits import Limits, report as report_limits
+from .naming import FileNaming, FIXED, MODES as NAMING_MODES, report
+from .sampling import EQUAL
+from .spectrotomolib import SpectroTomo, ANGLE_OUTER, ORDERS
+from .thetascan import ThetaScan, UNIDIRECTIONAL, MODES as THETA_SCAN_MODES
+from .tomoslib import ManyTomos, DATE, NAME, check_date_name
+
+
+"""
+Command line tool generating the TXM scripts of sample tables, without
+Sardana (run with macros_lib in the Python path):
+
+    python -m collectlib.batch --kind manytomos --output-dir scripts \
+        week/*.csv
+
+Every table (.csv, .json, .yaml or .yml) is validated and generates one
+script, or one script per sample group if the samples have a 'group':
+<table name>_<group>.txt, and <table name>.txt for the samples without a
+group. The scripts are generated in parallel by a pool of processes, and
+every script is written with its manifest (see manifest).
+
+The samples have the fields of the parameters of the macros (see FIELDS).
+The JSON and YAML tables are a list of samples, or a dictionary with the
+'samples' and optionally the 'kind' and the generation 'options'. Every
+sample is a dictionary of its fields, or a list of them in the order of
+the macro parameters. The CSV tables have one row per sample and one
+column per field; the nested fields (energies, regions) are written as
+JSON lists, like [[700, 20000], [710, 20100]]. The fields with a default
+can be left empty, like the zone plate and detector positions given by a
+focus calibration (see calibration). No script is generated if two
+scripts have the same file name, and no script is written if the images
+of a script would overwrite each other (see naming) or if it moves an
+axis out of the limits given (see limits).
+"""
+
+MANYTOMOS = 'manytomos'
+SPECTROTOMO = 'spectrotomo'
+ENERGYSCAN = 'energyscan'
+KINDS = (MANYTOMOS, SPECTROTOMO, ENERGYSCAN)
+
+# key of the sample groups
+GROUP = 'group'
+
+# default of the fields which can be left empty, and are then None (the
+# focus positions, taken from the focus calibration)
+OPTIONAL = object()
+
+# (name, type, default) of the sample fields, as the macro parameters.
+# The nested fields have the list of their fields as type, and need at
+# least one entry. A None default means the field is required.
+FIELDS = {
+    MANYTOMOS: [
+        ('date', str, None),
+        ('name', str, None),
+        ('pos_x', float, None),
+        ('pos_y', float, None),
+        ('pos_z', float, None),
+        ('energy_zp', [('energy', float, None),
+                       ('det_z', float, OPTIONAL)], None),
+        ('sample_theta', [('start', float, None),
+                          ('end', float, None),
+                          ('theta_step', int, 1),
+                          ('exp_time', float, None),
+                          ('zp_z', float, OPTIONAL),
+                          ('zp_step', float, 0),
+                          ('num_zps', float, 1),
+                          ('sampling', str, EQUAL),
+                          ('num_angles', int, 0)], None),
+        ('ff_pos_x', float, None),
+        ('ff_pos_y', float, None),
+        ('exp_time_ff', float, None),
+        ('n_FF_images', int, 10),
+        ('n_images', int, 1),
+    ],
+    SPECTROTOMO: [
+        ('name', str, None),
+        ('pos_x', float, None),
+        ('pos_y', float, None),
+        ('pos_z', float, None),
+        ('theta_regions', [('theta_start', float, None),
+                           ('theta_end', float, None),
+                           ('theta_step', int, 1),
+                           ('exptime', float, 1),
+                           ('sampling', str, EQUAL),
+                           ('num_angles', int, 0)], None),
+        ('energy_regions', [('energy', float, None),
+                            ('det_z', float, OPTIONAL),
+                            ('zp_z', float, OPTIONAL),
+                            ('zp_step', float, 0),
+                            ('exptime_FF', float, 1)], None),
+        ('n_images', int, 1),
+        ('ff_pos_x', float, None),
+        ('ff_pos_y', float, None),
+    ],
+    ENERGYSCAN: [
+        ('name', str, None),
+        ('sample_regions', [('pos_x', float, None),
+                            ('pos_y', float, None),
+                            ('pos_z', float, None)], None),
+        ('energy_regions', [('E_start', float, None),
+                            ('E_end', float, None),
+                            ('E_step', float, None),
+                            ('exp_time', float, None),
+                            ('exp_time_FF', float, None)], None),
+        ('ZP_start', float, OPTIONAL),
+        ('ZP_end', float, OPTIONAL),
+        ('Det_start', float, OPTIONAL),
+        ('Det_end', float, OPTIONAL),
+        ('ff_pos_x', float, None),
+        ('ff_pos_y', float, None),
+        ('n_images', int, 1),
+    ],
+}
+
+# generation options of every kind, and their defaults
+OPTIONS = {
+    MANYTOMOS: ('skip_redundant', 'theta_scan', 'naming', 'calibration',
+                'limits'),
+    SPECTROTOMO: ('skip_redundant', 'theta_scan', 'order', 'naming',
+                  'calibration', 'limits'),
+    ENERGYSCAN: ('skip_redundant', 'ff_mode', 'ff_step', 'mosaic',
+                 'naming', 'calibration', 'limits'),
+}
+DEFAULT_OPTIONS = {
+    'skip_redundant': False,
+    'theta_scan': UNIDIRECTIONAL,
+    'order': ANGLE_OUTER,
+    'ff_mode': FF_EVERY,
+    'ff_step': 1,
+    'mosaic': False,
+    'naming': FIXED,
+    'calibration': None,
+    'limits': None,
+}
+
+# focus calibrations and limits read, by file name
+_calibrations = {}
+_limits = {}
+
+
+def _convert(value, field_type, where, errors):
+    """Value converted to field_type, or None adding the error."""
+    if field_type is str:
+        if isinstance(value, (list, dict)):
+            errors.append('%s: %r is not a string' % (where, value))
+            return None
+        return str(value)
+    try:
+        if field_type is int and float(value) != int(float(value)):
+            raise ValueError
+        return field_type(float(value))
+    except (TypeError, ValueError):
+        errors.append('%s: %r is not %s' % (
+            where, value, 'an integer' if field_type is int else 'a number'))
+        return None
+
+
+def _parse_entry(fields, entry, where, errors):
+    """List with the values of the fields of entry (dictionary, list or,
+    for the nested fields of the CSV tables, JSON text)."""
+    if isinstance(entry, dict):
+        unknown = set(entry) - set(name for name, _, _ in fields)
+        unknown.discard(GROUP)
+        for name in sorted(unknown):
+            errors.append('%s: unknown field %s' % (where, name))
+        values = [entry.get(name) for name, _, _ in fields]
+    elif isinstance(entry, (list, tuple)):
+        if len(entry) > len(fields):
+            errors.append('%s: %d values given, %d expected at most'
+                          % (where, len(entry), len(fields)))
+        values = list(entry) + [None] * (len(fields) - len(entry))
+    else:
+        errors.append('%s: %r is not a list of values' % (where, entry))
+        return None
+    result = []
+    for (name, field_type, default), value in zip(fields, values):
+        field_where = '%s: %s' % (where, name)
+        if value is None or value == '':
+            if default is None:
+                errors.append('%s: missing value' % field_where)
+            result.append(None if default is OPTIONAL else default)
+        elif isinstance(field_type, list):
+            result.append(_parse_nested(field_type, value, field_where,
+                                        errors))
+        else:
+            result.append(_convert(value, field_type, field_where, errors))
+    return result
+
+
+def _parse_nested(fields, value, where, errors):
+    if not isinstance(value, (list, tuple)):
+        try:
+            value = json.loads(value)
+        except (TypeError, ValueError):
+            errors.append('%s: %r is not a JSON list' % (where, value))
+            return None
+    if not isinstance(value, list) or not value:
+        errors.append('%s: at least one entry is needed' % where)
+        return None
+    return [_parse_entry(fields, entry, '%s %d' % (where, number), errors)
+            for number, entry in enumerate(value, 1)]
+
+
+def validate(kind, entries, source='samples'):
+    """Return the list of samples (as given to the libraries) of the
+    entries of a table, and their groups (None if not given). Raise a
+    ValueError with all the errors found."""
+    if kind not in KINDS:
+        raise ValueError("Unknown kind '%s'. Accepted kinds are: %s"
+                         % (kind, ', '.join(KINDS)))
+    if not isinstance(entries, list) or not entries:
+        raise ValueError('%s: no samples' % source)
+    errors = []
+    samples = []
+    groups = []
+    for number, entry in enumerate(entries, 1):
+        where = '%s: sample %d' % (source, number)
+        group = None
+        if isinstance(entry, dict):
+            group = entry.get(GROUP) or None
+            if group is not None:
+                group = str(group)
+        sample = _parse_entry(FIELDS[kind], entry, where, errors)
+        if (kind == MANYTOMOS and sample is not None and
+                sample[DATE] is not None and sample[NAME] is not None):
+            errors.extend('%s: %s' % (where, error)
+                          for error in check_date_name(sample))
+        samples.append(sample)
+        groups.append(group)
+    if errors:
+        raise ValueError('\n'.join(errors))
+    return samples, groups
+
+
+def read_table(file_name):
+    """Return the entries of a sample table, its kind and its options
+    (None and {} if they are not given)."""
+    extension = os.path.splitext(file_name)[1].lower()
+    kind = None
+    options = {}
+    if extension == '.csv':
+        with open(file_name) as table_file:
+            entries = [dict(row) for row in csv.DictReader(table_file)]
+    elif extension in ('.json', '.yaml', '.yml'):
+        with open(file_name) as table_file:
+            if extension == '.json':
+                content = json.load(table_file)
+            else:
+                # PyYAML is optional, and only imported when needed
+                try:
+                    import yaml
+                except ImportError:
+                    raise ValueError('%s: PyYAML is needed to read YAML '
+                                     'tables' % file_name)
+                content = yaml.safe_load(table_file)
+        if isinstance(content, dict):
+            kind = content.get('kind')
+            options = content.get('options') or {}
+            entries = content.get('samples')
+        else:
+            entries = content
+    else:
+        raise ValueError('%s: unknown table format (.csv, .json, .yaml or '
+                         '.yml)' % file_name)
+    return entries, kind, options
+
+
+def _calibration(file_name):
+    """Focus calibration of the CSV file (read once), or None."""
+    if file_name is None:
+        return None
+    if file_name not in _calibrations:
+        _calibrations[file_name] = FocusCalibration.from_file(file_name)
+    return _calibrations[file_name]
+
+
+def read_limits(file_name):
+    """Limits of the JSON file (read once), like the TXM_limits Sardana
+    environment variable (see limits.Limits.from_dict), or None."""
+    if file_name is None:
+        return None
+    if file_name not in _limits:
+        with open(file_name) as limits_file:
+            _limits[file_name] = Limits.from_dict(json.load(limits_file))
+    return _limits[file_name]
+
+
+def create(kind, samples, file_name, options):
+    """TXM commands object of kind, with the generation options."""
+    calibration = _calibration(options['calibration'])
+    if kind == MANYTOMOS:
+        return ManyTomos(samples, file_name,
+                         skip_redundant=options['skip_redundant'],
+                         theta_scan=ThetaScan(options['theta_scan']),
+                         naming=FileNaming(options['naming']),
+                         calibration=calibration)
+    if kind == SPECTROTOMO:
+        return SpectroTomo(samples, file_name,
+                           skip_redundant=options['skip_redundant'],
+                           order=options['order'],
+                           theta_scan=ThetaScan(options['theta_scan']),
+                           naming=FileNaming(options['naming']),
+                           calibration=calibration)
+    return EnergyScan(samples, file_name,
+                      skip_redundant=options['skip_redundant'],
+                      ff_mode=options['ff_mode'],
+                      ff_step=options['ff_step'],
+                      mosaic=options['mosaic'],
+                      naming=FileNaming(options['naming']),
+                      calibration=calibration)
+
+
+def plan_jobs(file_name, output_dir, kind=None, options=None):
+    """Read and validate a sample table, returning the generation jobs:
+    (kind, samples, script file name, options), one per table or per
+    sample group. The kind and options of the table take precedence."""
+    entries, table_kind, table_options = read_table(file_name)
+    kind = table_kind or kind
+    if kind is None:
+        raise ValueError('%s: the kind of script is not given' % file_name)
+    samples, groups = validate(kind, entries, file_name)
+    job_options = dict(DEFAULT_OPTIONS)
+    job_options.update(options or {})
+    job_options.update(table_options)
+    unknown = set(table_options) - set(OPTIONS[kind])
+    if unknown:
+        raise ValueError('%s: unknown %s options: %s'
+                         % (file_name, kind, ', '.join(sorted(unknown))))
+    # the options are checked by the libraries
+    create(kind, samples, None, job_options)
+    read_limits(job_options['limits'])
+    root = os.path.join(output_dir,
+                        os.path.splitext(os.path.basename(file_name))[0])
+    grouped = OrderedDict()
+    for sample, group in zip(samples, groups):
+        grouped.setdefault(group, []).append(sample)
+    jobs = []
+    for group, group_samples in grouped.items():
+        if group is None:
+            script_name = root + '.txt'
+        else:
+            script_name = '%s_%s.txt' % (root, group)
+        jobs.append((kind, group_samples, script_name, job_options))
+    return jobs
+
+
+def check_script_names(jobs):
+    """Raise a ValueError if several jobs would write the same script."""
+    script_names = OrderedDict()
+    for _, _, file_name, _ in jobs:
+        path = os.path.normcase(os.path.abspath(file_name))
+        script_names.setdefault(path, []).append(file_name)
+    errors = ['%s: written by %d scripts' % (names[0], len(names))
+              for names in script_names.values() if len(names) > 1]
+    if errors:
+        raise ValueError('\n'.join(errors))
+
+
+def run_job(job):
+    """Generate the script of a job, returning (script file name, number
+    of samples, estimated duration in s, generation time in s, error).
+    The script is not written if the samples have wrong positions (e.g.
+    angular samplings), if it would collect the same file name more than
+    once or if it moves an axis out of the limits: the error tells why,
+    and the other values are None."""
+    kind, samples, file_name, options = job
+    start = timeit.default_timer()
+    txm_obj = create(kind, samples, file_name, options)
+    try:
+        script = txm_obj.record()
+    except ValueError as error:
+        return file_name, len(samples), None, None, str(error)
+    collisions = txm_obj.check_file_names(script=script)
+    if collisions:
+        return file_name, len(samples), None, None, report(collisions)
+    limits = read_limits(options['limits'])
+    if limits is not None:
+        violations = txm_obj.check_limits(limits, script=script)
+        if violations:
+            return (file_name, len(samples), None, None,
+                    report_limits(violations))
+    estimate = txm_obj.generate(estimate=True, script=script)
+    return (file_name, len(samples), estimate.total,
+            timeit.default_timer() - start, None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Generate the TXM scripts of sample tables.')
+    parser.add_argument('tables', nargs='+',
+                        help='sample tables (.csv, .json, .yaml, .yml)')
+    parser.add_argument('--kind', choices=KINDS,
+                        help='kind of script, if not given by the tables')
+    parser.add_argument('--output-dir', default='.',
+                        help='directory of the scripts')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='number of processes (default: CPU count)')
+    parser.add_argument('--skip-redundant', action='store_true',
+                        help='remove the commands which do not change the '
+                        'TXM state')
+    parser.add_argument('--theta-scan', default=UNIDIRECTIONAL,
+                        choices=THETA_SCAN_MODES, help='theta sweeps')
+    parser.add_argument('--order', default=ANGLE_OUTER, choices=ORDERS,
+                        help='spectrotomo acquisition order')
+    parser.add_argument('--ff-mode', default=FF_EVERY, choices=FF_MODES,
+                        help='energyscan flat field mode')
+    parser.add_argument('--ff-step', type=int, default=1,
+                        help="energies between flat fields in the 'every' "
+                        "mode")
+    parser.add_argument('--mosaic', action='store_true',
+                        help='energyscan: image every sample region')
+    parser.add_argument('--naming', default=FIXED, choices=NAMING_MODES,
+                        help='naming scheme of the images')
+    parser.add_argument('--calibration', default=None,
+                        help='CSV focus calibration (energy, ZPz, detz) of '
+                        'the zone plate and detector positions not given')
+    parser.add_argument('--limits', default=None,
+                        help='JSON limits of the axes and exposure time, '
+                        'like {"T": [-70, 70], "exposure": [null, 30]}')
+    args = parser.parse_args(argv)
+    options = dict((name, getattr(args, name)) for name in DEFAULT_OPTIONS)
+
+    jobs = []
+    errors = []
+    for file_name in args.tables:
+        try:
+            jobs.extend(plan_jobs(file_name, args.output_dir, args.kind,
+                                  options))
+        except (IOError, OSError, ValueError) as error:
+            errors.append(str(error))
+    try:
+        check_script_names(jobs)
+    except ValueError as error:
+        errors.append(str(error))
+    if errors:
+        print('\n'.join(errors), file=sys.stderr)
+        return 1
+    if not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+
+    start = timeit.default_timer()
+    if args.processes == 1 or len(jobs) == 1:
+        results = [run_job(job) for job in jobs]
+    else:
+        pool = multiprocessing.Pool(args.processes)
+        try:
+            results = pool.map(run_job, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    num_scripts = 0
+    for file_name, num_samples, duration, seconds, error in results:
+        if error is not None:
+            errors.append('%s: %s' % (file_name, error))
+            continue
+        num_scripts += 1
+        print('%s: %d samples, estimated %s (generated in %.2f s)'
+              % (file_name, num_samples, format_duration(duration), seconds))
+    print('%d scripts generated in %.2f s'
+          % (num_scripts, timeit.default_timer() - start))
+    if errors:
+        print('\n'.join(errors), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
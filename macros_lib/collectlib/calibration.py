@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+import csv
+from bisect import bisect_right
+
+
+"""
+This module is used to compute the zone plate (ZPz) and detector (detz)
+positions which focus the TXM at every energy, from a table of positions
+measured at some energies. The positions are interpolated with monotone
+cubic splines (Fritsch-Carlson), which go through the measured positions
+without overshooting between them, and every energy is only computed
+once. The libraries use the calibration for the positions not given in
+the samples (see txmcommands.GenericTXMcommands.zone_plate_at).
+
+"""
+
+
+def _sign(value):
+    return (value > 0) - (value < 0)
+
+
+class MonotoneSpline(object):
+    """Monotone cubic interpolation of the points (xs, ys), with
+    strictly increasing xs."""
+
+    def __init__(self, xs, ys):
+        self.xs = [float(x) for x in xs]
+        self.ys = [float(y) for y in ys]
+        num_points = len(self.xs)
+        if num_points < 2 or len(self.ys) != num_points:
+            raise ValueError("At least two points are needed to "
+                             "interpolate")
+        steps = [x1 - x0 for x0, x1 in zip(self.xs, self.xs[1:])]
+        if min(steps) <= 0:
+            raise ValueError("The points must have increasing values")
+        secants = [(y1 - y0) / step for y0, y1, step in zip(
+            self.ys, self.ys[1:], steps)]
+        self.steps = steps
+        self.slopes = self._slopes(steps, secants)
+
+    @staticmethod
+    def _slopes(steps, secants):
+        if len(secants) == 1:
+            return secants * 2
+        slopes = [MonotoneSpline._end_slope(steps[0], steps[1],
+                                            secants[0], secants[1])]
+        for index in range(1, len(secants)):
+            before, after = secants[index - 1], secants[index]
+            if before * after <= 0:
+                # local extremum: flat, not to overshoot
+                slopes.append(0.0)
+                continue
+            # weighted harmonic mean of the secants
+            weight1 = 2 * steps[index] + steps[index - 1]
+            weight2 = steps[index] + 2 * steps[index - 1]
+            slopes.append((weight1 + weight2) /
+                          (weight1 / before + weight2 / after))
+        slopes.append(MonotoneSpline._end_slope(steps[-1], steps[-2],
+                                                secants[-1], secants[-2]))
+        return slopes
+
+    @staticmethod
+    def _end_slope(step0, step1, secant0, secant1):
+        """Slope at an end point, from the two closest intervals."""
+        slope = ((2 * step0 + step1) * secant0 -
+                 step0 * secant1) / (step0 + step1)
+        if _sign(slope) != _sign(secant0):
+            return 0.0
+        if (_sign(secant0) != _sign(secant1) and
+                abs(slope) > abs(3 * secant0)):
+            return 3 * secant0
+        return slope
+
+    def __call__(self, x):
+        xs = self.xs
+        if x < xs[0] or x > xs[-1]:
+            raise ValueError("%s is out of the interpolation range [%s, %s]"
+                             % (x, xs[0], xs[-1]))
+        index = min(bisect_right(xs, x), len(xs) - 1) - 1
+        step = self.steps[index]
+        t = (x - xs[index]) / step
+        t2 = t * t
+        t3 = t2 * t
+        return ((2 * t3 - 3 * t2 + 1) * self.ys[index] +
+                (t3 - 2 * t2 + t) * step * self.slopes[index] +
+                (-2 * t3 + 3 * t2) * self.ys[index + 1] +
+                (t3 - t2) * step * self.slopes[index + 1])
+
+
+class FocusCalibration(object):
+    """Zone plate and detector positions focusing the TXM at the measured
+    energies, interpolated at any energy between them."""
+
+    def __init__(self, energies, zone_plates, detectors):
+        rows = sorted(zip(energies, zone_plates, detectors))
+        energies = [row[0] for row in rows]
+        self.zone_plate_spline = MonotoneSpline(
+            energies, [row[1] for row in rows])
+        self.detector_spline = MonotoneSpline(
+            energies, [row[2] for row in rows])
+        # positions of the energies already computed
+        self._focus = {}
+
+    @classmethod
+    def from_dict(cls, config):
+        """Create the calibration from a dictionary like:
+        {'energy': [700, 710, 720], 'ZPz': [-10000, -9990, -9978],
+         'detz': [20000, 20150, 20310]}
+        """
+        return cls(config['energy'], config['ZPz'], config['detz'])
+
+    @classmethod
+    def from_file(cls, file_name):
+        """Read the calibration from a CSV file with the 'energy', 'ZPz'
+        and 'detz' columns."""
+        with open(file_name) as calibration_file:
+            rows = list(csv.DictReader(calibration_file))
+        try:
+            return cls(*[[float(row[column]) for row in rows]
+                         for column in ('energy', 'ZPz', 'detz')])
+        except KeyError as error:
+            raise ValueError('%s: missing column %s' % (file_name, error))
+
+    def focus(self, energy):
+        """Return the (zone plate, detector) positions at energy."""
+        try:
+            return self._focus[energy]
+        except KeyError:
+            try:
+                focus = (self.zone_plate_spline(energy),
+                         self.detector_spline(energy))
+            except ValueError:
+                raise ValueError("Energy %s out of the focus calibration "
+                                 "(%s to %s)"
+                                 % (energy, self.zone_plate_spline.xs[0],
+                                    self.zone_plate_spline.xs[-1]))
+            self._focus[energy] = focus
+            return focus
+
+    def zone_plate(self, energy):
+        return self.focus(energy)[0]
+
+    def detector(self, energy):
+        return self.focus(energy)[1]
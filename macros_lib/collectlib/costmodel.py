@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+
+from .txmscript import LABEL_NAMES
+
+
+"""
+This module is used to predict the duration of the TXM scripts generated by
+the BL09 collect macros, before they are entered in XMController.
+
+"""
+
+
+class AxisCost(object):
+    """Cost of moving one TXM axis.
+
+    The speed is given in axis units per second (um/s for X, Y, Z, ZPz and
+    detz, degrees/s for T and eV/s for energy) and the settle time in
+    seconds. The settle time is paid by every move, even if the axis does
+    not change its position.
+    """
+
+    def __init__(self, speed, settle=0.0):
+        self.speed = float(speed)
+        self.settle = float(settle)
+
+    def move_time(self, start, end):
+        if start is None:
+            # the start position is not known before the first move
+            return self.settle
+        return abs(end - start) / self.speed + self.settle
+
+
+class CostModel(object):
+    """Motor and detector cost model of the BL09 TXM.
+
+    The default values are conservative figures for the BL09 TXM; they can
+    be overwritten for every axis, e.g. from the TXM_cost_model Sardana
+    environment variable (see from_dict).
+    """
+
+    DEFAULT_AXES = {
+        'X': (50.0, 0.5),
+        'Y': (50.0, 0.5),
+        'Z': (50.0, 0.5),
+        'T': (10.0, 0.5),
+        'ZPz': (50.0, 0.5),
+        'detz': (1000.0, 1.0),
+        'energy': (5.0, 0.0),
+    }
+
+    def __init__(self, axes=None, readout=1.0, overhead=0.1):
+        self.axes = {}
+        for axis, (speed, settle) in self.DEFAULT_AXES.items():
+            self.axes[axis] = AxisCost(speed, settle)
+        if axes is not None:
+            self.axes.update(axes)
+        # detector readout time per image (s)
+        self.readout = float(readout)
+        # XMController overhead for every command of the script (s)
+        self.overhead = float(overhead)
+
+    @classmethod
+    def from_dict(cls, config):
+        """Create a cost model from a dictionary like:
+        {'T': [speed, settle], 'energy': [speed, settle], 'readout': 1.0,
+         'overhead': 0.1}
+        Axes which are not given keep their default cost.
+        """
+        config = dict(config)
+        readout = config.pop('readout', 1.0)
+        overhead = config.pop('overhead', 0.1)
+        axes = {}
+        for axis, (speed, settle) in config.items():
+            axes[axis] = AxisCost(speed, settle)
+        return cls(axes, readout, overhead)
+
+    def move_time(self, axis, start, end):
+        return self.axes[axis].move_time(start, end)
+
+    def collect_time(self, exp_time):
+        if exp_time is None:
+            exp_time = 0.0
+        return exp_time + self.readout
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '%d:%02d:%02d' % (hours, minutes, seconds)
+
+
+class DurationEstimate(object):
+    """Predicted wall-clock time of a TXM script.
+
+    Times are accumulated in seconds, in total, per sample, per
+    (sample, energy) and per (sample, region).
+    """
+
+    def __init__(self):
+        self.total = 0.0
+        self.exposure = 0.0
+        self.wait = 0.0
+        self.num_images = 0
+        self.samples = OrderedDict()
+        self.energies = OrderedDict()
+        self.regions = OrderedDict()
+
+    def add(self, seconds, sample=None, energy=None, region=None):
+        self.total += seconds
+        self.samples[sample] = self.samples.get(sample, 0.0) + seconds
+        key = (sample, energy)
+        self.energies[key] = self.energies.get(key, 0.0) + seconds
+        key = (sample, region)
+        self.regions[key] = self.regions.get(key, 0.0) + seconds
+
+    def report(self):
+        lines = ['Estimated duration: %s (%d images, %s exposure, %s wait)'
+                 % (format_duration(self.total), self.num_images,
+                    format_duration(self.exposure),
+                    format_duration(self.wait))]
+        for sample, seconds in self.samples.items():
+            if sample is None:
+                lines.append('  setup: %s' % format_duration(seconds))
+                continue
+            lines.append('  sample %s: %s' % (sample,
+                                              format_duration(seconds)))
+            for (name, energy), seconds in self.energies.items():
+                if name == sample and energy is not None:
+                    lines.append('    energy %.2f: %s'
+                                 % (energy, format_duration(seconds)))
+            for (name, region), seconds in self.regions.items():
+                if name == sample and region is not None:
+                    lines.append('    region %s: %s'
+                                 % (region, format_duration(seconds)))
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return self.report()
+
+
+class DurationEstimator(object):
+    """Replay of TXM commands against the cost model.
+
+    The commands are (name, axis, value) tuples, as given when iterating a
+    txmscript.TXMScript; the time of every command is accumulated in a
+    DurationEstimate, under the last sample and region labels.
+    """
+
+    def __init__(self, cost_model=None):
+        if cost_model is None:
+            cost_model = CostModel()
+        self.cost_model = cost_model
+        self.positions = {}
+        self.exp_time = None
+        self.sample = None
+        self.region = None
+        self.estimate = DurationEstimate()
+
+    def replay(self, commands):
+        for name, axis, value in commands:
+            self.add(name, axis, value)
+        return self.estimate
+
+    def add(self, name, axis, value):
+        if name == 'sample':
+            self.sample = value
+            return
+        if name == 'region':
+            self.region = value
+            return
+        if name in LABEL_NAMES:
+            return
+        cost_model = self.cost_model
+        seconds = cost_model.overhead
+        if name == 'moveto':
+            seconds += cost_model.move_time(axis, self.positions.get(axis),
+                                            value)
+            self.positions[axis] = value
+        elif name == 'wait':
+            self.estimate.wait += value
+            seconds += value
+        elif name == 'setexp':
+            self.exp_time = value
+        elif name == 'collect':
+            self.estimate.num_images += 1
+            self.estimate.exposure += self.exp_time or 0.0
+            seconds += cost_model.collect_time(self.exp_time)
+        self.estimate.add(seconds, self.sample, self.positions.get('energy'),
+                          self.region)
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+
+from .costmodel import DurationEstimator
+
+
+"""
+This module is used to predict the data written by the TXM scripts: every
+collect writes an .xrm file, whose size is given by the detector size, the
+binning set by the script and the header. The write rate is derived from
+the exposure schedule of the cost model (see costmodel), and warnings are
+given when the free space or the bandwidth of the acquisition disk would
+be exceeded.
+
+"""
+
+
+def format_bytes(num_bytes):
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if abs(num_bytes) < 1024:
+            return '%.1f %s' % (num_bytes, unit)
+        num_bytes /= 1024.0
+    return '%.1f TiB' % num_bytes
+
+
+class Detector(object):
+    """Detector of the TXM: width x height pixels (without binning) of
+    bytes_per_pixel bytes, and header bytes in every .xrm file.
+
+    The default values are the ones of the BL09 TXM camera; they can be
+    overwritten from the TXM_detector Sardana environment variable (see
+    from_dict).
+    """
+
+    def __init__(self, width=1024, height=1024, bytes_per_pixel=2,
+                 header=65536):
+        self.width = int(width)
+        self.height = int(height)
+        self.bytes_per_pixel = int(bytes_per_pixel)
+        self.header = int(header)
+
+    @classmethod
+    def from_dict(cls, config):
+        """Create a detector from a dictionary like:
+        {'width': 1024, 'height': 1024, 'bytes_per_pixel': 2,
+         'header': 65536}
+        """
+        return cls(**dict(config))
+
+    def image_bytes(self, binning=1):
+        """Bytes of an .xrm file collected with the binning."""
+        binning = int(binning)
+        return ((self.width // binning) * (self.height // binning) *
+                self.bytes_per_pixel + self.header)
+
+
+class DataVolume(object):
+    """Predicted data written by a TXM script.
+
+    The peak rate (bytes/s) is the one of the images collected one after
+    the other with the shortest exposure time; the mean rate is averaged
+    over the whole duration of the script.
+    """
+
+    def __init__(self):
+        self.num_images = 0
+        self.bytes = 0
+        self.duration = 0.0
+        self.peak_rate = 0.0
+        self.samples = OrderedDict()
+
+    @property
+    def mean_rate(self):
+        if not self.duration:
+            return 0.0
+        return self.bytes / self.duration
+
+    def add(self, image_bytes, rate, sample=None):
+        self.num_images += 1
+        self.bytes += image_bytes
+        self.peak_rate = max(self.peak_rate, rate)
+        self.samples[sample] = self.samples.get(sample, 0) + image_bytes
+
+    def warnings(self, free_space=None, bandwidth=None):
+        """List of warnings if the script writes more than free_space
+        bytes, or faster than bandwidth bytes/s."""
+        warnings = []
+        if free_space is not None and self.bytes > free_space:
+            warnings.append('The script writes %s, more than the %s of free '
+                            'space' % (format_bytes(self.bytes),
+                                       format_bytes(free_space)))
+        if bandwidth is not None and self.peak_rate > bandwidth:
+            warnings.append('The images are written at up to %s/s, more '
+                            'than the %s/s of bandwidth'
+                            % (format_bytes(self.peak_rate),
+                               format_bytes(bandwidth)))
+        return warnings
+
+    def report(self):
+        lines = ['Data volume: %s in %d images (peak %s/s, mean %s/s)'
+                 % (format_bytes(self.bytes), self.num_images,
+                    format_bytes(self.peak_rate),
+                    format_bytes(self.mean_rate))]
+        for sample, num_bytes in self.samples.items():
+            if sample is None:
+                continue
+            lines.append('  %s: %s' % (sample, format_bytes(num_bytes)))
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return self.report()
+
+
+class DataVolumeEstimator(object):
+    """Replay of TXM commands computing the data written.
+
+    The commands are (name, axis, value) tuples, as given when iterating a
+    txmscript.TXMScript. The binning is 1 until a setbinning command.
+    """
+
+    def __init__(self, detector=None, cost_model=None):
+        if detector is None:
+            detector = Detector()
+        self.detector = detector
+        self.durations = DurationEstimator(cost_model)
+        self.binning = 1
+        self.volume = DataVolume()
+
+    def replay(self, commands):
+        for name, axis, value in commands:
+            self.add(name, axis, value)
+        self.volume.duration = self.durations.estimate.total
+        return self.volume
+
+    def add(self, name, axis, value):
+        durations = self.durations
+        durations.add(name, axis, value)
+        if name == 'setbinning':
+            self.binning = value
+        elif name == 'collect':
+            cost_model = durations.cost_model
+            image_bytes = self.detector.image_bytes(self.binning)
+            seconds = (cost_model.collect_time(durations.exp_time) +
+                       cost_model.overhead)
+            self.volume.add(image_bytes, image_bytes / seconds,
+                            durations.sample)
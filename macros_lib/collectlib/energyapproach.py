@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+This module is used to choose how the monochromator energy is moved in the
+TXM scripts, in order to correct its backlash.
+
+"""
+
+INF = float('inf')
+
+# Historical approach of the BL09 macros: the move is repeated 4 times,
+# waiting 60, 10, 5 and 5 seconds between moves, whatever the energy step.
+LEGACY_TABLE = (
+    (INF, (60, 10, 5, 5)),
+)
+
+# Approach graded on the energy step (eV), for fine energy scans.
+STEP_TABLE = (
+    (0.5, (2,)),
+    (2.0, (5, 2)),
+    (10.0, (10, 5, 5)),
+    (INF, (60, 10, 5, 5)),
+)
+
+
+class EnergyApproach(object):
+    """Energy approach strategy.
+
+    The table is a sequence of (max_step, waits) rows: the first row whose
+    max_step (eV) is greater or equal than the energy step gives the waits
+    (s) done between the repeated moves, so the energy is moved
+    len(waits) + 1 times. table_down, if given, is used instead of table
+    when the energy decreases. When the previous energy is not known, the
+    last row of the table is used.
+
+    If from_below is True, the energy is always approached from lower
+    energies: when it decreases, it is first moved overshoot eV below the
+    target.
+    """
+
+    def __init__(self, table=LEGACY_TABLE, table_down=None, from_below=False,
+                 overshoot=1.0):
+        self.table = sorted(table)
+        if table_down is None:
+            self.table_down = self.table
+        else:
+            self.table_down = sorted(table_down)
+        self.from_below = from_below
+        self.overshoot = overshoot
+
+    @classmethod
+    def from_dict(cls, config):
+        """Create an energy approach from a dictionary like:
+        {'table': [[0.5, [2]], [inf, [60, 10, 5, 5]]], 'table_down': None,
+         'from_below': False, 'overshoot': 1.0}
+        """
+        config = dict(config)
+        for key in ('table', 'table_down'):
+            if config.get(key) is not None:
+                config[key] = [(float(max_step), tuple(waits))
+                               for max_step, waits in config[key]]
+        return cls(**config)
+
+    def waits(self, previous, energy):
+        if previous is None:
+            return self.table[-1][1]
+        if energy < previous:
+            table = self.table_down
+        else:
+            table = self.table
+        step = abs(energy - previous)
+        for max_step, waits in table:
+            if step <= max_step:
+                return waits
+        return table[-1][1]
+
+    def approach(self, previous, energy):
+        """Return the list of (position, wait) moves going from the
+        previous energy to energy. A wait of 0 means no wait after the move.
+        """
+        moves = []
+        if self.from_below and (previous is None or energy < previous):
+            start = energy - self.overshoot
+            waits = self.waits(previous, start)
+            if waits:
+                moves.append((start, waits[0]))
+            else:
+                moves.append((start, 0))
+            previous = start
+        for wait_time in self.waits(previous, energy):
+            moves.append((energy, wait_time))
+        moves.append((energy, 0))
+        return moves
@@ -1,7 +1,14 @@
+import csv
 import sys
-import numpy as np
+from bisect import bisect_left
+from collections import OrderedDict
 
-from txmcommands import GenericTXMcommands
+from .txmcommands import GenericTXMcommands
+from .energyapproach import EnergyApproach, STEP_TABLE
+from .naming import INDEXED
+from .planner import linear_focus, linspace
+from .scheduler import order_path, transition_time
+from .txmscript import format_command
 
 NAME = 0
 SAMPLE_REGIONS = 1
@@ -24,6 +31,17 @@ E_STEP = 2
 EXP_TIME = 3
 EXP_TIME_FF = 4
 
+# flat field modes
+# - 'every': flat field every ff_step energies (and at the last one).
+# - 'before' / 'after': flat fields of all the energies collected in one
+#   sweep, before or after the sample images.
+# - 'region': flat field at the first energy of every energy region.
+FF_EVERY = 'every'
+FF_BEFORE = 'before'
+FF_AFTER = 'after'
+FF_REGION = 'region'
+FF_MODES = (FF_EVERY, FF_BEFORE, FF_AFTER, FF_REGION)
+
 FILE_NAME = 'energyscan.txt'
 
 samples = [
@@ -78,13 +96,253 @@ samples = [
 
 class EnergyScan(GenericTXMcommands):
 
-    def __init__(self, samples, file_name=None):
+    """Energy scan: images of the sample at every energy.
+
+    The flat fields are collected as given by ff_mode (see FF_MODES); when
+    they are not collected at every energy, the images are normalized
+    interpolating the flat fields of the closest energies (see
+    ff_interpolation).
+
+    By default, the stage goes through all the sample regions but only the
+    last one is imaged. With mosaic, every sample region is imaged at every
+    energy (the region number is written in the file names), going through
+    the regions in the given order at one energy and in the reverse order
+    at the next one, so the stage does not travel back between energies.
+
+    If exposure_planner is given, the exposure time of the images at every
+    energy is adapted to the transmission of the sample (see
+    exposure.ExposurePlanner), instead of the one of its energy region,
+    and it is only set when it changes. The flat fields collected between
+    the energies (ff_mode 'every' or 'region') set their own exposure
+    time, so the exposure time only changes with the runs of energies of
+    the planner with the 'before' and 'after' modes.
+    """
+
+    def __init__(self, samples, file_name=None, skip_redundant=False,
+                 energy_approach=None, sample_delay=None, ff_mode=FF_EVERY,
+                 ff_step=1, mosaic=False, naming=None,
+                 exposure_planner=None, calibration=None):
+        # small energy steps only need a short backlash correction
+        if energy_approach is None:
+            energy_approach = EnergyApproach(STEP_TABLE)
+        GenericTXMcommands.__init__(self, file_name=file_name,
+                                    skip_redundant=skip_redundant,
+                                    energy_approach=energy_approach,
+                                    sample_delay=sample_delay,
+                                    naming=naming, calibration=calibration)
+        if ff_mode not in FF_MODES:
+            raise ValueError("Unknown flat field mode '%s'. Accepted modes "
+                             "are: %s" % (ff_mode, ', '.join(FF_MODES)))
+        if ff_step < 1:
+            raise ValueError("The flat field step must be at least 1")
         self.samples = samples
-        self.file_name = file_name
-        self._repetitions = None
         self.resolution = 0.1
+        self.ff_mode = ff_mode
+        self.ff_step = ff_step
+        self.mosaic = mosaic
+        self.exposure_planner = exposure_planner
+
+    def _energy_points(self, sample):
+        """List with the energy points of the sample: dictionaries with
+        the energy, its energy region number, zone plate and detector
+        positions, and exposure time of the images (exptime), of their
+        energy region (exptime_region) and of the flat field (exptime_ff).
+        """
+        energy_regions = sample[ENERGY_REGIONS]
+        points = []
+        for e_region_num, energy_region in enumerate(energy_regions):
+            # energy values
+            e_start = energy_region[E_START]
+            e_end = energy_region[E_END]
+            e_step = energy_region[E_STEP]
+            num_energies = int(round((e_end - e_start) / e_step)) + 1
+            for energy in linspace(e_start, e_end, num_energies):
+                points.append({'energy': energy,
+                               'region': e_region_num + 1,
+                               'exptime': energy_region[EXP_TIME],
+                               'exptime_region': energy_region[EXP_TIME],
+                               'exptime_ff': energy_region[EXP_TIME_FF]})
+        energies = [point['energy'] for point in points]
+        if self.exposure_planner is not None:
+            exp_times = self.exposure_planner.exposures(energies)
+            for point, exp_time in zip(points, exp_times):
+                point['exptime'] = exp_time
+
+        # The zp and detector positions move linearly with the energy, in
+        # steps of resolution (0.1 electronvolts) in the total energy range,
+        # or are the ones of the focus calibration if they are not given
+        first_energy = energy_regions[0][E_START]
+        last_energy = energy_regions[-1][E_END]
+        num_small_steps = round((last_energy - first_energy) /
+                                self.resolution)
+        range_end = first_energy + num_small_steps * self.resolution
+        if sample[ZP_START] is None or sample[ZP_END] is None:
+            zps = [self.zone_plate_at(energy) for energy in energies]
+        else:
+            zps = linear_focus(energies, first_energy, range_end,
+                               sample[ZP_START], sample[ZP_END])
+        if sample[DET_START] is None or sample[DET_END] is None:
+            dets = [self.detector_at(energy) for energy in energies]
+        else:
+            dets = linear_focus(energies, first_energy, range_end,
+                                sample[DET_START], sample[DET_END])
+        for point, zp, det in zip(points, zps, dets):
+            point['zp'] = zp
+            point['detz'] = det
+        return points
+
+    def _ff_mask(self, points):
+        """List telling which energy points have a flat field collected
+        during the sample sweep."""
+        num_points = len(points)
+        if self.ff_mode == FF_EVERY:
+            mask = [index % self.ff_step == 0 for index in range(num_points)]
+            mask[-1] = True
+        elif self.ff_mode == FF_REGION:
+            mask = [index == 0 or
+                    point['region'] != points[index - 1]['region']
+                    for index, point in enumerate(points)]
+        else:
+            mask = [False] * num_points
+        return mask
+
+    def _ff_name(self, sample, energy):
+        return '%s_0_FF_%s.xrm' % (sample[NAME],
+                                   self.naming.number(energy, 2, 6))
+
+    def _ff_file(self, sample, energy, sample_number=None):
+        """File name of the flat field of the sample at energy."""
+        file_name = self._ff_name(sample, energy)
+        if sample_number is None:
+            return file_name
+        return self.indexed_names.get((sample_number, file_name), file_name)
+
+    def ff_interpolation(self, sample, sample_number=None):
+        """Return a list with the flat fields used to normalize the
+        images of every energy: (energy, [(flat field file, weight), ...]).
+        The flat fields of the closest energies are linearly interpolated.
+        With the indexed naming, the file names are the ones of the sample
+        number of the script last recorded.
+        """
+        points = self._energy_points(sample)
+        energies = [point['energy'] for point in points]
+        if self.ff_mode in (FF_BEFORE, FF_AFTER):
+            ff_energies = energies
+        else:
+            ff_energies = [energy for energy, with_ff in zip(
+                energies, self._ff_mask(points)) if with_ff]
+        interpolation = []
+        for energy in energies:
+            high = bisect_left(ff_energies, energy)
+            if high == len(ff_energies):
+                weights = [(ff_energies[-1], 1.0)]
+            elif ff_energies[high] == energy or high == 0:
+                weights = [(ff_energies[high], 1.0)]
+            else:
+                low_energy = ff_energies[high - 1]
+                high_energy = ff_energies[high]
+                weight = ((energy - low_energy) /
+                          (high_energy - low_energy))
+                weights = [(low_energy, 1.0 - weight),
+                           (high_energy, weight)]
+            interpolation.append((
+                float(energy), [(self._ff_file(sample, ff_energy,
+                                               sample_number),
+                                 float(weight))
+                                for ff_energy, weight in weights]))
+        return interpolation
+
+    def write_ff_interpolation(self, file_name):
+        """Write the flat field interpolation of all the samples as CSV:
+        one row per sample, energy and flat field file, with its
+        weight."""
+        if self.naming.mode == INDEXED and not self.indexed_names:
+            # the indexed names are known once the script is recorded
+            self.record()
+        with open(file_name, 'w') as ff_file:
+            writer = csv.writer(ff_file, lineterminator='\n')
+            writer.writerow(['sample', 'energy', 'flat_field', 'weight'])
+            for number, sample in enumerate(self.samples):
+                for energy, weights in self.ff_interpolation(sample,
+                                                             number):
+                    for name, weight in weights:
+                        writer.writerow([sample[NAME], '%.2f' % energy,
+                                         name, '%.4f' % weight])
+
+    def exposure_saved(self):
+        """Exposure time (s) of the sample images saved by the exposure
+        planner, compared to the exposure times of the energy regions
+        (negative if the images are exposed longer)."""
+        saved = 0.0
+        for sample in self.samples:
+            num_images = sample[N_IMAGES]
+            if self.mosaic:
+                num_images *= len(sample[SAMPLE_REGIONS])
+            for point in self._energy_points(sample):
+                saved += num_images * (point['exptime_region'] -
+                                       point['exptime'])
+        return saved
+
+    def estimate_ff_modes(self, cost_model=None):
+        """Estimate the duration of the script for every flat field mode
+        (the 'every' mode with the current ff_step).
+
+        Return an OrderedDict with the DurationEstimate of every mode.
+        """
+        current_mode = self.ff_mode
+        estimates = OrderedDict()
+        try:
+            for mode in FF_MODES:
+                self.ff_mode = mode
+                estimates[mode] = self.generate(dry_run=True,
+                                                cost_model=cost_model)
+        finally:
+            self.ff_mode = current_mode
+        return estimates
+
+    def _mosaic_order(self, sample, point_number):
+        """Numbers of the sample regions, in the order they are imaged at
+        the energy point_number."""
+        order = list(range(len(sample[SAMPLE_REGIONS])))
+        if point_number % 2:
+            order.reverse()
+        return order
+
+    def _sample_stops(self, sample):
+        # the scan starts and ends at the first sample region and energy
+        sample_region = sample[SAMPLE_REGIONS][0]
+        stop = {'X': sample_region[POS_X], 'Y': sample_region[POS_Y],
+                'Z': sample_region[POS_Z],
+                'energy': sample[ENERGY_REGIONS][0][E_START]}
+        return stop, stop
+
+    def _schedule_sample(self, sample, cost_model=None):
+        if self.mosaic:
+            # the file names are numbered with the given region order
+            return sample
+        # at every energy, the stage goes from the flat field position
+        # through all the sample regions, and the last one is imaged
+        sample_regions = sample[SAMPLE_REGIONS]
+        stops = [{'X': sample[FF_POS_X], 'Y': sample[FF_POS_Y]}]
+        for sample_region in sample_regions:
+            stops.append({'X': sample_region[POS_X],
+                          'Y': sample_region[POS_Y],
+                          'Z': sample_region[POS_Z]})
+        costs = [[transition_time(start, end, cost_model) for end in stops]
+                 for start in stops]
+        order = order_path(costs, fixed_first=True, fixed_last=True)
+        sample = list(sample)
+        sample[SAMPLE_REGIONS] = [sample_regions[index - 1]
+                                  for index in order[1:]]
+        return sample
 
     def collect_escan(self, sample):
+        for _ in self.iter_escan(sample):
+            pass
+
+    def iter_escan(self, sample):
+
+        self.current_sample_name = sample[NAME]
 
         # Sample start positions 
         sample_region = sample[SAMPLE_REGIONS][0]
@@ -92,129 +350,129 @@ class EnergyScan(GenericTXMcommands):
         start_y = sample_region[POS_Y]
         start_z = sample_region[POS_Z]
 
-        init_energy_region = sample[ENERGY_REGIONS][0]
-        end_energy_region = sample[ENERGY_REGIONS][-1]
-        first_energy = init_energy_region[E_START]
-        last_energy = end_energy_region[E_END]
-
-        # Total number of steps of 0.1 electronvolts in the total energy range
-        num_small_steps = round((last_energy - first_energy) / self.resolution)
-
-        # Counter of steps of 0.1 electronvolts in Energy
-        counter_small_steps = 0
-
-        # zp start and end positions
-        zp_start_global = zp_start = sample[ZP_START]
-        zp_end = sample[ZP_END]
-
-        # detector start and end positions
-        det_start_global = det_start = sample[DET_START]
-        det_end = sample[DET_END]
+        first_energy = sample[ENERGY_REGIONS][0][E_START]
 
-        # zp and detector small steps: 
-        # the step if the energy was increased by the resolution factor.
-        zp_step_resolution = (zp_end - zp_start) / num_small_steps
-        det_step_resolution = (det_end - det_start) / num_small_steps
-        
         # Images to be collected for each angle position
         self._repetitions = sample[N_IMAGES]
 
         # Collect images
-        e_regions_number = len(sample[ENERGY_REGIONS])
-        for e_region_num in range(e_regions_number):
-
-            energy_region = sample[ENERGY_REGIONS][e_region_num]
-
-            # energy values
-            e_start = energy_region[E_START]
-            e_end = energy_region[E_END]
-            e_step = energy_region[E_STEP]
-        
-        
-            n_small_step_in_Eregion = (e_end - e_start) / self.resolution
-            # Number of steps of 0.1eV in a single Energy step
-            num_small_steps_in_energy_step = round(e_step / self.resolution)
-                                
-            zp_step = zp_step_resolution * num_small_steps_in_energy_step
-            det_step = det_step_resolution * num_small_steps_in_energy_step
-      
-            energies = np.linspace(e_start, e_end,
-                                   round((e_end - e_start) / e_step) +1)
-
-            if e_region_num != 0:
-                zp_start = zp_end_previous_Eregion + zp_step_resolution * (
-                    e_start - e_end_prevous_Eregion) / self.resolution
-                det_start = det_end_previous_Eregion + det_step_resolution * (
-                    e_start - e_end_prevous_Eregion) / self.resolution
-
-            zp_pos = zp_start
-            det_pos = det_start
-            
-            for count in range(len(energies)):
-
-                # Collect sample image
-                self.setExpTime(energy_region[EXP_TIME])
-                self.moveEnergy(energies[count])
-                self.moveZonePlateZ(zp_pos)
-                self.moveDetector(det_pos)
-
+        points = self._energy_points(sample)
+        # focus at the first energy
+        zp_start_global = points[0]['zp']
+        det_start_global = points[0]['detz']
+        if self.ff_mode == FF_BEFORE:
+            for _ in self._iter_ff_sweep(sample, points):
+                yield
+        ff_mask = self._ff_mask(points)
+        for point_number, (point, with_ff) in enumerate(zip(points,
+                                                             ff_mask)):
+
+            self.current_region = int(point['region'])
+            energy = point['energy']
+
+            # Collect sample image
+            self._set_exp_time(point['exptime'])
+            self.go_to_energy(energy)
+            self.moveZonePlateZ(point['zp'])
+            self.moveDetector(point['detz'])
+
+            if self.mosaic:
+                for sample_pos_num in self._mosaic_order(sample,
+                                                         point_number):
+                    sample_region = sample[SAMPLE_REGIONS][sample_pos_num]
+                    self.moveX(sample_region[POS_X])
+                    self.moveY(sample_region[POS_Y])
+                    self.moveZ(sample_region[POS_Z])
+                    self._collect_images(sample, energy, sample_pos_num)
+            else:
                 num_sample_positions = len(sample[SAMPLE_REGIONS])
                 for sample_pos_num in range (num_sample_positions):
                     sample_region = sample[SAMPLE_REGIONS][sample_pos_num]
                     self.moveX(sample_region[POS_X])
                     self.moveY(sample_region[POS_Y])
                     self.moveZ(sample_region[POS_Z])
+                self._collect_images(sample, energy)
 
-                base_name = sample[NAME]
-                if self._repetitions == 1:
-                    command = 'collect %s_0_%6.2f_0.xrm\n'
-                    self.destination.write(command % (base_name, 
-                                                      energies[count]))
-                else:
-                    for repetition in range(self._repetitions):
-                        command = 'collect %s_0_%6.2f_0_%s.xrm\n'
-                        rep_str = str(repetition).zfill(3)
-                        self.destination.write(command % (base_name, 
-                                                          energies[count], 
-                                                          rep_str))
-
-                # Collect flatfield image
-                self.setExpTime(energy_region[EXP_TIME_FF])
+            # Collect flatfield image
+            if with_ff:
+                self._set_exp_time(point['exptime_ff'])
                 self.moveX(sample[FF_POS_X])
                 self.moveY(sample[FF_POS_Y])
+                self.collectImage(self._ff_name(sample, energy),
+                                  flatfield=True)
+            yield
 
-                base_name = sample[NAME]
-                self.destination.write('collect %s_0_FF_%6.2f.xrm\n' % 
-                                       (base_name, energies[count]))
-
-                zp_pos += zp_step
-                det_pos += det_step
-                
-            zp_end_previous_Eregion = zp_start + (n_small_step_in_Eregion * 
-                                                  zp_step_resolution)
-            det_end_previous_Eregion = det_start + (n_small_step_in_Eregion * 
-                                                    det_step_resolution)
-            e_end_prevous_Eregion = e_end
-            
+        self.current_region = None
+        if self.ff_mode == FF_AFTER:
+            for _ in self._iter_ff_sweep(sample, points):
+                yield
 
         ## Come back to initial positions
         self.moveX(start_x)
         self.moveY(start_y)
         self.moveZ(start_z)
-        self.setExpTime(energy_region[EXP_TIME])
-        self.moveEnergy(first_energy)
+        self.setExpTime(sample[ENERGY_REGIONS][-1][EXP_TIME])
+        # with the backlash correction, so the next sample starts at a
+        # settled energy
+        self.go_to_energy(first_energy)
         self.moveZonePlateZ(zp_start_global)      
         self.moveDetector(det_start_global)
 
-    def collect_data(self):
+    def _set_exp_time(self, exp_time):
+        if (self.exposure_planner is not None and
+                self.state.get('exptime') ==
+                format_command('setexp', None, exp_time)):
+            # the exposure time of the run of energies is kept
+            return
+        self.setExpTime(exp_time)
+
+    def _collect_images(self, sample, energy, sample_region_num=0):
+        base_name = sample[NAME]
+        energy = self.naming.number(energy, 2, 6)
+        if self._repetitions == 1:
+            file_name = '%s_0_%s_%d.xrm'
+            self.collectImage(file_name % (base_name, energy,
+                                           sample_region_num))
+        else:
+            for repetition in range(self._repetitions):
+                file_name = '%s_0_%s_%d_%s.xrm'
+                rep_str = str(repetition).zfill(3)
+                self.collectImage(file_name % (base_name, energy,
+                                               sample_region_num, rep_str),
+                                  repetition)
+
+    def _iter_ff_sweep(self, sample, points):
+        """Collect the flat fields of all the energies in one sweep
+        downwards, at the flat field position (and the Z of the imaged
+        sample region)."""
+        self.current_region = 'FF'
+        self.moveX(sample[FF_POS_X])
+        self.moveY(sample[FF_POS_Y])
+        self.moveZ(sample[SAMPLE_REGIONS][-1][POS_Z])
+        for point in points[::-1]:
+            energy = point['energy']
+            self._set_exp_time(point['exptime_ff'])
+            self.go_to_energy(energy)
+            self.moveZonePlateZ(point['zp'])
+            self.moveDetector(point['detz'])
+            self.collectImage(self._ff_name(sample, energy), flatfield=True)
+            yield
+        self.current_region = None
+
+    def iter_collect(self):
         self.setBinning()
-        for sample in self.samples:
-            self.collect_escan(sample)
-            # wait 5 minutes between samples
+        next_samples = self.samples[1:] + [None]
+        for sample, next_sample in zip(self.samples, next_samples):
+            for _ in self.iter_escan(sample):
+                yield
+            self._num_samples += 1
+            # wait between samples (5 minutes by default)
             if len(self.samples) > 1:
-                self.wait(300)
+                self.wait_between_samples(sample, next_sample)
 
 
+# example script, run from the macros_lib directory with:
+#     python -m collectlib.energyscanlib
 if __name__ == '__main__':
     energy_scan = EnergyScan(samples, FILE_NAME)
     energy_scan.generate()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import math
+from bisect import bisect_left
+
+
+"""
+This module is used to adapt the exposure time of the energy scans to the
+transmission of the sample: below an absorption edge the sample transmits
+more, so a shorter exposure gives the same counts as the longer one
+needed above the edge. The exposure time of every energy is computed from
+a reference transmission spectrum (or a quick pre-scan) and a target
+number of counts, clipped to the detector limits and rounded so that
+consecutive energies share the same exposure time.
+
+"""
+
+
+class TransmissionSpectrum(object):
+    """Transmission of the sample (from 0 to 1) at the given energies,
+    linearly interpolated between them (and constant outside)."""
+
+    def __init__(self, energies, transmissions):
+        points = sorted(zip(energies, transmissions))
+        if not points:
+            raise ValueError("The transmission spectrum is empty")
+        for energy, transmission in points:
+            if transmission <= 0:
+                raise ValueError("Wrong transmission %s at energy %s: it "
+                                 "must be positive" % (transmission, energy))
+        self.energies = [float(energy) for energy, _ in points]
+        self.transmissions = [float(transmission)
+                              for _, transmission in points]
+
+    @classmethod
+    def from_prescan(cls, energies, counts, flat_counts):
+        """Create the spectrum from the counts of the sample and of the
+        flat field of a pre-scan, at every energy."""
+        return cls(energies, [float(sample) / flat
+                              for sample, flat in zip(counts, flat_counts)])
+
+    @classmethod
+    def from_file(cls, file_name):
+        """Read the spectrum from a CSV file with the 'energy' and
+        'transmission' columns, or with the 'energy', 'counts' and
+        'flat_counts' columns of a pre-scan."""
+        with open(file_name) as spectrum_file:
+            rows = list(csv.DictReader(spectrum_file))
+        try:
+            energies = [float(row['energy']) for row in rows]
+            if rows and 'transmission' not in rows[0]:
+                return cls.from_prescan(
+                    energies, [float(row['counts']) for row in rows],
+                    [float(row['flat_counts']) for row in rows])
+            return cls(energies, [float(row['transmission'])
+                                  for row in rows])
+        except KeyError as error:
+            raise ValueError('%s: missing column %s' % (file_name, error))
+
+    def transmission(self, energy):
+        energies = self.energies
+        transmissions = self.transmissions
+        high = bisect_left(energies, energy)
+        if high == len(energies):
+            return transmissions[-1]
+        if high == 0 or energies[high] == energy:
+            return transmissions[high]
+        low = high - 1
+        weight = ((energy - energies[low]) /
+                  (energies[high] - energies[low]))
+        return ((1.0 - weight) * transmissions[low] +
+                weight * transmissions[high])
+
+
+class ExposurePlanner(object):
+    """Exposure times giving target_counts per pixel through the sample,
+    with flux counts per second and pixel in the flat field.
+
+    The consecutive energies are grouped in runs as long as possible
+    sharing one exposure time, the longest needed in the run, as long as
+    no image is exposed more than tolerance (relative) over its needed
+    time; so the exposure time only changes a few times along a scan. The
+    exposure times are rounded up to multiples of step and clipped to
+    [min_exposure, max_exposure] (None is not clipped).
+    """
+
+    def __init__(self, spectrum, target_counts, flux, min_exposure=None,
+                 max_exposure=None, step=0.1, tolerance=0.2):
+        if target_counts <= 0 or flux <= 0:
+            raise ValueError("The target counts and the flux must be "
+                             "positive")
+        self.spectrum = spectrum
+        self.target_counts = target_counts
+        self.flux = flux
+        self.min_exposure = min_exposure
+        self.max_exposure = max_exposure
+        self.step = step
+        self.tolerance = tolerance
+
+    @classmethod
+    def from_dict(cls, config, spectrum):
+        """Create the planner of the spectrum from a dictionary like:
+        {'target_counts': 10000, 'flux': 20000, 'min_exposure': 0.5,
+         'max_exposure': 30, 'step': 0.1, 'tolerance': 0.2}
+        """
+        return cls(spectrum, **dict(config))
+
+    def _clip(self, exp_time):
+        if self.min_exposure is not None:
+            exp_time = max(exp_time, self.min_exposure)
+        if self.max_exposure is not None:
+            exp_time = min(exp_time, self.max_exposure)
+        return exp_time
+
+    def needed(self, energy):
+        """Exposure time (clipped) giving the target counts at energy."""
+        rate = self.flux * self.spectrum.transmission(energy)
+        return self._clip(self.target_counts / rate)
+
+    def _rounded(self, exp_time):
+        if not self.step:
+            return exp_time
+        # the small margin avoids rounding up exact multiples
+        steps = math.ceil(exp_time / self.step - 1e-9)
+        return self._clip(round(steps * self.step, 6))
+
+    def exposures(self, energies):
+        """List with the exposure times of the energies, in the order they
+        are collected."""
+        exp_times = []
+        run = []
+        low = high = None
+        for energy in energies:
+            needed = self.needed(energy)
+            if run:
+                low = min(low, needed)
+                high = max(high, needed)
+                if high <= low * (1 + self.tolerance):
+                    run.append(needed)
+                    continue
+                exp_times.extend([self._rounded(max(run))] * len(run))
+            run = [needed]
+            low = high = needed
+        exp_times.extend([self._rounded(max(run))] * len(run))
+        return exp_times
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+import csv
+from collections import OrderedDict
+
+from .costmodel import CostModel
+
+
+"""
+This module is used to share the flat field images between samples: the
+flat fields of an equivalent configuration (energy, zone plate, detector,
+flat field position and exposure) collected shortly before are reused
+instead of being collected again.
+
+"""
+
+
+class FlatFieldCache(object):
+    """Cache of the flat fields collected by a TXM script.
+
+    The flat fields are reused when an equivalent configuration (given by
+    the key) was collected less than window seconds before, in the
+    estimated time of the script (see costmodel). The mapping keeps, for
+    every sample and energy, the flat field files to be used by its
+    reconstruction.
+    """
+
+    def __init__(self, window=3600.0, cost_model=None):
+        if cost_model is None:
+            cost_model = CostModel()
+        self.window = window
+        self.cost_model = cost_model
+        self.reset()
+
+    def reset(self):
+        # key: (time, file names)
+        self._flat_fields = {}
+        # (sample number, energy): (file names, shared)
+        self.mapping = OrderedDict()
+        self.num_reused = 0
+
+    def add(self, key, time, sample, energy, file_names):
+        """Cache the flat fields of key, collected at time (s)."""
+        self._flat_fields[key] = (time, list(file_names))
+        self.mapping[(sample, energy)] = (list(file_names), False)
+
+    def reuse(self, key, time, sample, energy):
+        """Return True and map the flat fields if the ones of key can be
+        reused at time (s)."""
+        try:
+            collected, file_names = self._flat_fields[key]
+        except KeyError:
+            return False
+        if time - collected > self.window:
+            return False
+        self.mapping[(sample, energy)] = (file_names, True)
+        self.num_reused += len(file_names)
+        return True
+
+    def write(self, file_name, sample_names=None):
+        """Write the mapping as CSV: one row per sample, energy and flat
+        field file, telling if the file was collected for another sample.
+        The samples are written by their number, or by their name if the
+        sample_names are given."""
+        with open(file_name, 'w') as mapping_file:
+            writer = csv.writer(mapping_file, lineterminator='\n')
+            writer.writerow(['sample', 'energy', 'flat_field', 'shared'])
+            for (sample, energy), value in self.mapping.items():
+                file_names, shared = value
+                if sample_names is not None:
+                    sample = sample_names[sample]
+                for name in file_names:
+                    writer.writerow([sample, '%.2f' % energy, name,
+                                     int(shared)])
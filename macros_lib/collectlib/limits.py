@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+from .txmscript import AXES, AXIS_NUMBERS, LABELS, MOVETO, SAMPLE, SETEXP
+
+
+"""
+This module is used to check the TXM scripts before they are run: every
+position of every axis, and every exposure time, is checked against its
+limits in one vectorized pass over the recorded script, and all the
+violations are reported at once.
+
+"""
+
+# name of the exposure time limits
+EXPOSURE = 'exposure'
+LIMIT_NAMES = AXES + (EXPOSURE,)
+
+
+class Violation(object):
+    """Commands of a sample moving an axis (or setting the exposure time)
+    out of its limits."""
+
+    def __init__(self, sample, name, low, high, count, minimum, maximum,
+                 line):
+        self.sample = sample
+        self.name = name
+        self.low = low
+        self.high = high
+        self.count = count
+        self.minimum = minimum
+        self.maximum = maximum
+        # first line of the script out of the limits
+        self.line = line
+
+    def __str__(self):
+        if self.sample is None:
+            where = 'Script'
+        else:
+            where = 'Sample %s' % self.sample
+        if self.minimum == self.maximum:
+            values = '%.2f' % self.minimum
+        else:
+            values = '%.2f to %.2f' % (self.minimum, self.maximum)
+        low = '-inf' if self.low is None else self.low
+        high = 'inf' if self.high is None else self.high
+        return ('%s: %d %s values out of [%s, %s]: %s (first at line %d)'
+                % (where, self.count, self.name, low, high, values,
+                   self.line))
+
+
+class Limits(object):
+    """Limits of the axes (see txmscript.AXES) and of the exposure time.
+
+    limits is a dictionary name: (low, high); a None limit is not checked.
+    """
+
+    def __init__(self, limits=None):
+        self.limits = {}
+        for name, (low, high) in dict(limits or {}).items():
+            self.set(name, low, high)
+
+    @classmethod
+    def from_dict(cls, config):
+        """Create the limits from a dictionary like:
+        {'ZPz': [-11000, -9000], 'T': [-70, 70], 'exposure': [0.01, None]}
+        """
+        return cls(config)
+
+    def set(self, name, low=None, high=None):
+        if name not in LIMIT_NAMES:
+            raise ValueError("Unknown limit '%s'. Accepted limits are: %s"
+                             % (name, ', '.join(LIMIT_NAMES)))
+        self.limits[name] = (low, high)
+
+    def _bounds(self):
+        """Arrays with the low and high limits of every opcode."""
+        import numpy as np
+        lows = np.full(256, -np.inf)
+        highs = np.full(256, np.inf)
+        for name, (low, high) in self.limits.items():
+            if name == EXPOSURE:
+                opcode = SETEXP
+            else:
+                opcode = MOVETO + AXIS_NUMBERS[name]
+            if low is not None:
+                lows[opcode] = low
+            if high is not None:
+                highs[opcode] = high
+        return lows, highs
+
+    def check(self, script):
+        """Return the list of Violations of the TXMScript, per sample and
+        axis, in the order of the script."""
+        import numpy as np
+        opcodes = np.frombuffer(script.opcodes, dtype=np.uint8)
+        operands = np.frombuffer(script.operands, dtype=np.float64)
+        lows, highs = self._bounds()
+        # the labels and collect commands have no limits
+        wrong = ((operands < lows[opcodes]) | (operands > highs[opcodes]))
+        if not wrong.any():
+            return []
+
+        is_sample = opcodes == SAMPLE
+        sample_names = [script.strings[int(index)]
+                        for index in operands[is_sample]]
+        samples = np.cumsum(is_sample) - 1
+        # the labels are not written in the script
+        lines = np.cumsum(~np.isin(opcodes, LABELS))
+
+        violations = []
+        indexes = np.flatnonzero(wrong)
+        keys = samples[indexes].astype(np.int64) * 256 + opcodes[indexes]
+        for key in np.unique(keys):
+            selected = indexes[keys == key]
+            sample, opcode = divmod(int(key), 256)
+            if opcode == SETEXP:
+                name = EXPOSURE
+            else:
+                name = AXES[opcode - MOVETO]
+            low, high = self.limits[name]
+            values = operands[selected]
+            violations.append(Violation(
+                sample_names[sample] if sample >= 0 else None, name, low,
+                high, len(selected), float(values.min()),
+                float(values.max()), int(lines[selected[0]])))
+        violations.sort(key=lambda violation: violation.line)
+        return violations
+
+
+def report(violations):
+    if not violations:
+        return 'All the positions are within the limits'
+    lines = ['%d limit violations:' % sum(violation.count
+                                          for violation in violations)]
+    lines.extend(str(violation) for violation in violations)
+    return '\n'.join(lines)
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+from .calibration import FocusCalibration
+from .costmodel import CostModel, format_duration
+from .datavolume import Detector
+from .energyapproach import EnergyApproach
+from .flatfields import FlatFieldCache
+from .limits import Limits, report as report_limits
+from .manifest import manifest_name
+from .naming import report as report_collisions
+from .resume import list_collected
+from .scheduler import SampleDelay
+from .thetascan import ThetaScan, UNIDIRECTIONAL
+
+
+"""
+This module is used as a base of the BL09 macros creating TXM scripts: it
+reads their configuration from the Sardana environment, verifies the
+scripts and outputs their estimations. Sardana is only imported when the
+environment is read, so the module is imported without it.
+
+"""
+
+
+class TXMMacroBase(object):
+    """Helpers of the macros creating TXM scripts, mixed with the Sardana
+    Macro class. txm_obj is the library object creating the script (see
+    txmcommands.GenericTXMcommands), and script the script it recorded,
+    which is shared by the checks, the estimations and the files written.
+    """
+
+    # position of the name in the samples
+    SAMPLE_NAME = 0
+
+    def _get_env(self, name, default=None):
+        """Return the environment variable name, or default if it is not
+        defined."""
+        from sardana.macroserver.msexception import UnknownEnv
+        try:
+            return self.getEnv(name)
+        except UnknownEnv:
+            return default
+
+    def _get_limits(self):
+        config = self._get_env("TXM_limits")
+        if config is None:
+            limits = Limits()
+        else:
+            limits = Limits.from_dict(config)
+        # zone plate limits of the previous versions
+        if 'ZPz' not in limits.limits:
+            limits.set('ZPz', self._get_env("ZP_Z_limit_neg"),
+                       self._get_env("ZP_Z_limit_pos"))
+        return limits
+
+    def _verify_limits(self, txm_obj, script):
+        violations = txm_obj.check_limits(self._get_limits(), script=script)
+        if violations:
+            raise ValueError(report_limits(violations))
+
+    def _verify_file_names(self, txm_obj, script):
+        collisions = txm_obj.check_file_names(script=script)
+        if collisions:
+            raise ValueError("%s\nUse the 'adaptive' or 'indexed' naming "
+                             "to keep all the images"
+                             % report_collisions(collisions))
+
+    def _get_detector(self):
+        config = self._get_env("TXM_detector")
+        if config is None:
+            return Detector()
+        return Detector.from_dict(config)
+
+    def _output_data_volume(self, txm_obj, cost_model, script):
+        volume = txm_obj.estimate_data_volume(self._get_detector(),
+                                              cost_model, script=script)
+        self.output(volume.report())
+        # free space (bytes) and bandwidth (bytes/s) of the disk
+        budget = dict(self._get_env("TXM_data_budget", {}))
+        for warning in volume.warnings(budget.get('free_space'),
+                                       budget.get('bandwidth')):
+            self.warning(warning)
+
+    def _write_manifest(self, txm_obj, file_name, script, binary=False):
+        # the CSV manifest is written with the script (see generate)
+        names = [manifest_name(file_name)]
+        if binary:
+            names.append(manifest_name(file_name, '.npy'))
+            txm_obj.write_manifest(names[-1], script=script)
+        for name in names:
+            self.output('Manifest written to %s' % name)
+
+    def _get_calibration(self):
+        config = self._get_env("TXM_focus_calibration")
+        if config is None:
+            return None
+        # CSV file name, or dictionary of the calibration table
+        if hasattr(config, 'keys'):
+            return FocusCalibration.from_dict(config)
+        return FocusCalibration.from_file(config)
+
+    def _get_cost_model(self):
+        config = self._get_env("TXM_cost_model")
+        if config is None:
+            return CostModel()
+        return CostModel.from_dict(config)
+
+    def _get_energy_approach(self):
+        config = self._get_env("TXM_energy_approach")
+        if config is None:
+            return None
+        return EnergyApproach.from_dict(config)
+
+    def _get_theta_scan(self, mode):
+        return ThetaScan.from_dict(self._get_env("TXM_theta_approach", {}),
+                                   mode)
+
+    def _output_theta_scans(self, txm_obj, cost_model):
+        estimates = txm_obj.estimate_theta_scans(cost_model)
+        for mode, mode_estimate in estimates.items():
+            duration = format_duration(mode_estimate.total)
+            self.output("Theta scan '%s': %s" % (mode, duration))
+        mode = txm_obj.theta_scan.mode
+        if mode != UNIDIRECTIONAL:
+            saved = (estimates[UNIDIRECTIONAL].total -
+                     estimates[mode].total)
+            self.output('Rotation time saved: %s' % format_duration(saved))
+
+    def _get_sample_delay(self):
+        config = self._get_env("TXM_sample_delay")
+        if config is None:
+            return None
+        return SampleDelay.from_dict(config)
+
+    def _output_schedule(self, txm_obj, cost_model):
+        saved = txm_obj.schedule_samples(cost_model)
+        names = [str(sample[self.SAMPLE_NAME]) for sample in txm_obj.samples]
+        self.output('Sample order: %s' % ', '.join(names))
+        self.output('Time saved by the schedule: %s'
+                    % format_duration(saved))
+
+    def _get_ff_cache(self, ff_window, cost_model):
+        if ff_window <= 0:
+            return None
+        return FlatFieldCache(ff_window, cost_model)
+
+    def _output_ff_cache(self, txm_obj, file_name, dry_run):
+        ff_cache = txm_obj.ff_cache
+        self.output('%d flat field images reused' % ff_cache.num_reused)
+        if not dry_run:
+            mapping_name = '%s_ff.csv' % os.path.splitext(file_name)[0]
+            names = [sample[self.SAMPLE_NAME] for sample in txm_obj.samples]
+            ff_cache.write(mapping_name, names)
+            self.output('Flat field mapping written to %s' % mapping_name)
+
+    def _get_collected(self, resume_dir):
+        if not resume_dir:
+            return None
+        collected = list_collected(resume_dir)
+        self.output('Resuming: %d images already collected in %s'
+                    % (len(collected), resume_dir))
+        return collected
+
+    def _output_chunks(self, txm_obj, num_chunks, cost_model, script):
+        for chunk_name, chunk_estimate in txm_obj.generate_chunks(
+                num_chunks, cost_model, script=script):
+            duration = format_duration(chunk_estimate.total)
+            self.output('%s: %s' % (chunk_name, duration))
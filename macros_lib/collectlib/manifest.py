@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import os
+
+from .simulator import simulate
+
+
+"""
+This module is used to write the manifest of a TXM script: a table with
+one row per collect, with the file name, the sample, the exact motor
+positions and exposure time (the file names only have rounded values),
+the repetition, the flat field flag and the sequence index of the image.
+It is written as CSV, or as a NumPy .npy structured array which is loaded
+in one read with numpy.load.
+
+"""
+
+# motor positions and exposure time, as in the plans (see planner)
+POSITION_FIELDS = ('energy', 'theta', 'zp', 'detz', 'x', 'y', 'z',
+                   'exptime')
+MANIFEST_FIELDS = (('index', 'file_name', 'sample') + POSITION_FIELDS +
+                   ('repetition', 'flatfield'))
+
+
+def manifest_name(file_name, extension='.csv'):
+    """Name of the manifest of the script file_name."""
+    return '%s_manifest%s' % (os.path.splitext(file_name)[0], extension)
+
+
+def build_manifest(script):
+    """Return the manifest of a recorded TXMScript, as a NumPy structured
+    array with the MANIFEST_FIELDS."""
+    import numpy as np
+    simulation = simulate(script)
+    plan = simulation.plan
+    sample_names = [str(name) for name in simulation.sample_names]
+    file_names = simulation.file_names
+    name_size = max([len(name) for name in file_names] + [1])
+    sample_size = max([len(name) for name in sample_names] + [1])
+    dtype = ([('index', 'i8'), ('file_name', 'U%d' % name_size),
+              ('sample', 'U%d' % sample_size)] +
+             [(field, 'f8') for field in POSITION_FIELDS] +
+             [('repetition', 'i4'), ('flatfield', '?')])
+    rows = np.zeros(len(plan), dtype=dtype)
+    rows['index'] = plan['index']
+    rows['file_name'] = file_names
+    rows['sample'] = sample_names
+    for field in POSITION_FIELDS + ('repetition', 'flatfield'):
+        rows[field] = plan[field]
+    return rows
+
+
+def write_manifest(file_name, rows):
+    """Write the manifest rows as CSV, or as .npy if the file name ends
+    with .npy. The CSV positions keep all their digits."""
+    if file_name.endswith('.npy'):
+        import numpy as np
+        np.save(file_name, rows)
+        return
+    with open(file_name, 'w') as manifest_file:
+        writer = csv.writer(manifest_file, lineterminator='\n')
+        writer.writerow(MANIFEST_FIELDS)
+        for row in rows.tolist():
+            index, file_name, sample = row[:3]
+            positions = row[3:-2]
+            repetition, flatfield = row[-2:]
+            writer.writerow([index, file_name, sample] +
+                            [repr(position) for position in positions] +
+                            [repetition, int(flatfield)])
+
+
+def read_manifest(file_name):
+    """Load a manifest written by write_manifest as a structured array."""
+    import numpy as np
+    if file_name.endswith('.npy'):
+        return np.load(file_name)
+    return np.genfromtxt(file_name, delimiter=',', names=True, dtype=None,
+                         encoding='utf-8')
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+import os
+from collections import OrderedDict
+
+from .txmscript import COLLECT, SAMPLE, is_label
+
+
+"""
+This module is used to name the images of the TXM scripts, and to check
+that no image is overwritten: the file names carry the rounded energy,
+angle and zone plate positions, so close positions (e.g. zone plate steps
+below the precision of the names) give the same file name, and
+XMController overwrites the first image.
+
+The collisions are found in one pass over the recorded script, indexing
+the file names by their hash. The naming schemes (see FileNaming) avoid
+them.
+
+"""
+
+# Historical names: the positions with the precision of every library.
+FIXED = 'fixed'
+# Positions with as many decimals as they need (at least the ones of the
+# historical names), up to FileNaming.max_precision.
+ADAPTIVE = 'adaptive'
+# Historical names followed by the sequence number of the image in the
+# script, which is unique.
+INDEXED = 'indexed'
+MODES = (FIXED, ADAPTIVE, INDEXED)
+
+
+class FileNaming(object):
+    """Naming scheme of the images (see MODES)."""
+
+    def __init__(self, mode=FIXED, max_precision=6, index_digits=6):
+        if mode not in MODES:
+            raise ValueError("Unknown naming scheme '%s'. Accepted schemes "
+                             "are: %s" % (mode, ', '.join(MODES)))
+        self.mode = mode
+        self.max_precision = max_precision
+        self.index_digits = index_digits
+
+    def number(self, value, precision, width=0):
+        """Text of a position in the file names, with the precision (and
+        the minimum width) of the historical names."""
+        if self.mode != ADAPTIVE:
+            return '%*.*f' % (width, precision, value)
+        text = '%.*f' % (max(precision, self.max_precision), value)
+        integer, decimals = text.split('.')
+        decimals = decimals.rstrip('0').ljust(precision, '0')
+        if decimals:
+            text = '%s.%s' % (integer, decimals)
+        else:
+            text = integer
+        return '%*s' % (width, text)
+
+    def image_name(self, file_name, index):
+        """File name of the image number index of the script."""
+        if self.mode != INDEXED:
+            return file_name
+        root, extension = os.path.splitext(file_name)
+        return '%s_%0*d%s' % (root, self.index_digits, index, extension)
+
+
+class Collision(object):
+    """File name collected more than once in a script."""
+
+    def __init__(self, file_name, lines, samples):
+        self.file_name = file_name
+        # lines of the script collecting it, and their samples
+        self.lines = lines
+        self.samples = samples
+
+    @property
+    def count(self):
+        return len(self.lines)
+
+    def add(self, line, sample):
+        self.lines.append(line)
+        self.samples.append(sample)
+
+    def __str__(self):
+        lines = ', '.join('%d' % line for line in self.lines[:5])
+        if self.count > 5:
+            lines += ', ...'
+        samples = [str(sample) for sample in OrderedDict.fromkeys(
+            self.samples) if sample is not None]
+        text = '%s: collected %d times (lines %s)' % (self.file_name,
+                                                      self.count, lines)
+        if samples:
+            text += ' by sample %s' % ', '.join(samples)
+        return text
+
+
+def find_collisions(script):
+    """Return the list of Collisions of the TXMScript, in the order of
+    the script."""
+    # the file names are stored once in the string table of the script,
+    # so their index identifies them
+    first = {}
+    collisions = OrderedDict()
+    strings = script.strings
+    sample = None
+    line = 0
+    for opcode, operand in zip(script.opcodes, script.operands):
+        if opcode == SAMPLE:
+            sample = strings[int(operand)]
+            continue
+        if is_label(opcode):
+            # the labels are not written in the script
+            continue
+        line += 1
+        if opcode != COLLECT:
+            continue
+        index = int(operand)
+        if index not in first:
+            first[index] = (line, sample)
+            continue
+        if index not in collisions:
+            first_line, first_sample = first[index]
+            collisions[index] = Collision(strings[index], [first_line],
+                                          [first_sample])
+        collisions[index].add(line, sample)
+    return list(collisions.values())
+
+
+def report(collisions):
+    if not collisions:
+        return 'All the file names are unique'
+    lines = ['%d file names collected more than once (the images would be '
+             'overwritten):' % len(collisions)]
+    lines.extend(str(collision) for collision in collisions)
+    return '\n'.join(lines)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+import math
+
+
+"""
+This module is used to plan the acquisitions of the TXM scripts. The
+positions are computed in closed form in pure Python (with the same values
+as NumPy), as the scripts are generated from them without NumPy. A plan is
+a NumPy structured array with one row per collected image (see
+PLAN_DTYPE), built from the recorded script (see simulator); NumPy is only
+imported when a plan is built.
+
+"""
+
+# One row per collected image:
+# - sample: index of the sample in the samples list.
+# - region: number of the angular or energy region (starting at 1), 0 for
+#   the flat field images.
+# - energy, theta, zp, detz, x, y, z: motor positions (NaN if the motor is
+#   never moved by the script).
+# - exptime: exposure time (s).
+# - repetition: number of the repetition, or of the flat field image,
+#   starting at 0.
+# - flatfield: True for the flat field images.
+# - index: sequence index of the image in the plan.
+# (the dtype is given as a list of fields, not to import NumPy)
+PLAN_DTYPE = [
+    ('sample', 'i4'),
+    ('region', 'i4'),
+    ('energy', 'f8'),
+    ('theta', 'f8'),
+    ('zp', 'f8'),
+    ('detz', 'f8'),
+    ('x', 'f8'),
+    ('y', 'f8'),
+    ('z', 'f8'),
+    ('exptime', 'f8'),
+    ('repetition', 'i4'),
+    ('flatfield', '?'),
+    ('index', 'i8'),
+]
+
+
+def arange(start, end, step):
+    """Positions from start (included) to end (excluded) every step, as
+    numpy.arange."""
+    start = float(start)
+    size = max(int(math.ceil((end - start) / float(step))), 0)
+    if size < 2:
+        return [start] * size
+    # NumPy fills the positions from the first two ones
+    second = start + step
+    delta = second - start
+    return [start, second] + [start + index * delta
+                              for index in range(2, size)]
+
+
+def linspace(start, end, num):
+    """num positions evenly spaced from start to end (both included), as
+    numpy.linspace."""
+    start = float(start)
+    end = float(end)
+    num = int(num)
+    if num < 2:
+        return [start] * num
+    div = num - 1
+    delta = end - start
+    step = delta / div
+    if step == 0:
+        positions = [index / float(div) * delta + start
+                     for index in range(num)]
+    else:
+        positions = [index * step + start for index in range(num)]
+    positions[-1] = end
+    return positions
+
+
+def angular_positions(start, end, step):
+    """Theta positions from start to end (both included) every step."""
+    if start == end:
+        return [float(start)]
+    return arange(start, end, step) + [float(end)]
+
+
+def zone_plate_positions(central, step, num_zps):
+    """num_zps zone plate positions centered on central, every step."""
+    if step == 0:
+        return [float(central)]
+    half_width = step * (num_zps - 1) / 2.0
+    return linspace(central - half_width, central + half_width, num_zps)
+
+
+def linear_focus(energies, first_energy, last_energy, start, end):
+    """Linear interpolation of a focus position (ZP or detector) between
+    its start position at first_energy and its end position at last_energy.
+    """
+    slope = (end - start) / float(last_energy - first_energy)
+    return [start + (float(energy) - first_energy) * slope
+            for energy in energies]
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+from .energyapproach import EnergyApproach
+from .sharding import TXMState
+from .thetascan import ThetaScan, HOME
+from .txmscript import TXMScript, LABEL_NAMES, format_command
+
+
+"""
+This module is used to resume an aborted data collection: the images which
+were already collected are removed from the TXM script, keeping only the
+moves needed to reach the missing ones.
+
+"""
+
+
+def list_collected(directory, extension='.xrm'):
+    """Set of the image file names found in directory."""
+    return set(name for name in os.listdir(directory)
+               if name.endswith(extension))
+
+
+class Resume(object):
+    """Filter of TXM scripts, dropping the collects of the files already
+    collected.
+
+    The moves of the script only update the target state; before every
+    collect kept, the commands bringing the TXM from its actual state to
+    the target state are written: the energy is moved with the energy
+    approach, and theta is approached as the start of a sweep of
+    theta_scan (see thetascan.ThetaScan, with the home angle theta_home)
+    where the resumed script starts, or would reach the angle from the
+    other side than the script (e.g. where a sweep changes direction).
+    The waits of the energy and theta approaches of the script are not
+    kept. The other waits (e.g. between samples, see scheduler.SampleDelay)
+    are written before the moves to the next image collected; if several
+    of them are between two images collected, only the last one is kept.
+    The scripts can be filtered in consecutive chunks.
+    """
+
+    def __init__(self, collected, energy_approach=None, theta_scan=None,
+                 theta_home=HOME):
+        if energy_approach is None:
+            energy_approach = EnergyApproach()
+        if theta_scan is None:
+            theta_scan = ThetaScan()
+        self.collected = set(collected)
+        self.energy_approach = energy_approach
+        self.theta_scan = theta_scan
+        self.theta_home = theta_home
+        self.actual = TXMState()
+        self.target = TXMState()
+        self.num_skipped = 0
+        # wait to be written before the next image collected, and last
+        # command of the script filtered
+        self._wait = None
+        self._previous = None
+
+    def _changed(self, name, axis, actual, target):
+        if target is None:
+            return False
+        if actual is None:
+            return True
+        return (format_command(name, axis, actual) !=
+                format_command(name, axis, target))
+
+    def _emit(self, script, name, axis, value):
+        script.extend([(name, axis, value)])
+        self.actual.add(name, axis, value)
+
+    def _reach(self, script):
+        actual = self.actual
+        target = self.target
+        if self._changed('setbinning', None, actual.binning, target.binning):
+            self._emit(script, 'setbinning', None, target.binning)
+        positions = actual.positions
+        target_positions = target.positions
+        energy = target_positions.get('energy')
+        if self._changed('moveto', 'energy', positions.get('energy'),
+                         energy):
+            for position, wait_time in self.energy_approach.approach(
+                    positions.get('energy'), energy):
+                self._emit(script, 'moveto', 'energy', position)
+                if wait_time:
+                    self._emit(script, 'wait', None, wait_time)
+            positions['energy'] = energy
+        for axis in ('X', 'Y', 'Z', 'ZPz', 'detz'):
+            position = target_positions.get(axis)
+            if self._changed('moveto', axis, positions.get(axis), position):
+                self._emit(script, 'moveto', axis, position)
+        self._reach_theta(script)
+        if self._changed('setexp', None, actual.exp_time, target.exp_time):
+            self._emit(script, 'setexp', None, target.exp_time)
+
+    def _reach_theta(self, script):
+        theta = self.target.positions.get('T')
+        if theta is None:
+            return
+        current = self.actual.positions.get('T')
+        # side from which the script reached theta, and from which the
+        # resumed script would reach it
+        direction = self.target.theta_direction
+        if current is None:
+            side = None
+        elif self._changed('moveto', 'T', current, theta):
+            side = 1 if theta > current else -1
+        else:
+            side = self.actual.theta_direction
+        if current is None or (direction is not None and side != direction):
+            for position, wait_time in self.theta_scan.approach(
+                    current, theta, direction or 1, self.theta_home):
+                self._emit(script, 'moveto', 'T', position)
+                if wait_time:
+                    self._emit(script, 'wait', None, wait_time)
+        elif not self._changed('moveto', 'T', current, theta):
+            return
+        self._emit(script, 'moveto', 'T', theta)
+
+    def filter(self, script):
+        """Return a new TXMScript with the missing acquisitions of
+        script."""
+        result = TXMScript()
+        for name, axis, value in script:
+            if name in LABEL_NAMES:
+                result.extend([(name, axis, value)])
+                continue
+            if name == 'collect':
+                if value in self.collected:
+                    self.num_skipped += 1
+                else:
+                    if self._wait is not None:
+                        self._emit(result, 'wait', None, self._wait)
+                        self._wait = None
+                    self._reach(result)
+                    result.extend([(name, axis, value)])
+            elif name == 'wait':
+                # the approach waits follow the moves of the approaches
+                if self._previous not in (('moveto', 'energy'),
+                                          ('moveto', 'T')):
+                    self._wait = value
+            else:
+                self.target.add(name, axis, value)
+            self._previous = (name, axis)
+        return result
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+import math
+
+from .planner import angular_positions, linspace
+
+
+"""
+This module is used to choose the theta positions of the angular regions
+of the tomographies. Besides the equally spaced positions, the regions
+can be sampled with a given number of images:
+
+- 'golden': golden angle positions, collected in interleaved passes which
+  cover the whole region (each pass can be reconstructed on its own, so a
+  usable tomography is available after the first one).
+- 'slope': equal-slope positions, equally spaced in tan(theta) (up to 45
+  degrees) and in cot(theta) (above), as used by the pseudo-polar
+  reconstructions.
+- 'sparse': dose-weighted positions, equally spaced in sin(theta): the
+  density of images follows cos(theta), so fewer images are collected at
+  the high angles, where the beam crosses more sample and gives more
+  dose.
+
+The positions are computed in pure Python (see planner), and rounded to
+the 0.01 degree of the moveto commands of the scripts.
+
+"""
+
+EQUAL = 'equal'
+GOLDEN = 'golden'
+EQUAL_SLOPE = 'slope'
+SPARSE = 'sparse'
+SCHEMES = (EQUAL, GOLDEN, EQUAL_SLOPE, SPARSE)
+
+# interleaved passes of the golden angle sampling
+GOLDEN_PASSES = 4
+# fraction of the region between consecutive golden angle positions
+GOLDEN_FRACTION = (math.sqrt(5) - 1) / 2
+# decimals of the theta positions
+PRECISION = 2
+
+
+def golden_positions(start, end, num_images, num_passes=GOLDEN_PASSES):
+    """num_images golden angle positions from start towards end, in
+    num_passes passes, every pass swept from start to end."""
+    span = end - start
+    fractions = [(index * GOLDEN_FRACTION) % 1.0
+                 for index in range(num_images)]
+    pass_size = int(math.ceil(num_images / float(num_passes)))
+    positions = []
+    for first in range(0, num_images, pass_size):
+        positions.extend(round(start + span * fraction, PRECISION)
+                         for fraction in sorted(
+                             fractions[first:first + pass_size]))
+    return positions
+
+
+def _slope(theta):
+    """Slope coordinate of theta (degrees): tan(theta) up to 45 degrees,
+    and 2 - cot(theta) above, with the sign of theta."""
+    angle = abs(math.radians(theta))
+    if angle <= math.pi / 4:
+        slope = math.tan(angle)
+    else:
+        slope = 2 - 1 / math.tan(angle)
+    return math.copysign(slope, theta)
+
+
+def _slope_angle(slope):
+    """Inverse of _slope."""
+    if abs(slope) <= 1:
+        angle = math.atan(abs(slope))
+    else:
+        angle = math.pi / 2 - math.atan(2 - abs(slope))
+    return math.copysign(math.degrees(angle), slope)
+
+
+def equal_slope_positions(start, end, num_images):
+    """num_images positions from start to end, equally spaced in slope."""
+    return [round(_slope_angle(slope), PRECISION)
+            for slope in linspace(_slope(start), _slope(end), num_images)]
+
+
+def sparse_positions(start, end, num_images):
+    """num_images positions from start to end, equally spaced in
+    sin(theta)."""
+    sines = linspace(math.sin(math.radians(start)),
+                     math.sin(math.radians(end)), num_images)
+    return [round(math.degrees(math.asin(max(-1.0, min(1.0, sine)))),
+                  PRECISION)
+            for sine in sines]
+
+
+def region_positions(scheme, start, end, step, num_images=0):
+    """Theta positions of an angular region from start to end, in the
+    order they are collected. The equal scheme has a position every step;
+    the other ones have num_images positions (if 0, as many as the equal
+    scheme).
+    """
+    if scheme not in SCHEMES:
+        raise ValueError("Unknown angular sampling '%s'. Accepted samplings "
+                         "are: %s" % (scheme, ', '.join(SCHEMES)))
+    if scheme == EQUAL:
+        return angular_positions(start, end, step)
+    if not num_images:
+        num_images = len(angular_positions(start, end, step))
+    if num_images < 1:
+        raise ValueError("The number of images of an angular region must "
+                         "be positive")
+    if scheme == GOLDEN:
+        return golden_positions(start, end, num_images)
+    if abs(start) > 90 or abs(end) > 90:
+        raise ValueError("The '%s' angular sampling needs angles between "
+                         "-90 and 90" % scheme)
+    if scheme == EQUAL_SLOPE:
+        return equal_slope_positions(start, end, num_images)
+    return sparse_positions(start, end, num_images)
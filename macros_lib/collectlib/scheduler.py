@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+import math
+
+from .costmodel import CostModel
+
+
+"""
+This module is used to schedule the samples of the TXM scripts: the samples
+are ordered to minimize the stage travel and the monochromator changes
+between them, and the delay between samples is only done when the
+conditions given need it.
+
+"""
+
+# axes of the sample stage
+STAGE_AXES = ('X', 'Y', 'Z')
+
+
+def transition_time(start, end, cost_model=None):
+    """Time (s) moving the axes from the start positions to the end
+    positions (dictionaries axis: position). The axes are moved one after
+    the other, as done by XMController."""
+    if cost_model is None:
+        cost_model = CostModel()
+    seconds = 0.0
+    for axis, position in end.items():
+        if axis in start:
+            seconds += (abs(position - start[axis]) /
+                        cost_model.axes[axis].speed)
+    return seconds
+
+
+def stage_travel(start, end):
+    """Distance (um) travelled by the sample stage."""
+    return math.sqrt(sum((end[axis] - start[axis]) ** 2
+                         for axis in STAGE_AXES
+                         if axis in start and axis in end))
+
+
+def path_cost(order, costs):
+    return sum(costs[start][end] for start, end in zip(order[:-1], order[1:]))
+
+
+def nearest_neighbour(costs, first, last=None):
+    """Path starting at first, always going to the cheapest node not
+    visited yet, and ending at last if given."""
+    left = set(range(len(costs)))
+    left.discard(first)
+    left.discard(last)
+    order = [first]
+    while left:
+        current = order[-1]
+        node = min(left, key=lambda node: (costs[current][node], node))
+        order.append(node)
+        left.remove(node)
+    if last is not None and last != first:
+        order.append(last)
+    return order
+
+
+def two_opt(order, costs, fixed_first=False, fixed_last=False):
+    """Improve the path reversing segments, while the cost decreases. The
+    costs can be asymmetric."""
+    order = list(order)
+    size = len(order)
+    first = 1 if fixed_first else 0
+    last = size - 2 if fixed_last else size - 1
+    improved = True
+    while improved:
+        improved = False
+        # cumulative cost of the path edges, forwards and backwards
+        forward = [0.0]
+        backward = [0.0]
+        for start, end in zip(order[:-1], order[1:]):
+            forward.append(forward[-1] + costs[start][end])
+            backward.append(backward[-1] + costs[end][start])
+        for i in range(first, last):
+            for j in range(i + 1, last + 1):
+                delta = (backward[j] - backward[i]) - (forward[j] -
+                                                       forward[i])
+                if i > 0:
+                    delta += (costs[order[i - 1]][order[j]] -
+                              costs[order[i - 1]][order[i]])
+                if j < size - 1:
+                    delta += (costs[order[i]][order[j + 1]] -
+                              costs[order[j]][order[j + 1]])
+                if delta < -1e-9:
+                    order[i:j + 1] = order[i:j + 1][::-1]
+                    improved = True
+                    break
+            if improved:
+                break
+    return order
+
+
+def order_path(costs, fixed_first=False, fixed_last=False):
+    """Order of the nodes minimizing the cost of the path through all of
+    them: nearest neighbour (from every possible first node) improved by
+    2-opt. costs[i][j] is the cost of going from node i to node j. If
+    fixed_first (fixed_last), the first (last) node stays in its place.
+    """
+    size = len(costs)
+    if size < 2:
+        return list(range(size))
+    last = size - 1 if fixed_last else None
+    firsts = [0] if fixed_first else [node for node in range(size)
+                                      if node != last]
+    order = min((nearest_neighbour(costs, first, last) for first in firsts),
+                key=lambda order: path_cost(order, costs))
+    return two_opt(order, costs, fixed_first, fixed_last)
+
+
+class SampleDelay(object):
+    """Delay between samples.
+
+    wait seconds are waited after every sample. If min_travel (um) or
+    min_energy_change (eV) are given, the wait is only done when the stage
+    travels at least min_travel, or the energy changes at least
+    min_energy_change, to the next sample (and not after the last one).
+    """
+
+    def __init__(self, wait=300, min_travel=None, min_energy_change=None):
+        self.wait = wait
+        self.min_travel = min_travel
+        self.min_energy_change = min_energy_change
+
+    @classmethod
+    def from_dict(cls, config):
+        """Create a sample delay from a dictionary like:
+        {'wait': 300, 'min_travel': 500.0, 'min_energy_change': 10.0}
+        """
+        return cls(**dict(config))
+
+    def is_conditional(self):
+        return not (self.min_travel is None and
+                    self.min_energy_change is None)
+
+    def delay(self, start=None, end=None):
+        """Wait (s) going from the start positions (last positions of a
+        sample) to the end positions (first positions of the next sample,
+        None after the last sample)."""
+        if not self.is_conditional():
+            return self.wait
+        if start is None or end is None:
+            return 0
+        if (self.min_travel is not None and
+                stage_travel(start, end) >= self.min_travel):
+            return self.wait
+        if (self.min_energy_change is not None and
+                'energy' in start and 'energy' in end and
+                abs(end['energy'] - start['energy']) >=
+                self.min_energy_change):
+            return self.wait
+        return 0
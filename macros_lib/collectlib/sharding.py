@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+from bisect import bisect_left
+from collections import OrderedDict
+
+from .costmodel import DurationEstimator
+from .energyapproach import EnergyApproach
+from .thetascan import ThetaScan, HOME
+from .txmscript import TXMScript, COLLECT, LABEL_NAMES, is_label
+
+
+"""
+This module is used to split a TXM script into chunks of balanced durations,
+which can be run independently: every chunk starts restoring the state of
+the TXM at the point where it begins.
+
+"""
+
+
+def _cumulative_times(script, cost_model):
+    """Time (s) at which every command of the script starts."""
+    estimator = DurationEstimator(cost_model)
+    estimate = estimator.estimate
+    times = []
+    for command in script:
+        times.append(estimate.total)
+        estimator.add(*command)
+    return times, estimate.total
+
+
+def split_points(script, num_chunks, cost_model=None):
+    """Indexes of the commands starting the chunks (but the first one).
+
+    The script is only split between acquisitions: after a collect whose
+    next command (not counting the labels) is not a collect, so the energy
+    backlash correction and the repetitions are never split.
+    """
+    times, total = _cumulative_times(script, cost_model)
+    opcodes = script.opcodes
+    candidates = []
+    after_collect = None
+    for index, opcode in enumerate(opcodes):
+        if opcode == COLLECT:
+            after_collect = index + 1
+        elif is_label(opcode):
+            continue
+        elif after_collect is not None:
+            candidates.append(after_collect)
+            after_collect = None
+    candidate_times = [times[index] for index in candidates]
+    points = []
+    for chunk in range(1, num_chunks):
+        target = total * chunk / float(num_chunks)
+        position = bisect_left(candidate_times, target)
+        # closest candidate to the target, after the previous point
+        if position > 0 and (position == len(candidates) or
+                             target - candidate_times[position - 1] <
+                             candidate_times[position] - target):
+            position -= 1
+        if position >= len(candidates):
+            break
+        point = candidates[position]
+        if points and point <= points[-1]:
+            continue
+        points.append(point)
+    return points
+
+
+class TXMState(object):
+    """State of the TXM after replaying commands. theta_direction is the
+    direction of the last theta move (1 upwards, -1 downwards), which
+    tells the side from which theta reached its position. labels has
+    the last value of every label (see txmscript.LABELS)."""
+
+    def __init__(self):
+        self.positions = {}
+        self.theta_direction = None
+        self.exp_time = None
+        self.binning = None
+        self.labels = OrderedDict((name, None) for name in LABEL_NAMES)
+
+    def add(self, name, axis, value):
+        if name == 'moveto':
+            if axis == 'T':
+                theta = self.positions.get('T')
+                if theta is not None and value != theta:
+                    self.theta_direction = 1 if value > theta else -1
+            self.positions[axis] = value
+        elif name == 'setexp':
+            self.exp_time = value
+        elif name == 'setbinning':
+            self.binning = value
+        elif name in self.labels:
+            self.labels[name] = value
+
+    def restore(self, energy_approach=None, theta_scan=None,
+                theta_home=HOME):
+        """Commands bringing the TXM to this state, from any state. Theta
+        is approached as the start of a sweep of theta_scan (see
+        thetascan.ThetaScan) in the direction of its last move, so it
+        reaches its position from the same side."""
+        if energy_approach is None:
+            energy_approach = EnergyApproach()
+        if theta_scan is None:
+            theta_scan = ThetaScan()
+        positions = self.positions
+        commands = [(name, None, value)
+                    for name, value in self.labels.items()
+                    if value is not None]
+        if self.binning is not None:
+            commands.append(('setbinning', None, self.binning))
+        if self.exp_time is not None:
+            commands.append(('setexp', None, self.exp_time))
+        if 'energy' in positions:
+            # the previous energy is unknown: full backlash correction
+            for position, wait_time in energy_approach.approach(
+                    None, positions['energy']):
+                commands.append(('moveto', 'energy', position))
+                if wait_time:
+                    commands.append(('wait', None, wait_time))
+        for axis in ('X', 'Y', 'Z', 'ZPz', 'detz'):
+            if axis in positions:
+                commands.append(('moveto', axis, positions[axis]))
+        if 'T' in positions:
+            # the previous angle is unknown
+            for position, wait_time in theta_scan.approach(
+                    None, positions['T'], self.theta_direction or 1,
+                    theta_home):
+                commands.append(('moveto', 'T', position))
+                if wait_time:
+                    commands.append(('wait', None, wait_time))
+            commands.append(('moveto', 'T', positions['T']))
+        return commands
+
+
+def split_script(script, num_chunks, cost_model=None, energy_approach=None,
+                 theta_scan=None, theta_home=HOME):
+    """Split the script into at most num_chunks TXMScripts of balanced
+    durations. Every chunk but the first starts restoring the state of the
+    TXM (binning, exposure time, energy, sample position, zone plate,
+    detector and theta) at the point where it begins, with the energy
+    approach and the theta scan strategy (and home angle) of the script.
+    """
+    points = split_points(script, num_chunks, cost_model)
+    bounds = [0] + points + [len(script)]
+    state = TXMState()
+    chunks = []
+    commands = iter(script)
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        chunk = TXMScript()
+        if start > 0:
+            chunk.extend(state.restore(energy_approach, theta_scan,
+                                       theta_home))
+        for _ in range(end - start):
+            command = next(commands)
+            state.add(*command)
+            chunk.extend([command])
+        chunks.append(chunk)
+    return chunks
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import argparse
+import csv
+import sys
+from collections import OrderedDict
+
+from .costmodel import DurationEstimator, format_duration
+from .planner import PLAN_DTYPE
+from .txmscript import (AXES, COLLECT, FLATFIELD, LABELS, REGION,
+                        REPETITION, SAMPLE, SAMPLE_NUMBER, SETEXP, WAIT,
+                        load_script, moveto_opcode)
+
+
+"""
+This module is used to simulate TXM scripts offline, like the .txt scripts
+received or edited by hand (see txmscript.load_script):
+
+    python -m collectlib.simulator script.txt [--collects collects.csv]
+
+The simulation counts the moves and the distance travelled by every axis,
+the total wait and exposure times and the images, and gives the motor
+state at every collect as a plan (see planner.PLAN_DTYPE), which can be
+compared with the plan of the library which generated the script. The
+script is simulated in a few vectorized passes, without a Python loop
+over its commands.
+
+"""
+
+# plan field of every axis
+PLAN_FIELDS = {
+    'X': 'x',
+    'Y': 'y',
+    'Z': 'z',
+    'T': 'theta',
+    'ZPz': 'zp',
+    'detz': 'detz',
+    'energy': 'energy',
+}
+
+
+class Simulation(object):
+    """Result of the simulation of a TXM script.
+
+    moves and travel are OrderedDicts with the number of moveto commands
+    and the distance travelled (from its first position) by every axis.
+    plan has the motor state and exposure time at every collect (NaN if
+    not set yet), and file_names the images collected.
+
+    The sample, region, repetition and flat field flag of the images are
+    the ones of the labels of the recorded scripts (see txmscript.LABELS),
+    and sample_names has the sample name of every image. The .txt scripts
+    have no labels: their images are all of sample 0 (with no name) and
+    region 0, their repetitions count the images collected one after the
+    other without any other command, and their flat fields are the images
+    with _FF_ in their file names.
+    """
+
+    def __init__(self, moves, travel, wait, exposure, plan, file_names,
+                 sample_names=None):
+        self.moves = moves
+        self.travel = travel
+        self.wait = wait
+        self.exposure = exposure
+        self.plan = plan
+        self.file_names = file_names
+        if sample_names is None:
+            sample_names = []
+        self.sample_names = sample_names
+
+    @property
+    def num_images(self):
+        return len(self.file_names)
+
+    def report(self):
+        lines = ['%d images, %s exposure, %s wait'
+                 % (self.num_images, format_duration(self.exposure),
+                    format_duration(self.wait))]
+        for axis in AXES:
+            if self.moves[axis]:
+                lines.append('%s: %d moves, %.2f travelled'
+                             % (axis, self.moves[axis], self.travel[axis]))
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return self.report()
+
+    def write_collects(self, file_name):
+        """Write the motor state at every collect as CSV."""
+        fields = ['energy', 'theta', 'zp', 'detz', 'x', 'y', 'z', 'exptime']
+        with open(file_name, 'w') as collects_file:
+            writer = csv.writer(collects_file, lineterminator='\n')
+            writer.writerow(['index', 'file_name'] + fields)
+            for row, name in zip(self.plan, self.file_names):
+                writer.writerow([int(row['index']), name] +
+                                ['%.2f' % row[field] for field in fields])
+
+
+def _last_index(mask):
+    """Index of the last True of mask up to every position, or -1."""
+    import numpy as np
+    indexes = np.where(mask, np.arange(len(mask)), -1)
+    return np.maximum.accumulate(indexes)
+
+
+def _state_at(mask, operands, positions):
+    """Operand of the last command of mask before every position (NaN if
+    there is none)."""
+    import numpy as np
+    last = _last_index(mask)[positions]
+    return np.where(last >= 0, operands[last], np.nan)
+
+
+def simulate(script):
+    """Simulate a TXMScript, returning its Simulation."""
+    import numpy as np
+    opcodes = np.frombuffer(script.opcodes, dtype=np.uint8)
+    operands = np.frombuffer(script.operands, dtype=np.float64)
+    collects = np.flatnonzero(opcodes == COLLECT)
+
+    plan = np.zeros(len(collects), dtype=PLAN_DTYPE)
+    moves = OrderedDict()
+    travel = OrderedDict()
+    for axis in AXES:
+        is_move = opcodes == moveto_opcode(axis)
+        positions = operands[is_move]
+        moves[axis] = len(positions)
+        travel[axis] = float(np.abs(np.diff(positions)).sum())
+        plan[PLAN_FIELDS[axis]] = _state_at(is_move, operands, collects)
+    plan['exptime'] = _state_at(opcodes == SETEXP, operands, collects)
+
+    strings = script.strings
+    file_names = [strings[int(index)] for index in operands[collects]]
+    repetitions = _labels_at(REPETITION, opcodes, operands, collects)
+    if repetitions is None:
+        # images collected since the last command which is not a collect
+        is_collect = opcodes == COLLECT
+        num_collects = np.cumsum(is_collect)
+        last_command = _last_index(
+            ~(is_collect | np.isin(opcodes, LABELS)))[collects]
+        repetitions = (num_collects[collects] - 1 -
+                       np.where(last_command >= 0,
+                                num_collects[last_command], 0))
+    plan['repetition'] = repetitions
+    flat_fields = _labels_at(FLATFIELD, opcodes, operands, collects)
+    if flat_fields is None:
+        flat_fields = ['_FF_' in name for name in file_names]
+    plan['flatfield'] = flat_fields
+    sample_numbers = _labels_at(SAMPLE_NUMBER, opcodes, operands, collects)
+    if sample_numbers is not None:
+        plan['sample'] = sample_numbers
+    samples = _state_at(opcodes == SAMPLE, operands, collects)
+    sample_names = [strings[int(index)] if index == index else ''
+                    for index in samples]
+    regions = _state_at(opcodes == REGION, operands, collects)
+    plan['region'] = [_region_number(strings[int(index)])
+                      if index == index else 0 for index in regions]
+    plan['index'] = np.arange(len(collects))
+
+    wait = float(operands[opcodes == WAIT].sum())
+    exposure = float(np.nansum(plan['exptime']))
+    return Simulation(moves, travel, wait, exposure, plan, file_names,
+                      sample_names)
+
+
+def _labels_at(opcode, opcodes, operands, positions):
+    """Value of the opcode label before every position (0 if there is
+    none), or None if the script has no such labels."""
+    import numpy as np
+    is_label = opcodes == opcode
+    if not is_label.any():
+        return None
+    return np.nan_to_num(_state_at(is_label, operands, positions))
+
+
+def _region_number(label):
+    """Number of a region label (0 for the flat fields)."""
+    try:
+        return int(label)
+    except (TypeError, ValueError):
+        return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Simulate a TXM script (.txt, .json or .bin).')
+    parser.add_argument('script', help='script file')
+    parser.add_argument('--collects', default=None,
+                        help='CSV file where the motor state at every '
+                        'collect is written')
+    args = parser.parse_args(argv)
+
+    try:
+        script = load_script(args.script)
+    except (IOError, OSError, ValueError) as error:
+        print('%s: %s' % (args.script, error), file=sys.stderr)
+        return 1
+    simulation = simulate(script)
+    print(simulation.report())
+    estimator = DurationEstimator()
+    estimator.replay(script)
+    print(estimator.estimate.report())
+    if args.collects is not None:
+        simulation.write_collects(args.collects)
+        print('Motor state at every collect written to %s' % args.collects)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
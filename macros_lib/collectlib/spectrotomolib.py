@@ -1,6 +1,8 @@
-import numpy as np
+from collections import OrderedDict
 
-from txmcommands import GenericTXMcommands
+from .txmcommands import GenericTXMcommands
+from .planner import zone_plate_positions
+from .sampling import EQUAL, region_positions
 
 NAME = 0
 POS_X = 1
@@ -16,6 +18,9 @@ THETA_START = 0
 THETA_END = 1
 THETA_STEP = 2
 EXPTIME = 3
+# optional: angular sampling (see sampling.SCHEMES) and number of images
+SAMPLING = 4
+NUM_ANGLES = 5
 
 ENERGY = 0
 DET_Z = 1
@@ -23,6 +28,15 @@ ZP_Z = 2
 ZP_STEP = 3
 EXPTIME_FF = 4
 
+# acquisition orders
+ANGLE_OUTER = 'angle'
+ENERGY_OUTER = 'energy'
+SERPENTINE = 'serpentine'
+ORDERS = (ANGLE_OUTER, ENERGY_OUTER, SERPENTINE)
+
+# flat field images per energy
+NUM_FF_IMAGES = 10
+
 FILE_NAME = 'spectrotomo.txt'
 
 samples = [
@@ -59,9 +73,31 @@ samples = [
 
 class SpectroTomo(GenericTXMcommands):
 
-    def __init__(self, samples=None, file_name=None):
-        GenericTXMcommands.__init__(self, file_name=file_name)
+    """Spectral tomography: images at every energy at each angle.
+
+    The acquisition order can be:
+    - 'angle': theta outermost, all the energies at every angle.
+    - 'energy': energy outermost, a full tilt series at every energy.
+    - 'serpentine': theta outermost, energies swept alternately upwards
+      and downwards, so consecutive angles share the current energy.
+    """
+
+    def __init__(self, samples=None, file_name=None, skip_redundant=False,
+                 energy_approach=None, order=ANGLE_OUTER, theta_scan=None,
+                 sample_delay=None, ff_cache=None, naming=None,
+                 calibration=None):
+        GenericTXMcommands.__init__(self, file_name=file_name,
+                                    skip_redundant=skip_redundant,
+                                    energy_approach=energy_approach,
+                                    theta_scan=theta_scan,
+                                    sample_delay=sample_delay,
+                                    ff_cache=ff_cache, naming=naming,
+                                    calibration=calibration)
+        if order not in ORDERS:
+            raise ValueError("Unknown acquisition order '%s'. Accepted "
+                             "orders are: %s" % (order, ', '.join(ORDERS)))
         self.samples = samples
+        self.order = order
 
     def collect(self, sample_name=None, zone_plate=None,
                 theta=None, energy=None):
@@ -73,97 +109,204 @@ class SpectroTomo(GenericTXMcommands):
             theta = self.current_theta
         if energy is None:
             energy = self.current_energy
-        base_name = ('%s_%.1f_%.1f_%.1f' % (sample_name, energy,
-                                            theta, zone_plate))
+        number = self.naming.number
+        base_name = '%s_%s_%s_%s' % (sample_name, number(energy, 1),
+                                     number(theta, 1), number(zone_plate, 1))
         extension = 'xrm'
         if (self._repetitions == 0 or self._repetitions == 1 or
                     self._repetitions is None):
             file_name = '%s.%s' % (base_name, extension)
-            self.destination.write('collect %s\n' % file_name)
+            self.collectImage(file_name)
         else:
             for repetition in range(1, self._repetitions+1):
                 file_name = '%s_%d.%s' % (base_name, repetition, extension)
-                self.destination.write('collect %s\n' % file_name)
+                self.collectImage(file_name, repetition - 1)
+
+    def _tilt_positions(self, tilt_region):
+        tilt_start = tilt_region[THETA_START]
+        tilt_end = tilt_region[THETA_END]
+        tilt_step = tilt_region[THETA_STEP]
+        msg = "Region start must be different than end"
+        assert tilt_start != tilt_end, msg
+        tilt_step = abs(tilt_step)
+        if tilt_end - tilt_start < 1:
+            tilt_step *= -1
+        sampling = EQUAL
+        num_angles = 0
+        if len(tilt_region) > SAMPLING:
+            sampling = tilt_region[SAMPLING]
+        if len(tilt_region) > NUM_ANGLES:
+            num_angles = tilt_region[NUM_ANGLES]
+        return region_positions(sampling, tilt_start, tilt_end, tilt_step,
+                                num_angles)
+
+    def _tilt_regions(self, sample):
+        """List of (region number, tilt region, theta positions)."""
+        return [(region_num + 1, tilt_region,
+                 self._tilt_positions(tilt_region))
+                for region_num, tilt_region in enumerate(
+                    sample[THETA_REGIONS])]
+
+    def _energy_regions(self, sample):
+        """Energy regions of the sample, with the zone plate and detector
+        positions of the focus calibration where they are not given."""
+        e_zp_zones = []
+        for e_zp_zone in sample[ENERGY_REGIONS]:
+            if e_zp_zone[ZP_Z] is None or e_zp_zone[DET_Z] is None:
+                energy = e_zp_zone[ENERGY]
+                e_zp_zone = list(e_zp_zone)
+                e_zp_zone[ZP_Z] = self.zone_plate_at(energy, e_zp_zone[ZP_Z])
+                e_zp_zone[DET_Z] = self.detector_at(energy, e_zp_zone[DET_Z])
+            e_zp_zones.append(e_zp_zone)
+        return e_zp_zones
+
+    def _zone_plates(self, e_zp_zone):
+        # Multi-focus: Three ZP positions used.
+        return zone_plate_positions(e_zp_zone[ZP_Z], e_zp_zone[ZP_STEP], 3)
+
+    def _go_to_e_zp_zone(self, e_zp_zone):
+        energy = e_zp_zone[ENERGY]
+        # the angle outer order always repeats the energy approach
+        if self.order == ANGLE_OUTER or energy != self.current_energy:
+            self.go_to_energy(energy)
+        self.moveZonePlateZ(e_zp_zone[ZP_Z])
+        self.moveDetector(e_zp_zone[DET_Z])
+
+    def _collect_zone_plates(self, e_zp_zone):
+        # Single-focus
+        if e_zp_zone[ZP_STEP] == 0:
+            self.collect()
+        # Multi-focus: Three ZP positions used.
+        else:
+            for zone_plate in self._zone_plates(e_zp_zone):
+                self.moveZonePlateZ(zone_plate)
+                self.collect()
+
+    def _iter_angle_outer(self, sample):
+        e_zp_zones = self._energy_regions(sample)
+        if self.order == SERPENTINE:
+            e_zp_zones = sorted(e_zp_zones, key=lambda zone: zone[ENERGY])
+
+        # approach the first angle, in order to avoid backlash
+        regions = self.theta_sweep(self._tilt_regions(sample))
+
+        num_angle = 0
+        for region_num, tilt_region, positions in regions:
+            self.current_region = region_num
+            self.setExpTime(tilt_region[EXPTIME])
+
+            # Acquisition of an image for each ZP, at each angle,
+            # at each Energy.
+            for theta in self.iter_thetas(positions):
+                # serpentine: the energies are swept upwards and downwards
+                # alternately, so consecutive angles share the energy
+                if self.order == SERPENTINE and num_angle % 2:
+                    zones = reversed(e_zp_zones)
+                else:
+                    zones = e_zp_zones
+                for e_zp_zone in zones:
+                    self._go_to_e_zp_zone(e_zp_zone)
+                    self._collect_zone_plates(e_zp_zone)
+                num_angle += 1
+                yield
+
+    def _iter_energy_outer(self, sample):
+        for e_zp_zone in self._energy_regions(sample):
+            self._go_to_e_zp_zone(e_zp_zone)
+
+            # approach the first angle, in order to avoid backlash
+            regions = self.theta_sweep(self._tilt_regions(sample))
+
+            for region_num, tilt_region, positions in regions:
+                self.current_region = region_num
+                self.setExpTime(tilt_region[EXPTIME])
+                for theta in self.iter_thetas(positions):
+                    self._collect_zone_plates(e_zp_zone)
+                yield
 
     def collect_sample(self, sample):
+        for _ in self.iter_sample(sample):
+            pass
+
+    def iter_sample(self, sample):
 
         self.current_sample_name = sample[NAME]
         self.go_to_sample_xyz_pos(sample[POS_X],
                                   sample[POS_Y],
                                   sample[POS_Z])
 
-        tilt_regions = sample[THETA_REGIONS]
         self._repetitions = sample[N_IMAGES]
 
-        # move theta to the min angle, in order to avoid backlash
-        self.moveTheta(-71.0)
-        self.wait(10)
-
-        for tilt_region in tilt_regions:
-            tilt_start = tilt_region[THETA_START]
-            tilt_end = tilt_region[THETA_END]
-            tilt_step = tilt_region[THETA_STEP]
-            exp_time = tilt_region[EXPTIME]
-            msg = "Region start must be different than end"
-            assert tilt_start != tilt_end, msg
-            tilt_step = abs(tilt_step)
-            if tilt_end - tilt_start < 1:
-                tilt_step *= -1
-            positions = np.arange(tilt_start, tilt_end, tilt_step)
-            positions = np.append(positions, tilt_end)
-            self.setExpTime(exp_time)
-
-            # Acquisition of an image for each ZP, at each angle,
-            # at each Energy.
-            for theta in positions:
-                self.moveTheta(theta)
-
-                for e_zp_zone in sample[ENERGY_REGIONS]:
-
-                    energy = e_zp_zone[ENERGY]
-                    zp_central_pos = e_zp_zone[ZP_Z]
-                    zp_step = e_zp_zone[ZP_STEP]
-                    det_z = e_zp_zone[DET_Z]
-                    self.go_to_energy_zp_det(energy, zp_central_pos, det_z)
-
-                    # Single-focus
-                    if zp_step == 0:
-                        self.collect()
-                    # Multi-focus: Three ZP positions used.
-                    else:
-                        zp_pos1 = zp_central_pos - zp_step
-                        zp_pos2 = zp_central_pos
-                        zp_pos3 = zp_central_pos + zp_step
-                        zone_plates = [zp_pos1, zp_pos2, zp_pos3]
-                        for zone_plate in zone_plates:
-                            self.moveZonePlateZ(zone_plate)
-                            self.collect()
+        if self.order == ENERGY_OUTER:
+            blocks = self._iter_energy_outer(sample)
+        else:
+            blocks = self._iter_angle_outer(sample)
+        for _ in blocks:
+            yield
 
         # Execute flat field acquisitions
-        # move theta to 0 degrees - necessary for flat field measurement
-        self.moveTheta(0)
-        self.go_to_sample_xy_pos(sample[FF_POS_X],
-                                 sample[FF_POS_Y])
-
-        for e_zp_zone in sample[ENERGY_REGIONS]:
+        self.current_region = 'FF'
+        e_zp_zones = self._energy_regions(sample)
+        if (self.order != ANGLE_OUTER and
+                e_zp_zones[-1][ENERGY] == self.current_energy):
+            # start the flat fields at the current energy
+            e_zp_zones = e_zp_zones[::-1]
+        at_ff_position = False
+        for e_zp_zone in e_zp_zones:
             energy = e_zp_zone[ENERGY]
-            zp_central_pos = e_zp_zone[ZP_Z]
-            det_z = e_zp_zone[DET_Z]
+            sample_name = '%s_%s' % (sample[NAME],
+                                     self.naming.number(energy, 1))
+            file_names = ['%s_FF_%d.xrm' % (sample_name, i)
+                          for i in range(1, NUM_FF_IMAGES + 1)]
+            ff_key = (energy, e_zp_zone[DET_Z], e_zp_zone[ZP_Z],
+                      sample[FF_POS_X], sample[FF_POS_Y],
+                      e_zp_zone[EXPTIME_FF], NUM_FF_IMAGES)
+            if self.reuse_flat_fields(ff_key, energy):
+                continue
+            if not at_ff_position:
+                # move theta to 0 degrees - necessary for flat field
+                # measurement
+                self.moveTheta(0)
+                self.go_to_sample_xy_pos(sample[FF_POS_X],
+                                         sample[FF_POS_Y])
+                at_ff_position = True
             self.setExpTime(e_zp_zone[EXPTIME_FF])
-            self.go_to_energy_zp_det(energy, zp_central_pos, det_z)
-            sample_name = '%s_%.1f' % (sample[NAME], energy)
-            for i in range(1,11):
-                self.destination.write('collect %s_FF_%d.xrm\n' %
-                                       (sample_name, i))
+            self._go_to_e_zp_zone(e_zp_zone)
+            file_names = [self.collectImage(file_name, number, True)
+                          for number, file_name in enumerate(file_names)]
+            self.cache_flat_fields(ff_key, energy, file_names)
+        self.current_region = None
+        yield
+
+    def estimate_orders(self, cost_model=None):
+        """Estimate the duration of the script for every acquisition order.
+
+        Return an OrderedDict with the DurationEstimate of every order.
+        """
+        current_order = self.order
+        estimates = OrderedDict()
+        try:
+            for order in ORDERS:
+                self.order = order
+                estimates[order] = self.generate(dry_run=True,
+                                                 cost_model=cost_model)
+        finally:
+            self.order = current_order
+        return estimates
 
-    def collect_data(self):
+    def iter_collect(self):
         self.setBinning()
-        for sample in self.samples:
-            self.collect_sample(sample)
-            # wait 5 minutes between samples
-            self.wait(300)
+        next_samples = self.samples[1:] + [None]
+        for sample, next_sample in zip(self.samples, next_samples):
+            for _ in self.iter_sample(sample):
+                yield
+            self._num_samples += 1
+            # wait between samples (5 minutes by default)
+            self.wait_between_samples(sample, next_sample)
 
 
+# example script, run from the macros_lib directory with:
+#     python -m collectlib.spectrotomolib
 if __name__ == '__main__':
     spectrotomo_obj = SpectroTomo(samples, FILE_NAME)
     spectrotomo_obj.generate()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+This module is used to choose the direction of the theta sweeps in the TXM
+scripts, and how their first angle is approached in order to correct the
+backlash of the rotation stage.
+
+"""
+
+# Historical sweeps of the BL09 macros: every sweep goes in the direction
+# given by the angular regions, after moving theta to the min angle.
+UNIDIRECTIONAL = 'unidirectional'
+# Serpentine sweeps: the direction is reversed at every sweep (a sweep is
+# done for every energy in ManyTomos and in the SpectroTomo 'energy'
+# order, and for every sample in the other SpectroTomo orders).
+PER_ENERGY = 'energy'
+# Serpentine sweeps: the direction is reversed at every sample.
+PER_SAMPLE = 'sample'
+MODES = (UNIDIRECTIONAL, PER_ENERGY, PER_SAMPLE)
+
+# theta angle from which the unidirectional sweeps are approached, unless
+# the library has its own (see GenericTXMcommands.THETA_HOME)
+HOME = -71.0
+
+
+def sweep_direction(positions):
+    """1 if the positions increase, -1 if they decrease."""
+    if len(positions) > 1 and positions[-1] < positions[0]:
+        return -1
+    return 1
+
+
+def reverse_sweep(regions):
+    """Reverse a sweep given as a list of tuples whose last item is the
+    array of theta positions of the region."""
+    return [region[:-1] + (region[-1][::-1],)
+            for region in reversed(regions)]
+
+
+class ThetaScan(object):
+    """Theta scan strategy.
+
+    In the unidirectional mode, theta is moved to the home angle, given by
+    the macro, and waits home_wait seconds before every sweep.
+    In the serpentine modes, the sweeps are reversed alternately, and the
+    first angle of a sweep is only approached when theta would reach it
+    moving against the sweep direction (or from an unknown position): it
+    is first moved overshoot degrees before it, waiting wait seconds.
+    """
+
+    def __init__(self, mode=UNIDIRECTIONAL, overshoot=1.0, wait=0,
+                 home_wait=10):
+        if mode not in MODES:
+            raise ValueError("Unknown theta scan mode '%s'. Accepted modes "
+                             "are: %s" % (mode, ', '.join(MODES)))
+        self.mode = mode
+        self.overshoot = overshoot
+        self.wait = wait
+        self.home_wait = home_wait
+
+    @classmethod
+    def from_dict(cls, config, mode=UNIDIRECTIONAL):
+        """Create a theta scan from a dictionary like:
+        {'overshoot': 1.0, 'wait': 0, 'home_wait': 10}
+        """
+        return cls(mode, **dict(config))
+
+    def is_reversed(self, sample_number, sweep_number):
+        if self.mode == PER_ENERGY:
+            return sweep_number % 2 == 1
+        if self.mode == PER_SAMPLE:
+            return sample_number % 2 == 1
+        return False
+
+    def sweep(self, regions, sample_number, sweep_number):
+        """Return the regions (see reverse_sweep) in the order of the
+        sweep."""
+        if self.is_reversed(sample_number, sweep_number):
+            return reverse_sweep(regions)
+        return regions
+
+    def approach(self, current, theta, direction, home):
+        """Return the list of (position, wait) moves done before a sweep
+        starting at theta in direction. A wait of 0 means no wait after
+        the move.
+        """
+        if self.mode == UNIDIRECTIONAL:
+            return [(home, self.home_wait)]
+        if current is not None and (theta - current) * direction > 0:
+            return []
+        return [(theta - direction * self.overshoot, self.wait)]
@@ -1,6 +1,6 @@
-import numpy as np
-
-from txmcommands import GenericTXMcommands
+from .txmcommands import GenericTXMcommands
+from .planner import zone_plate_positions
+from .sampling import EQUAL, region_positions
 
 DATE = 0
 NAME = 1
@@ -22,6 +22,9 @@ REGION_EXPTIME = 3
 ZP_Z = 4
 ZP_STEP = 5
 NUM_ZPS = 6
+# optional: angular sampling (see sampling.SCHEMES) and number of images
+SAMPLING = 7
+NUM_ANGLES = 8
 
 ENERGY = 0
 DET_Z = 1
@@ -31,7 +34,7 @@ FILE_NAME = 'manytomos.txt'
 
 samples = [
     [
-        '20171124'  # date
+        '20171124',  # date
         'sample1',  # name
         0,  # pos x
         0,  # pos y
@@ -56,16 +59,46 @@ samples = [
         2,  # flat field position x
         2,  # flat field position y
         1,  # flat field exposure time
+        10,  # num flat field images
         4,  # num images
     ],
 
 ]
 
 
+def check_date_name(sample):
+    """Return the list of errors of the date and the name of the sample,
+    which are separated by underscores in the file names."""
+    errors = []
+    if "_" in sample[DATE]:
+        msg = ("Date must be given in YYYYMMDD format. "
+               "It cannot contain underscore characters ('_'). "
+               "Please modify date '{0}' by a suitably formatted "
+               "date without underscores")
+        errors.append(msg.format(sample[DATE]))
+    if "_" in sample[NAME]:
+        msg = ("Sample name must not contain underscore "
+               "characters ('_'). Please, modify sample name '{0}' "
+               "by suitably formatted name without underscores.")
+        errors.append(msg.format(sample[NAME]))
+    return errors
+
+
 class ManyTomos(GenericTXMcommands):
 
-    def __init__(self, samples=None, file_name=None):
-        GenericTXMcommands.__init__(self, file_name=file_name)
+    THETA_HOME = -70.1
+
+    def __init__(self, samples=None, file_name=None, skip_redundant=False,
+                 energy_approach=None, theta_scan=None,
+                 sample_delay=None, ff_cache=None, naming=None,
+                 calibration=None):
+        GenericTXMcommands.__init__(self, file_name=file_name,
+                                    skip_redundant=skip_redundant,
+                                    energy_approach=energy_approach,
+                                    theta_scan=theta_scan,
+                                    sample_delay=sample_delay,
+                                    ff_cache=ff_cache, naming=naming,
+                                    calibration=calibration)
         self.samples = samples
 
     def collect(self, sample_date="20171124"):
@@ -74,18 +107,46 @@ class ManyTomos(GenericTXMcommands):
         zone_plate = self.current_zone_plate
         theta = self.current_theta
         energy = self.current_energy
-        base_name = ('%s_%s_%.1f_%.1f_%.1f' % (sample_date, sample_name,
-                                               energy, theta, zone_plate))
+        number = self.naming.number
+        base_name = '%s_%s_%s_%s_%s' % (sample_date, sample_name,
+                                        number(energy, 1), number(theta, 1),
+                                        number(zone_plate, 1))
         extension = 'xrm'
         if self._repetitions == 1 or self._repetitions is None:
             file_name = '%s.%s' % (base_name, extension)
-            self.destination.write('collect %s\n' % file_name)
+            self.collectImage(file_name)
         else:
             for repetition in range(self._repetitions):
                 file_name = '%s_%d.%s' % (base_name, repetition, extension)
-                self.destination.write('collect %s\n' % file_name)
+                self.collectImage(file_name, repetition)
+
+    def _angular_positions(self, angular_region):
+        start = angular_region[REGION_START]
+        end = angular_region[REGION_END]
+        angle_step = angular_region[REGION_STEP]
+        if end - start < 1:
+            angle_step *= -1
+        sampling = EQUAL
+        num_angles = 0
+        if len(angular_region) > SAMPLING:
+            sampling = angular_region[SAMPLING]
+        if len(angular_region) > NUM_ANGLES:
+            num_angles = angular_region[NUM_ANGLES]
+        return region_positions(sampling, start, end, angle_step,
+                                num_angles)
+
+    def _angular_regions(self, sample):
+        """List of (region number, angular region, theta positions)."""
+        return [(region_num + 1, angular_region,
+                 self._angular_positions(angular_region))
+                for region_num, angular_region in enumerate(
+                    sample[ANGULAR_REGIONS])]
 
     def collect_sample(self, sample):
+        for _ in self.iter_sample(sample):
+            pass
+
+    def iter_sample(self, sample):
         for e_zp_zone in sample[ENERGIES_ZP]:
             current_date = sample[DATE]
             self.current_sample_name = sample[NAME]
@@ -93,81 +154,83 @@ class ManyTomos(GenericTXMcommands):
             energy = e_zp_zone[ENERGY]
             self.go_to_energy(energy)
 
-            det_z = e_zp_zone[DET_Z]
+            det_z = self.detector_at(energy, e_zp_zone[DET_Z])
             self.moveDetector(det_z)
 
             self.go_to_sample_xyz_pos(sample[POS_X],
                                       sample[POS_Y],
                                       sample[POS_Z])
 
-            # move theta to the min angle, in order to avoid backlash
-            self.moveTheta(-70.1)
-            self.wait(10)
+            # approach the first angle, in order to avoid backlash
+            regions = self.theta_sweep(self._angular_regions(sample))
 
-            angular_regions = sample[ANGULAR_REGIONS]
             self._repetitions = sample[N_IMAGES]
 
-            for angular_region in angular_regions:
-                start = angular_region[REGION_START]
-                end = angular_region[REGION_END]
-                angle_step = angular_region[REGION_STEP]
+            for region_num, angular_region, positions in regions:
+                self.current_region = region_num
                 exp_time = angular_region[REGION_EXPTIME]
-                if end - start < 1:
-                    angle_step *= -1
-                if start == end:
-                    positions = np.array([start])
-                else:
-                    positions = np.arange(start, end, angle_step)
-                    positions = np.append(positions, end)
 
                 self.setExpTime(exp_time)
 
-                zp_central_pos = angular_region[ZP_Z]
+                zp_central_pos = self.zone_plate_at(energy,
+                                                    angular_region[ZP_Z])
                 zp_step = angular_region[ZP_STEP]
 
                 # Acquisition of an image for each ZP, at each angle,
                 # at each Energy.
                 if zp_step == 0:
                     self.moveZonePlateZ(zp_central_pos)
-                    num_zps = 1
                 else:
-                    num_zps = angular_region[NUM_ZPS]
+                    zone_plates = zone_plate_positions(
+                        zp_central_pos, zp_step, angular_region[NUM_ZPS])
 
-                for theta in positions:
-                    self.moveTheta(theta)
+                for theta in self.iter_thetas(positions):
                     # Single-focus
                     if zp_step == 0:
                         self.collect(sample_date=current_date)
                     # Multi-focus: Three ZP positions used.
                     else:
-                        start = zp_central_pos - zp_step*(num_zps - 1)/2.0
-                        stop = zp_central_pos + zp_step*(num_zps - 1)/2.0
-                        zone_plates = np.linspace(start, stop, num_zps)
                         for zone_plate in zone_plates:
                             self.moveZonePlateZ(zone_plate)
                             self.collect(sample_date=current_date)
+                yield
 
             # Execute flat field acquisitions #
-            # move theta to 0 degrees - necessary for flat field measurement
-            self.moveTheta(0)
-            self.go_to_sample_xy_pos(sample[FF_POS_X],
-                                     sample[FF_POS_Y])
-            self.setExpTime(sample[EXP_TIME_FF])
-            sample_name = '%s_%s_%.1f' % (current_date,
-                                          self.current_sample_name,
-                                          energy)
-            for i in range(sample[N_FF_IMAGES]):
-                self.destination.write('collect %s_FF_%d.xrm\n' %
-                                       (sample_name, i))
-
-    def collect_data(self):
+            self.current_region = 'FF'
+            sample_name = '%s_%s_%s' % (current_date,
+                                        self.current_sample_name,
+                                        self.naming.number(energy, 1))
+            file_names = ['%s_FF_%d.xrm' % (sample_name, i)
+                          for i in range(sample[N_FF_IMAGES])]
+            ff_key = (energy, det_z, self.current_zone_plate,
+                      sample[FF_POS_X], sample[FF_POS_Y],
+                      sample[EXP_TIME_FF], sample[N_FF_IMAGES])
+            if not self.reuse_flat_fields(ff_key, energy):
+                # move theta to 0 degrees - necessary for flat field
+                # measurement
+                self.moveTheta(0)
+                self.go_to_sample_xy_pos(sample[FF_POS_X],
+                                         sample[FF_POS_Y])
+                self.setExpTime(sample[EXP_TIME_FF])
+                file_names = [self.collectImage(file_name, number, True)
+                              for number, file_name in enumerate(file_names)]
+                self.cache_flat_fields(ff_key, energy, file_names)
+            self.current_region = None
+            yield
+
+    def iter_collect(self):
         self.setBinning()
-        for sample in self.samples:
-            self.collect_sample(sample)
-            # wait 5 minutes between samples
-            self.wait(300)
+        next_samples = self.samples[1:] + [None]
+        for sample, next_sample in zip(self.samples, next_samples):
+            for _ in self.iter_sample(sample):
+                yield
+            self._num_samples += 1
+            # wait between samples (5 minutes by default)
+            self.wait_between_samples(sample, next_sample)
 
 
+# example script, run from the macros_lib directory with:
+#     python -m collectlib.tomoslib
 if __name__ == '__main__':
     tomos_obj = ManyTomos(samples, FILE_NAME)
     tomos_obj.generate()
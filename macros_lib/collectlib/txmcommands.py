@@ -1,13 +1,62 @@
 # -*- coding: utf-8 -*-
 
+import copy
+import os
 import sys
+from collections import OrderedDict
 
+from .costmodel import CostModel, DurationEstimator, format_duration
+from .datavolume import DataVolumeEstimator
+from .manifest import build_manifest, manifest_name, write_manifest
+from .naming import FileNaming, INDEXED, find_collisions
+from .energyapproach import EnergyApproach
+from .resume import Resume
+from .scheduler import SampleDelay, order_path, transition_time
+from .sharding import TXMState, split_script
+from .simulator import simulate
+from .thetascan import (ThetaScan, HOME, MODES as THETA_SCAN_MODES,
+                        sweep_direction)
+from .txmscript import (TXMScript, BufferedWriter, OPCODES, SAMPLE, REGION,
+                        SAMPLE_NUMBER, REPETITION, FLATFIELD, SERIALIZERS,
+                        moveto_opcode, format_command, iter_lines)
 
 """
 This module is used as a library for BL09 macros used for creating TXM scripts.
 
 """
 
+# number of commands recorded before the script is written (.txt scripts)
+BATCH_SIZE = 10000
+
+
+class RedundancySummary(object):
+    """Commands dropped by the redundant-command elimination."""
+
+    def __init__(self):
+        self.num_commands = 0
+        self.moves = {}
+        self.wait = 0.0
+
+    def add(self, name, axis, value):
+        self.num_commands += 1
+        if name == 'moveto':
+            self.moves[axis] = self.moves.get(axis, 0) + 1
+        elif name == 'wait':
+            self.wait += value
+
+    def seconds(self, cost_model=None):
+        if cost_model is None:
+            cost_model = CostModel()
+        seconds = self.num_commands * cost_model.overhead + self.wait
+        for axis, num_moves in self.moves.items():
+            seconds += num_moves * cost_model.move_time(axis, 0, 0)
+        return seconds
+
+    def report(self, cost_model=None):
+        return ('Redundant commands removed: %d (%s saved)'
+                % (self.num_commands,
+                   format_duration(self.seconds(cost_model))))
+
 
 class GenericTXMcommands(object):
     """Generic TXM commands.
@@ -16,35 +65,151 @@ class GenericTXMcommands(object):
     which will be included in the scripts generated by the macros using this
     library. The macros using this library creates scripts in .txt format,
     which are entered in TXM-XMController software in order to perform the
-    data collection of ALBA BL09 TXM microscope.
+    data collection of ALBA BL09 TXM microscope. The commands are recorded
+    in a TXMScript (see txmscript), which is written at the end.
 
     Coordinate system of the TXM (transmission X-ray Microscope) is:
     - Z in the direction of the beam
     - Y in the vertical direction
     - X perpendicular to Y and Z.
+
+    The energy moves done by go_to_energy follow the energy_approach
+    strategy (see energyapproach.EnergyApproach), and the theta sweeps
+    started by theta_sweep follow the theta_scan strategy (see
+    thetascan.ThetaScan). The wait between samples is given by sample_delay
+    (see scheduler.SampleDelay). If ff_cache is given, the equivalent flat
+    fields collected shortly before are reused (see
+    flatfields.FlatFieldCache). The images are named following the naming
+    scheme (see naming.FileNaming). The zone plate and detector positions
+    not given in the samples are taken from the focus calibration (see
+    calibration.FocusCalibration).
+
+    If skip_redundant is True, the moveto, setexp and setbinning commands
+    which would not change the state of the TXM are not written. The
+    repeated energy moves done to correct the backlash are always kept,
+    unless the energy is not changed at all, and so are the theta moves
+    approaching the sweeps.
     """
 
+    # theta angle from which the unidirectional sweeps are approached
+    THETA_HOME = HOME
+
     def __init__(self, file_name=None, current_sample_name=None,
                  current_zone_plate=None, current_theta=None,
-                 current_energy=None, repetitions=None):
+                 current_energy=None, repetitions=None,
+                 skip_redundant=False, energy_approach=None,
+                 theta_scan=None, sample_delay=None, ff_cache=None,
+                 naming=None, calibration=None):
         self.file_name = file_name
         self.current_sample_name = current_sample_name
         self.current_zone_plate = current_zone_plate
         self.current_theta = current_theta
         self.current_energy = current_energy
+        # sample name, energy and theta at the start of the script
+        self._start = (current_sample_name, current_energy, current_theta)
+        # label of the region being collected (used by the estimations)
+        self.current_region = None
         self._repetitions = repetitions
+        if energy_approach is None:
+            energy_approach = EnergyApproach()
+        self.energy_approach = energy_approach
+        if theta_scan is None:
+            theta_scan = ThetaScan()
+        self.theta_scan = theta_scan
+        if sample_delay is None:
+            sample_delay = SampleDelay()
+        self.sample_delay = sample_delay
+        self.ff_cache = ff_cache
+        if naming is None:
+            naming = FileNaming()
+        self.naming = naming
+        self.calibration = calibration
+        # number of images recorded, and names of the indexed images by
+        # sample number and historical name
+        self._num_images = 0
+        self.indexed_names = {}
+        # estimation of the time of the recorded commands (only needed by
+        # the flat field cache)
+        self._clock = None
+        # number of theta sweeps and samples already recorded
+        self._num_sweeps = 0
+        self._num_samples = 0
+        self.skip_redundant = skip_redundant
+        # recorded script
+        self.script = TXMScript()
+        # last command written for every axis and setting
+        self.state = {}
+        self.redundant = RedundancySummary()
+        # resume filter, when only the missing images are collected
+        self.resume = None
+        self._dropping = False
+        self._pending = OrderedDict()
+        # last value of every label in the script
+        self._labels = {SAMPLE: None, REGION: None}
+
+    def _label(self, opcode, value):
+        """Record a label, if its value changed."""
+        labels = self._labels
+        if opcode not in labels or labels[opcode] != value:
+            self.script.append(opcode, value)
+            labels[opcode] = value
+
+    def _record(self, name, axis, value):
+        """Record a command in the script, preceded by the sample and
+        region labels if they changed."""
+        self._label(SAMPLE, self.current_sample_name)
+        self._label(REGION, self.current_region)
+        if name == 'moveto':
+            self.script.append(moveto_opcode(axis), value)
+        else:
+            self.script.append(OPCODES[name], value)
+        if self._clock is not None:
+            self._clock.add(name, axis, value)
+
+    def _write(self, name, axis, value):
+        self._flush_pending()
+        self._record(name, axis, value)
+
+    def _flush_pending(self):
+        for command in self._pending.values():
+            self._record(*command)
+        self._pending.clear()
+
+    def _write_state(self, key, name, axis, value, force=False):
+        """Write a command changing the state (axis or setting) key.
+
+        When skip_redundant is enabled, the command is dropped if it does
+        not change the state. The moves are kept pending until the next
+        wait or collect, so a move is also dropped if the same axis is
+        moved again before.
+        """
+        text = format_command(name, axis, value)
+        if self._dropping or (self.skip_redundant and not force and
+                              self.state.get(key) == text):
+            self.redundant.add(name, axis, value)
+            return
+        self.state[key] = text
+        if not self.skip_redundant or force:
+            self._write(name, axis, value)
+            return
+        if key in self._pending:
+            self.redundant.add(*self._pending.pop(key))
+        self._pending[key] = (name, axis, value)
+
+    def _move(self, axis, position, force=False):
+        self._write_state(axis, 'moveto', axis, position, force)
 
     def setBinning(self, binning=1):
-        self.destination.write('setbinning %d\n' % binning)
+        self._write_state('binning', 'setbinning', None, binning)
 
     def moveX(self, x):
-        self.destination.write('moveto X %6.2f\n' % x)
+        self._move('X', x)
 
     def moveY(self, y):
-        self.destination.write('moveto Y %6.2f\n' % y)
+        self._move('Y', y)
 
     def moveZ(self, z):
-        self.destination.write('moveto Z %6.2f\n' % z)
+        self._move('Z', z)
 
     def go_to_sample_xyz_pos(self, pos_x, pos_y, pos_z):
         self.moveX(pos_x)
@@ -57,51 +222,426 @@ class GenericTXMcommands(object):
 
     def moveZonePlateZ(self, zone_plate):
         self.current_zone_plate = zone_plate
-        self.destination.write('moveto ZPz %6.2f\n' % zone_plate)
+        self._move('ZPz', zone_plate)
 
-    def moveTheta(self, theta):
+    def moveTheta(self, theta, force=False):
         self.current_theta = theta
-        self.destination.write('moveto T %6.2f\n' % theta)
+        self._move('T', theta, force)
 
     def moveDetector(self, detector):
-        self.destination.write('moveto detz %6.2f\n' % detector)
+        self._move('detz', detector)
 
-    def moveEnergy(self, energy):
+    def moveEnergy(self, energy, force=False):
         self.current_energy = energy
-        self.destination.write('moveto energy %6.2f\n' % energy)
+        self._move('energy', energy, force)
 
     def go_to_energy(self, energy):
-        self.moveEnergy(energy)
-        # wait until energy reaches its position
+        # the whole backlash correction is dropped if the energy is kept
+        text = format_command('moveto', 'energy', energy)
+        self._dropping = (self.skip_redundant and
+                          self.state.get('energy') == text)
+        # repeat the move many times to correct backlash, waiting until
+        # energy reaches its position
         # (collect does not wait for the external moveables)
-        self.wait(60)
-        # repeat the move many times to correct backlash
-        self.moveEnergy(energy)
-        self.wait(10)
-        self.moveEnergy(energy)
-        self.wait(5)
-        self.moveEnergy(energy)
-        self.wait(5)
-        self.moveEnergy(energy)
+        moves = self.energy_approach.approach(self.current_energy, energy)
+        for position, wait_time in moves:
+            self.moveEnergy(position, force=True)
+            if wait_time:
+                self.wait(wait_time)
+        self._dropping = False
+
+    def _focus(self, energy):
+        if self.calibration is None:
+            raise ValueError("The zone plate and detector positions at "
+                             "energy %s are not given, and there is no "
+                             "focus calibration" % energy)
+        return self.calibration.focus(energy)
+
+    def zone_plate_at(self, energy, zone_plate=None):
+        """Zone plate position at energy: the one given, or the one of the
+        focus calibration if None."""
+        if zone_plate is None:
+            return self._focus(energy)[0]
+        return zone_plate
+
+    def detector_at(self, energy, detector=None):
+        """Detector position at energy: the one given, or the one of the
+        focus calibration if None."""
+        if detector is None:
+            return self._focus(energy)[1]
+        return detector
 
     def go_to_energy_zp_det(self, energy, zp_z, det_z):
         self.go_to_energy(energy)
         self.moveZonePlateZ(zp_z)
         self.moveDetector(det_z)
 
+    def theta_sweep(self, regions):
+        """Start a theta sweep over the regions, given as a list of
+        tuples whose last item is the array of theta positions of the
+        region: theta is moved to approach the first angle of the sweep.
+
+        Return the regions in the order of the sweep.
+        """
+        regions = self.theta_scan.sweep(regions, self._num_samples,
+                                        self._num_sweeps)
+        self._num_sweeps += 1
+        positions = regions[0][-1]
+        self._approach_theta(positions[0], sweep_direction(positions))
+        return regions
+
+    def _approach_theta(self, theta, direction):
+        # the approach moves are always written (like the energy backlash
+        # correction), as they are followed by the move to theta
+        for position, wait_time in self.theta_scan.approach(
+                self.current_theta, theta, direction, self.THETA_HOME):
+            self.moveTheta(position, force=True)
+            if wait_time:
+                self.wait(wait_time)
+
+    def iter_thetas(self, positions):
+        """Move theta to every position of a region of a sweep, yielding
+        it. The positions going back against the direction of the region
+        (e.g. the start of a new pass of the golden angle sampling, see
+        sampling) are approached again, as the start of a sweep.
+        """
+        direction = sweep_direction(positions)
+        for number, theta in enumerate(positions):
+            if (number and
+                    (theta - self.current_theta) * direction < 0):
+                self._approach_theta(theta, direction)
+            self.moveTheta(theta)
+            yield theta
+
+    def reuse_flat_fields(self, key, energy):
+        """Return True if the flat fields of key (a hashable description
+        of their configuration) at energy can be reused for the current
+        sample, instead of being collected."""
+        if self.ff_cache is None:
+            return False
+        return self.ff_cache.reuse(key, self._clock.estimate.total,
+                                   self._num_samples, energy)
+
+    def cache_flat_fields(self, key, energy, file_names):
+        """Cache the flat fields of key just collected."""
+        if self.ff_cache is not None:
+            self.ff_cache.add(key, self._clock.estimate.total,
+                              self._num_samples, energy, file_names)
+
     def setExpTime(self, exp_time):
-        self.destination.write('setexp %6.1f\n' % exp_time)
+        self._write_state('exptime', 'setexp', None, exp_time)
 
     def wait(self, wait_time):
-        self.destination.write('wait %s\n' % wait_time)
+        if self._dropping:
+            self.redundant.add('wait', None, wait_time)
+            return
+        self._write('wait', None, wait_time)
+
+    def collectImage(self, file_name, repetition=0, flatfield=False):
+        """Collect an image, named following the naming scheme. The image
+        is labelled with the sample number, its repetition (or number of
+        flat field image) and the flat field flag (see txmscript.LABELS).
+        Return the file name written."""
+        if self.naming.mode == INDEXED:
+            name = self.naming.image_name(file_name, self._num_images)
+            self.indexed_names[(self._num_samples, file_name)] = name
+            file_name = name
+        self._num_images += 1
+        self._flush_pending()
+        self._label(SAMPLE_NUMBER, self._num_samples)
+        self._label(REPETITION, repetition)
+        self._label(FLATFIELD, bool(flatfield))
+        self._record('collect', None, file_name)
+        return file_name
+
+    def _sample_stops(self, sample):
+        """Return the first and last positions (dictionaries axis:
+        position) of the stage and the energy collecting the sample, or
+        empty dictionaries if no image of the sample is collected."""
+        # recorded apart, not to reset the script being recorded, and
+        # with a fixed wait between samples, not to plan them again
+        txm_obj = copy.copy(self)
+        txm_obj.samples = [sample]
+        txm_obj.ff_cache = None
+        txm_obj.sample_delay = SampleDelay()
+        state = TXMState()
+        first = None
+        last = {}
+        for name, axis, value in txm_obj.record():
+            if name == 'collect':
+                last = dict((stop_axis, state.positions[stop_axis])
+                            for stop_axis in ('X', 'Y', 'Z', 'energy')
+                            if stop_axis in state.positions)
+                if first is None:
+                    first = last
+            state.add(name, axis, value)
+        if first is None:
+            return {}, {}
+        return first, last
+
+    def wait_between_samples(self, sample, next_sample=None):
+        """Wait after collecting the sample, as given by sample_delay."""
+        if self.sample_delay.is_conditional():
+            start = self._sample_stops(sample)[1]
+            end = None
+            if next_sample is not None:
+                end = self._sample_stops(next_sample)[0]
+            wait_time = self.sample_delay.delay(start, end)
+        else:
+            wait_time = self.sample_delay.delay()
+        if wait_time:
+            self.wait(wait_time)
+
+    def _schedule_sample(self, sample, cost_model=None):
+        """Return the sample with its own positions reordered. Implemented
+        by the subclasses which have several positions per sample."""
+        return sample
+
+    def schedule_samples(self, cost_model=None):
+        """Reorder the samples to minimize the stage travel and energy
+        changes between them, and the conditional waits between samples
+        (see scheduler.order_path).
+
+        The new order is only kept if it reduces the estimated duration of
+        the script. Return the estimated time saved (s).
+        """
+        samples = self.samples
+        before = self.generate(dry_run=True, cost_model=cost_model).total
+        scheduled = [self._schedule_sample(sample, cost_model)
+                     for sample in samples]
+        stops = [self._sample_stops(sample) for sample in scheduled]
+        costs = []
+        for _, last in stops:
+            row = []
+            for first, _ in stops:
+                cost = transition_time(last, first, cost_model)
+                if self.sample_delay.is_conditional():
+                    cost += self.sample_delay.delay(last, first)
+                row.append(cost)
+            costs.append(row)
+        self.samples = [scheduled[index] for index in order_path(costs)]
+        after = self.generate(dry_run=True, cost_model=cost_model).total
+        if after >= before:
+            self.samples = samples
+            return 0.0
+        return before - after
+
+    def iter_collect(self):
+        """Record the commands of the script. Implemented by the subclasses
+        as generators, yielding after every block of commands (e.g. every
+        region or angle), so the script can be consumed while recorded.
+        """
+        return iter(())
 
     def collect_data(self):
-        pass
+        for _ in self.iter_collect():
+            pass
+
+    def iter_scripts(self, batch_size=None, collected=None):
+        """Record the script lazily, yielding it in TXMScript chunks of at
+        least batch_size commands (but the last one). If batch_size is
+        None, the whole script is yielded at the end. Every chunk starts
+        with its sample and region labels.
+
+        If collected (file names of the images already collected) is
+        given, the script is resumed: only the missing images are
+        collected (see resume.Resume).
+        """
+        self.script = TXMScript()
+        self.state = {}
+        self.redundant = RedundancySummary()
+        self._pending = OrderedDict()
+        self._labels = {SAMPLE: None, REGION: None}
+        (self.current_sample_name, self.current_energy,
+         self.current_theta) = self._start
+        self.current_region = None
+        self._num_sweeps = 0
+        self._num_samples = 0
+        self._num_images = 0
+        self.indexed_names = {}
+        if self.ff_cache is None:
+            self._clock = None
+        else:
+            self.ff_cache.reset()
+            self._clock = DurationEstimator(self.ff_cache.cost_model)
+        if collected is None:
+            self.resume = None
+        else:
+            self.resume = Resume(collected, self.energy_approach,
+                                 self.theta_scan, self.THETA_HOME)
+        for _ in self.iter_collect():
+            if batch_size is not None and len(self.script) >= batch_size:
+                yield self._resumed(self.script)
+                self.script = TXMScript()
+                self._labels = {SAMPLE: None, REGION: None}
+        self._flush_pending()
+        yield self._resumed(self.script)
+
+    def _resumed(self, script):
+        if self.resume is None:
+            return script
+        return self.resume.filter(script)
+
+    def iter_batches(self, batch_size=BATCH_SIZE):
+        """Yield the XMController text of the script in blocks of lines."""
+        for script in self.iter_scripts(batch_size):
+            yield ''.join(iter_lines(script))
+
+    def iter_lines(self, batch_size=BATCH_SIZE):
+        """Yield the XMController lines of the script, one by one."""
+        for script in self.iter_scripts(batch_size):
+            for line in iter_lines(script):
+                yield line
+
+    def record(self, collected=None):
+        """Record and return the whole script. The methods writing,
+        checking and estimating the script are given it as script, not to
+        record it again."""
+        for script in self.iter_scripts(collected=collected):
+            return script
+
+    def _recorded(self, collected=None, script=None):
+        """Return the script given, or record it."""
+        if script is None:
+            script = self.record(collected)
+        return script
+
+    def _iter_recorded(self, batch_size=None, collected=None, script=None):
+        """Yield the script given, or record it (see iter_scripts)."""
+        if script is not None:
+            return iter([script])
+        return self.iter_scripts(batch_size, collected)
 
-    def generate(self):
+    def plan(self, collected=None):
+        """Return the acquisition plan of the recorded script (see
+        planner.PLAN_DTYPE and simulator.simulate)."""
+        return simulate(self.record(collected)).plan
+
+    def generate(self, dry_run=False, estimate=False, cost_model=None,
+                 output_format='txt', batch_size=BATCH_SIZE, collected=None,
+                 script=None, manifest=True):
+        """Record the TXM script and write it to file_name (or to stdout)
+        in the output format: 'txt' (XMController), 'json' or 'bin'.
+        The .txt scripts are written while recorded, in chunks of
+        batch_size commands, so they are generated with bounded memory.
+
+        If estimate is True, the commands are replayed against the cost
+        model, and the DurationEstimate is returned.
+        If dry_run is True, the script is only estimated and not written.
+        If collected is given, only the images which are not in it are
+        collected (see iter_scripts). If script is given (see record), it
+        is written instead of being recorded again.
+        If manifest is True, the manifest of the script written to
+        file_name is written next to it (see manifest.manifest_name); the
+        whole script is then recorded before being written.
+        """
+        estimator = DurationEstimator(cost_model)
+        if output_format != 'txt':
+            # the other formats are not written in chunks
+            batch_size = None
+        if dry_run:
+            for script in self._iter_recorded(batch_size, collected, script):
+                estimator.replay(script)
+            return estimator.estimate
+
+        with_manifest = manifest and self.file_name is not None
+        if with_manifest:
+            script = self._recorded(collected, script)
+        scripts = self._iter_recorded(batch_size, collected, script)
+
+        serializer = SERIALIZERS[output_format]
         if self.file_name is None:
             destination = sys.stdout
+            if output_format == 'bin':
+                # the bytes are written to the buffer of stdout (Python 3)
+                destination = getattr(sys.stdout, 'buffer', sys.stdout)
+        elif output_format == 'bin':
+            destination = open(self.file_name, 'wb')
         else:
             destination = open(self.file_name, 'w')
-        with destination as self.destination:
-            self.collect_data()
+        if output_format == 'txt':
+            writer = BufferedWriter(destination)
+        else:
+            writer = destination
+        try:
+            for script in scripts:
+                if estimate:
+                    estimator.replay(script)
+                serializer.dump(script, writer)
+            writer.flush()
+        finally:
+            if self.file_name is not None:
+                destination.close()
+        if with_manifest:
+            self.write_manifest(manifest_name(self.file_name), script=script)
+        if estimate:
+            return estimator.estimate
+
+    def estimate_theta_scans(self, cost_model=None):
+        """Estimate the duration of the script for every theta scan mode,
+        keeping the overshoot and waits of the current theta_scan.
+
+        Return an OrderedDict with the DurationEstimate of every mode.
+        """
+        theta_scan = self.theta_scan
+        estimates = OrderedDict()
+        try:
+            for mode in THETA_SCAN_MODES:
+                self.theta_scan = copy.copy(theta_scan)
+                self.theta_scan.mode = mode
+                estimates[mode] = self.generate(dry_run=True,
+                                                cost_model=cost_model)
+        finally:
+            self.theta_scan = theta_scan
+        return estimates
+
+    def check_limits(self, limits, collected=None, script=None):
+        """Return the list of violations of the limits (see limits.Limits)
+        by the script, checking all its positions and exposure times."""
+        return limits.check(self._recorded(collected, script))
+
+    def check_file_names(self, collected=None, script=None):
+        """Return the list of file names collected more than once by the
+        script (see naming.Collision)."""
+        return find_collisions(self._recorded(collected, script))
+
+    def estimate_data_volume(self, detector=None, cost_model=None,
+                             collected=None, script=None):
+        """Return the DataVolume written by the script (see datavolume)
+        with the detector given."""
+        estimator = DataVolumeEstimator(detector, cost_model)
+        for script in self._iter_recorded(BATCH_SIZE, collected, script):
+            estimator.replay(script)
+        return estimator.volume
+
+    def write_manifest(self, file_name, collected=None, script=None):
+        """Write the manifest of the script (see manifest), with one row
+        per collect, as CSV or as .npy if file_name ends with .npy."""
+        write_manifest(file_name,
+                       build_manifest(self._recorded(collected, script)))
+
+    def generate_chunks(self, num_chunks, cost_model=None, collected=None,
+                        script=None):
+        """Write the TXM script split into num_chunks .txt files of
+        balanced durations, which can be run independently (see sharding).
+        The files are named after file_name: <name>_<chunk number>.txt.
+
+        Return the list of (file name, DurationEstimate) of the chunks.
+        """
+        if self.file_name is None:
+            raise ValueError("A file name is needed to write the chunks")
+        root, extension = os.path.splitext(self.file_name)
+        chunks = split_script(self._recorded(collected, script), num_chunks,
+                              cost_model, self.energy_approach,
+                              self.theta_scan, self.THETA_HOME)
+        serializer = SERIALIZERS['txt']
+        result = []
+        for number, chunk in enumerate(chunks):
+            chunk_name = '%s_%d%s' % (root, number + 1, extension)
+            with open(chunk_name, 'w') as destination:
+                writer = BufferedWriter(destination)
+                serializer.dump(chunk, writer)
+                writer.flush()
+            estimate = DurationEstimator(cost_model).replay(chunk)
+            result.append((chunk_name, estimate))
+        return result
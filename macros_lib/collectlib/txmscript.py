@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+
+import json
+import struct
+import sys
+from array import array
+
+
+"""
+This module is used to hold the TXM scripts in a compact intermediate
+representation, which can be analysed and optimized before being written
+by one of the serializers (XMController .txt, JSON or binary).
+
+"""
+
+# opcodes
+SETBINNING = 0
+SETEXP = 1
+WAIT = 2
+COLLECT = 3
+# labels: they are not commands, but tell the sample and region which the
+# following commands belong to
+SAMPLE = 4
+REGION = 5
+# labels of the images collected by the following collect commands: number
+# of the sample (in the samples of the library), repetition (or number of
+# the flat field image) and flat field flag
+SAMPLE_NUMBER = 6
+REPETITION = 7
+FLATFIELD = 8
+LABELS = (SAMPLE, REGION, SAMPLE_NUMBER, REPETITION, FLATFIELD)
+# moveto commands: MOVETO + number of the axis in AXES
+MOVETO = 16
+
+AXES = ('X', 'Y', 'Z', 'T', 'ZPz', 'detz', 'energy')
+AXIS_NUMBERS = dict((axis, number) for number, axis in enumerate(AXES))
+
+NAMES = {
+    SETBINNING: 'setbinning',
+    SETEXP: 'setexp',
+    WAIT: 'wait',
+    COLLECT: 'collect',
+    SAMPLE: 'sample',
+    REGION: 'region',
+    SAMPLE_NUMBER: 'sample_number',
+    REPETITION: 'repetition',
+    FLATFIELD: 'flatfield',
+}
+OPCODES = dict((name, opcode) for opcode, name in NAMES.items())
+LABEL_NAMES = tuple(NAMES[opcode] for opcode in LABELS)
+
+# opcodes whose operand is an index of the string table
+STRING_OPCODES = (COLLECT, SAMPLE, REGION)
+
+
+def moveto_opcode(axis):
+    return MOVETO + AXIS_NUMBERS[axis]
+
+
+def is_label(opcode):
+    return opcode in LABELS
+
+
+class TXMScript(object):
+    """Compact TXM script.
+
+    Every command is stored as an opcode (1 byte) and a numeric operand
+    (8 bytes). The file names of the collect commands and the labels are
+    stored once in a string table, and the operand is their index.
+    """
+
+    def __init__(self):
+        self.opcodes = array('B')
+        self.operands = array('d')
+        self.strings = []
+        self._string_indexes = {}
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    def _string_index(self, value):
+        try:
+            return self._string_indexes[value]
+        except KeyError:
+            index = len(self.strings)
+            self.strings.append(value)
+            self._string_indexes[value] = index
+            return index
+
+    def append(self, opcode, operand):
+        if opcode in STRING_OPCODES:
+            operand = self._string_index(operand)
+        self.opcodes.append(opcode)
+        self.operands.append(operand)
+
+    def extend(self, commands):
+        """Append decoded (name, axis, value) commands."""
+        for name, axis, value in commands:
+            if name == 'moveto':
+                self.append(moveto_opcode(axis), value)
+            else:
+                self.append(OPCODES[name], value)
+
+    def decode(self, opcode, operand):
+        """Return the (name, axis, value) tuple of a command. The axis is
+        None for all the commands but moveto."""
+        if opcode >= MOVETO:
+            return 'moveto', AXES[opcode - MOVETO], operand
+        if opcode in STRING_OPCODES:
+            return NAMES[opcode], None, self.strings[int(operand)]
+        return NAMES[opcode], None, operand
+
+    def __iter__(self):
+        for opcode, operand in zip(self.opcodes, self.operands):
+            yield self.decode(opcode, operand)
+
+    def clear(self):
+        del self.opcodes[:]
+        del self.operands[:]
+        self.strings = []
+        self._string_indexes = {}
+
+
+def format_wait(wait_time):
+    if wait_time == int(wait_time):
+        return '%d' % wait_time
+    return '%s' % wait_time
+
+
+def format_command(name, axis, value):
+    """XMController text of a command (with the end of line), or None for
+    the labels."""
+    if name == 'moveto':
+        return 'moveto %s %6.2f\n' % (axis, value)
+    if name == 'collect':
+        return 'collect %s\n' % value
+    if name == 'setexp':
+        return 'setexp %6.1f\n' % value
+    if name == 'wait':
+        return 'wait %s\n' % format_wait(value)
+    if name == 'setbinning':
+        return 'setbinning %d\n' % value
+    return None
+
+
+def iter_lines(script):
+    """Yield the XMController lines of the script."""
+    for command in script:
+        text = format_command(*command)
+        if text is not None:
+            yield text
+
+
+class BufferedWriter(object):
+    """Text writer buffering the small writes, and writing them to the
+    destination in blocks of at least buffer_size characters."""
+
+    def __init__(self, destination, buffer_size=1 << 20):
+        self.destination = destination
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self._size = 0
+
+    def write(self, text):
+        self._buffer.append(text)
+        self._size += len(text)
+        if self._size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self.destination.write(''.join(self._buffer))
+            self._buffer = []
+            self._size = 0
+        self.destination.flush()
+
+
+class TXTSerializer(object):
+    """XMController .txt scripts. They are loaded without labels."""
+
+    def dump(self, script, destination):
+        for line in iter_lines(script):
+            destination.write(line)
+
+    def load(self, source):
+        script = TXMScript()
+        opcodes = script.opcodes
+        operands = script.operands
+        string_index = script._string_index
+        moveto_opcodes = dict((axis, moveto_opcode(axis)) for axis in AXES)
+        for line_number, line in enumerate(source, 1):
+            words = line.split(None, 1)
+            if not words:
+                continue
+            try:
+                name, argument = words
+                argument = argument.strip()
+                if name == 'moveto':
+                    axis, value = argument.split()
+                    opcode = moveto_opcodes[axis]
+                    operand = float(value)
+                elif name == 'collect':
+                    opcode = COLLECT
+                    operand = string_index(argument)
+                else:
+                    opcode = OPCODES[name]
+                    if is_label(opcode):
+                        # labels are not commands of the .txt scripts
+                        raise KeyError(name)
+                    operand = float(argument)
+            except (KeyError, ValueError):
+                raise ValueError('Line %d: wrong command: %s'
+                                 % (line_number, line.strip()))
+            opcodes.append(opcode)
+            operands.append(operand)
+        return script
+
+
+class JSONSerializer(object):
+    """JSON scripts, keeping the labels:
+    {"format": "txm-script", "version": 1,
+     "commands": [[name, axis, value], ...]}
+    """
+
+    def dump(self, script, destination):
+        json.dump({'format': 'txm-script', 'version': 1,
+                   'commands': [list(command) for command in script]},
+                  destination)
+
+    def load(self, source):
+        data = json.load(source)
+        script = TXMScript()
+        script.extend(data['commands'])
+        return script
+
+
+class BinarySerializer(object):
+    """Binary scripts: header (magic, version, number of commands and
+    length of the string table), opcodes, little-endian float64 operands,
+    and string table in JSON. The destination must be opened in binary
+    mode.
+    """
+
+    MAGIC = b'TXMS'
+    VERSION = 1
+    HEADER = struct.Struct('<4sHII')
+
+    def dump(self, script, destination):
+        operands = array('d', script.operands)
+        if sys.byteorder == 'big':
+            operands.byteswap()
+        strings = json.dumps(script.strings).encode('utf-8')
+        destination.write(self.HEADER.pack(self.MAGIC, self.VERSION,
+                                           len(script), len(strings)))
+        destination.write(_tobytes(script.opcodes))
+        destination.write(_tobytes(operands))
+        destination.write(strings)
+
+    def load(self, source):
+        magic, version, num_commands, strings_length = self.HEADER.unpack(
+            source.read(self.HEADER.size))
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError('Not a binary TXM script')
+        script = TXMScript()
+        _frombytes(script.opcodes, source.read(num_commands))
+        _frombytes(script.operands, source.read(num_commands * 8))
+        if sys.byteorder == 'big':
+            script.operands.byteswap()
+        for value in json.loads(source.read(strings_length).decode('utf-8')):
+            script._string_index(value)
+        return script
+
+
+def _tobytes(values):
+    try:
+        return values.tobytes()
+    except AttributeError:
+        return values.tostring()
+
+
+def _frombytes(values, data):
+    try:
+        values.frombytes(data)
+    except AttributeError:
+        values.fromstring(data)
+
+
+SERIALIZERS = {
+    'txt': TXTSerializer(),
+    'json': JSONSerializer(),
+    'bin': BinarySerializer(),
+}
+
+
+def load_script(file_name):
+    """Load a TXMScript from a .txt, .json or .bin file."""
+    extension = file_name.rsplit('.', 1)[-1].lower()
+    try:
+        serializer = SERIALIZERS[extension]
+    except KeyError:
+        raise ValueError('Unknown script format: %s' % file_name)
+    mode = 'rb' if extension == 'bin' else 'r'
+    with open(file_name, mode) as source:
+        return serializer.load(source)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the collectlib libraries. They do not need Sardana:
+
+    python -m pytest tests
+
+The samples of the tests are made by the factories of the fixtures below.
+
+"""
+
+import os
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), 'macros_lib'))
+
+
+def make_tomos_sample(name='sample1', pos_x=0, energies=([700, 20000],),
+                      regions=([-10, 10, 10, 1, 50, 0, 1],), ff_pos_x=2,
+                      n_images=1):
+    """Sample of ManyTomos (see tomoslib.ManyTomos)."""
+    return ['20171124', name, pos_x, 0, 0, [list(e) for e in energies],
+            [list(region) for region in regions], ff_pos_x, 2, 1, 2,
+            n_images]
+
+
+def make_spectrotomo_sample(name='sample1', regions=([-10, 10, 5, 1],),
+                            energies=([700, 20000, 50, 0.5, 1],
+                                      [710, 20100, 51, 0, 1]),
+                            n_images=1):
+    """Sample of SpectroTomo (see spectrotomolib.SpectroTomo)."""
+    return [name, 0, 0, 0, [list(region) for region in regions],
+            [list(e) for e in energies], n_images, 2, 2]
+
+
+def make_energyscan_sample(name='sample1', regions=([0, 0, 0],),
+                           energies=([700, 701, 0.5, 1, 1],), n_images=1):
+    """Sample of EnergyScan (see energyscanlib.EnergyScan)."""
+    return [name, [list(region) for region in regions],
+            [list(e) for e in energies], -10000.0, -9900.0, -1100.0,
+            -1000.0, 1.0, 1.0, n_images]
+
+
+@pytest.fixture
+def tomos_sample():
+    return make_tomos_sample
+
+
+@pytest.fixture
+def spectrotomo_sample():
+    return make_spectrotomo_sample
+
+
+@pytest.fixture
+def energyscan_sample():
+    return make_energyscan_sample
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+import pytest
+
+from collectlib.batch import MANYTOMOS, main, plan_jobs, validate
+
+
+def tomos_entry(name='sample1', date='20171124'):
+    return {'date': date, 'name': name, 'pos_x': 0, 'pos_y': 0, 'pos_z': 0,
+            'energy_zp': [[700, 20000]],
+            'sample_theta': [[-10, 10, 10, 1, 50]],
+            'ff_pos_x': 2, 'ff_pos_y': 2, 'exp_time_ff': 1,
+            'n_FF_images': 2}
+
+
+def write_table(tmpdir, entries):
+    table = tmpdir.join('week.json')
+    table.write(json.dumps({'kind': MANYTOMOS, 'samples': entries}))
+    return str(table)
+
+
+def test_validate_fields():
+    samples, groups = validate(MANYTOMOS, [tomos_entry()])
+    assert samples[0][1] == 'sample1' and groups == [None]
+    entry = tomos_entry()
+    entry['pos_x'] = 'left'
+    del entry['ff_pos_y']
+    with pytest.raises(ValueError) as error:
+        validate(MANYTOMOS, [entry])
+    message = str(error.value)
+    assert "pos_x: 'left' is not a number" in message
+    assert 'ff_pos_y: missing value' in message
+
+
+def test_validate_dates_names():
+    with pytest.raises(ValueError) as error:
+        validate(MANYTOMOS, [tomos_entry('my_sample', '2017_11_24')])
+    lines = str(error.value).splitlines()
+    assert len(lines) == 2
+    assert all(line.startswith('samples: sample 1: ') for line in lines)
+
+
+def test_collisions_checked_when_generated(tmpdir, capsys):
+    table = write_table(tmpdir, [tomos_entry(), tomos_entry()])
+    # the jobs are planned without recording the scripts
+    jobs = plan_jobs(table, str(tmpdir))
+    assert len(jobs) == 1
+    assert main([table, '--output-dir', str(tmpdir)]) == 1
+    assert not tmpdir.join('week.txt').exists()
+    assert 'week.txt' in capsys.readouterr().err
+
+
+def test_generate_table(tmpdir):
+    table = write_table(tmpdir, [tomos_entry(), tomos_entry('sample2')])
+    assert main([table, '--output-dir', str(tmpdir)]) == 0
+    assert 'collect' in tmpdir.join('week.txt').read()
+
+
+def test_duplicate_script_names(tmpdir, capsys):
+    table = write_table(tmpdir, [tomos_entry()])
+    output_dir = str(tmpdir.join('scripts'))
+    assert main([table, table, '--output-dir', output_dir]) == 1
+    assert 'week.txt: written by 2 scripts' in capsys.readouterr().err
+    assert not tmpdir.join('scripts').exists()
+
+
+def test_group_names(tmpdir):
+    grouped = tomos_entry('sample2')
+    grouped['group'] = 'default'
+    table = write_table(tmpdir, [tomos_entry(), grouped])
+    names = [job[2] for job in plan_jobs(table, str(tmpdir))]
+    assert names == [str(tmpdir.join('week.txt')),
+                     str(tmpdir.join('week_default.txt'))]
+
+
+def test_limits_and_manifest(tmpdir, capsys):
+    table = write_table(tmpdir, [tomos_entry(), tomos_entry('sample2')])
+    limits = tmpdir.join('limits.json')
+    limits.write(json.dumps({'T': [-5, 5]}))
+    assert main([table, '--output-dir', str(tmpdir),
+                 '--limits', str(limits)]) == 1
+    assert 'Sample sample1:' in capsys.readouterr().err
+    assert not tmpdir.join('week.txt').exists()
+    limits = tmpdir.join('wide_limits.json')
+    limits.write(json.dumps({'T': [-71, 71]}))
+    assert main([table, '--output-dir', str(tmpdir),
+                 '--limits', str(limits)]) == 0
+    assert tmpdir.join('week_manifest.csv').exists()
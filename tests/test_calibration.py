@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from collectlib.calibration import FocusCalibration, MonotoneSpline
+from collectlib.energyscanlib import EnergyScan
+
+
+def test_spline_through_the_points():
+    spline = MonotoneSpline([0, 1, 3, 4], [0, 2, 3, 10])
+    for x, y in zip(spline.xs, spline.ys):
+        assert spline(x) == pytest.approx(y)
+    # linear points give a line
+    line = MonotoneSpline([0, 1, 2], [1, 3, 5])
+    assert line(0.25) == pytest.approx(1.5)
+    assert line(1.5) == pytest.approx(4)
+
+
+def test_spline_monotone():
+    xs = [0, 1, 2, 3, 4]
+    ys = [0, 0.1, 5, 5.1, 5.2]
+    spline = MonotoneSpline(xs, ys)
+    values = [spline(index / 100.0) for index in range(401)]
+    assert all(low <= high for low, high in zip(values, values[1:]))
+    # no overshoot at a plateau
+    flat = MonotoneSpline([0, 1, 2], [0, 1, 1])
+    assert all(flat(1 + index / 10.0) == pytest.approx(1)
+               for index in range(11))
+
+
+def test_spline_errors():
+    spline = MonotoneSpline([0, 1], [0, 1])
+    with pytest.raises(ValueError):
+        spline(-0.1)
+    with pytest.raises(ValueError):
+        spline(1.1)
+    with pytest.raises(ValueError):
+        MonotoneSpline([0], [0])
+    with pytest.raises(ValueError):
+        MonotoneSpline([0, 1, 1], [0, 1, 2])
+
+
+def calibration():
+    return FocusCalibration.from_dict({'energy': [720, 700, 710],
+                                       'ZPz': [-9978, -10000, -9990],
+                                       'detz': [20310, 20000, 20150]})
+
+
+def test_focus():
+    focus = calibration()
+    # the rows are sorted by energy
+    assert focus.focus(710) == (-9990, 20150)
+    zone_plate, detector = focus.focus(705)
+    assert -10000 < zone_plate < -9990
+    assert 20000 < detector < 20150
+    assert focus.zone_plate(705) == zone_plate
+    # computed once
+    assert 705 in focus._focus
+    with pytest.raises(ValueError) as error:
+        focus.focus(730)
+    assert 'out of the focus calibration (700.0 to 720.0)' in str(
+        error.value)
+
+
+def test_from_file(tmpdir):
+    calibration_file = tmpdir.join('focus.csv')
+    calibration_file.write('energy,ZPz,detz\n700,-10000,20000\n'
+                           '710,-9990,20150\n')
+    focus = FocusCalibration.from_file(str(calibration_file))
+    assert focus.focus(705) == pytest.approx((-9995, 20075))
+    calibration_file.write('energy,ZPz\n700,-10000\n710,-9990\n')
+    with pytest.raises(ValueError):
+        FocusCalibration.from_file(str(calibration_file))
+
+
+def test_energy_scan_focus(energyscan_sample):
+    sample = energyscan_sample(energies=[[700, 710, 5, 1, 1]])
+    sample[3:7] = [None] * 4
+    energy_scan = EnergyScan([sample], calibration=calibration())
+    lines = [line.strip() for line in energy_scan.iter_lines()]
+    assert 'moveto ZPz -9990.00' in lines
+    assert 'moveto detz 20150.00' in lines
+    with pytest.raises(ValueError):
+        EnergyScan([sample]).record()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from collectlib.costmodel import (AxisCost, CostModel, DurationEstimator,
+                                  format_duration)
+from collectlib.tomoslib import ManyTomos
+
+
+def test_axis_cost():
+    cost = AxisCost(10, 0.5)
+    assert cost.move_time(None, 20) == 0.5
+    assert cost.move_time(20, -10) == pytest.approx(3.5)
+
+
+def test_from_dict():
+    cost_model = CostModel.from_dict({'T': [20, 0], 'readout': 2})
+    assert cost_model.move_time('T', 0, 10) == 0.5
+    # the other axes keep their default cost
+    assert cost_model.move_time('X', 0, 50) == 1.5
+    assert cost_model.collect_time(3) == 5
+    assert cost_model.overhead == 0.1
+
+
+def test_replay_totals():
+    cost_model = CostModel({'T': AxisCost(10, 0)}, readout=1, overhead=0)
+    commands = [('sample', None, 'sample1'), ('region', None, 'r1'),
+                ('moveto', 'energy', 700.0), ('moveto', 'T', 0.0),
+                ('moveto', 'T', 20.0), ('setexp', None, 2.0),
+                ('collect', None, 'a.xrm'), ('wait', None, 10),
+                ('collect', None, 'b.xrm')]
+    estimate = DurationEstimator(cost_model).replay(commands)
+    assert estimate.num_images == 2
+    assert estimate.exposure == 4
+    assert estimate.wait == 10
+    # 2 s of theta move and 2 x 3 s of collects, after the wait
+    assert estimate.total == pytest.approx(18)
+    assert list(estimate.samples) == ['sample1']
+    assert estimate.energies[('sample1', 700.0)] == pytest.approx(18)
+    assert estimate.regions[('sample1', 'r1')] == pytest.approx(18)
+
+
+def test_generate_estimate(tomos_sample):
+    tomos = ManyTomos([tomos_sample(), tomos_sample('sample2', 5)])
+    estimate = tomos.generate(dry_run=True)
+    replayed = DurationEstimator().replay(tomos.record())
+    assert estimate.total == pytest.approx(replayed.total)
+    assert estimate.total == pytest.approx(sum(estimate.samples.values()))
+    # 3 angles and 2 flat fields per sample
+    assert estimate.num_images == 10
+    assert 'sample sample2' in estimate.report()
+
+
+def test_format_duration():
+    assert format_duration(3725.4) == '1:02:05'
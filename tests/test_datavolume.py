@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from collectlib.costmodel import CostModel
+from collectlib.datavolume import DataVolumeEstimator, Detector
+from collectlib.tomoslib import ManyTomos
+
+
+def test_image_bytes():
+    detector = Detector(1024, 1024, 2, header=1000)
+    assert detector.image_bytes() == 2 * 1024 * 1024 + 1000
+    assert detector.image_bytes(2) == 2 * 512 * 512 + 1000
+    assert Detector.from_dict({'width': 100, 'height': 10,
+                               'header': 0}).image_bytes() == 2000
+
+
+def test_totals_and_rates():
+    detector = Detector(100, 100, 1, header=0)
+    cost_model = CostModel(readout=1, overhead=0)
+    commands = [('sample', None, 'sample1'), ('setbinning', None, 2),
+                ('setexp', None, 1.0), ('collect', None, 'a.xrm'),
+                ('setexp', None, 3.0), ('collect', None, 'b.xrm'),
+                ('wait', None, 4), ('sample', None, 'sample2'),
+                ('setbinning', None, 1), ('collect', None, 'c.xrm')]
+    volume = DataVolumeEstimator(detector, cost_model).replay(commands)
+    assert volume.num_images == 3
+    assert volume.bytes == 2500 + 2500 + 10000
+    assert volume.samples == {'sample1': 5000, 'sample2': 10000}
+    # 2 s per image at 1 s exposure, the fastest images
+    assert volume.peak_rate == 10000 / 4.0
+    # collects of 2, 4 and 4 s, and the wait
+    assert volume.duration == 14
+    assert volume.mean_rate == pytest.approx(15000 / 14.0)
+
+
+def test_warnings():
+    volume = DataVolumeEstimator(Detector(100, 100, 1, header=0)).replay(
+        [('collect', None, 'a.xrm')])
+    assert volume.warnings() == []
+    assert volume.warnings(free_space=20000, bandwidth=10 ** 6) == []
+    warnings = volume.warnings(free_space=5000, bandwidth=100)
+    assert len(warnings) == 2
+    assert 'more than the 4.9 KiB of free space' in warnings[0]
+
+
+def test_script_data_volume(tomos_sample):
+    tomos = ManyTomos([tomos_sample(), tomos_sample('sample2', 5)])
+    detector = Detector()
+    volume = tomos.estimate_data_volume(detector)
+    # 3 angles and 2 flat fields per sample
+    assert volume.num_images == 10
+    assert volume.bytes == 10 * detector.image_bytes()
+    assert list(volume.samples) == ['sample1', 'sample2']
+    assert 'Data volume:' in volume.report()
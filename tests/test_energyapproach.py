@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from collectlib.energyapproach import (EnergyApproach, LEGACY_TABLE,
+                                       STEP_TABLE)
+from collectlib.energyscanlib import EnergyScan
+
+
+def test_legacy_approach():
+    moves = EnergyApproach(LEGACY_TABLE).approach(700, 701)
+    assert moves == [(701, 60), (701, 10), (701, 5), (701, 5), (701, 0)]
+
+
+@pytest.mark.parametrize('previous, waits', [
+    (700.0, (2,)), (699.5, (2,)), (699, (5, 2)), (710, (10, 5, 5)),
+    (650, (60, 10, 5, 5)), (None, (60, 10, 5, 5))])
+def test_step_table_rows(previous, waits):
+    approach = EnergyApproach(STEP_TABLE)
+    assert approach.waits(previous, 700) == waits
+    moves = approach.approach(previous, 700)
+    assert [wait for _, wait in moves] == list(waits) + [0]
+    assert all(position == 700 for position, _ in moves)
+
+
+def test_table_down():
+    approach = EnergyApproach(STEP_TABLE, table_down=[(float('inf'), (30,))])
+    assert approach.waits(700, 701) == (5, 2)
+    assert approach.waits(701, 700) == (30,)
+
+
+def test_from_below():
+    approach = EnergyApproach(STEP_TABLE, from_below=True, overshoot=1.0)
+    # going up, the energy is approached directly
+    assert approach.approach(700, 700.5) == [(700.5, 2), (700.5, 0)]
+    # going down, the energy first moves 1 eV below, with the wait of the
+    # 11 eV step, and is then approached by 1 eV
+    assert approach.approach(710, 700) == [(699.0, 60), (700, 5),
+                                           (700, 2), (700, 0)]
+    assert approach.approach(None, 700)[0] == (699.0, 60)
+
+
+def test_from_dict():
+    approach = EnergyApproach.from_dict({'table': [[1, [3]], ['inf', []]],
+                                         'from_below': True})
+    assert approach.table == [(1.0, (3,)), (float('inf'), ())]
+    assert approach.table_down == approach.table
+    assert approach.from_below
+
+
+def energy_moves(lines):
+    return [line.split()[2] for line in lines
+            if line.startswith('moveto energy')]
+
+
+@pytest.mark.parametrize('skip_redundant', [False, True])
+def test_energy_scan_returns_with_the_approach(energyscan_sample,
+                                               skip_redundant):
+    samples = [energyscan_sample(energies=[[700, 720, 20, 1, 1]]),
+               energyscan_sample('sample2', energies=[[700, 720, 20, 1, 1]])]
+    energy_scan = EnergyScan(samples, skip_redundant=skip_redundant)
+    lines = [line.strip() for line in energy_scan.iter_lines()]
+    first = lines.index('collect sample2_0_700.00_0.xrm')
+    last = max(index for index, line in enumerate(lines)
+               if line.startswith('collect sample1_'))
+    between = lines[last:first]
+    # back to the first energy from above, with the whole approach
+    assert energy_moves(between)[:5] == ['700.00'] * 5
+    assert between.count('wait 60') == 1
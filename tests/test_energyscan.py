@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from collectlib.energyscanlib import (EnergyScan, FF_AFTER, FF_BEFORE,
+                                      FF_EVERY, FF_REGION)
+from collectlib.simulator import simulate
+
+
+@pytest.fixture
+def samples(energyscan_sample):
+    # 5 energies in two energy regions
+    return [energyscan_sample(energies=[[700, 701, 0.5, 1, 1],
+                                        [702, 703, 1, 1, 1]])]
+
+
+def collected(energy_scan):
+    return simulate(energy_scan.record()).file_names
+
+
+def flat_fields(energy_scan):
+    return [name for name in collected(energy_scan) if '_FF_' in name]
+
+
+@pytest.mark.parametrize('ff_mode, ff_step, energies', [
+    (FF_EVERY, 1, ['700.00', '700.50', '701.00', '702.00', '703.00']),
+    (FF_EVERY, 2, ['700.00', '701.00', '703.00']),
+    (FF_EVERY, 3, ['700.00', '702.00', '703.00']),
+    (FF_REGION, 1, ['700.00', '702.00']),
+    (FF_BEFORE, 1, ['703.00', '702.00', '701.00', '700.50', '700.00']),
+    (FF_AFTER, 1, ['703.00', '702.00', '701.00', '700.50', '700.00'])])
+def test_ff_modes(samples, ff_mode, ff_step, energies):
+    energy_scan = EnergyScan(samples, ff_mode=ff_mode, ff_step=ff_step)
+    assert flat_fields(energy_scan) == ['sample1_0_FF_%s.xrm' % energy
+                                        for energy in energies]
+    names = collected(energy_scan)
+    if ff_mode == FF_BEFORE:
+        assert names[:5] == flat_fields(energy_scan)
+    elif ff_mode == FF_AFTER:
+        assert names[-5:] == flat_fields(energy_scan)
+
+
+def test_wrong_ff_options(samples):
+    with pytest.raises(ValueError):
+        EnergyScan(samples, ff_mode='never')
+    with pytest.raises(ValueError):
+        EnergyScan(samples, ff_step=0)
+
+
+def test_ff_interpolation(samples):
+    energy_scan = EnergyScan(samples, ff_mode=FF_REGION)
+    interpolation = energy_scan.ff_interpolation(samples[0])
+    assert [energy for energy, _ in interpolation] == [700, 700.5, 701,
+                                                       702, 703]
+    low = 'sample1_0_FF_700.00.xrm'
+    high = 'sample1_0_FF_702.00.xrm'
+    assert interpolation[0][1] == [(low, 1.0)]
+    assert interpolation[1][1] == [(low, 0.75), (high, 0.25)]
+    assert interpolation[3][1] == [(high, 1.0)]
+    # after the last flat field
+    assert interpolation[4][1] == [(high, 1.0)]
+
+
+def test_write_ff_interpolation(tmpdir, samples):
+    energy_scan = EnergyScan(samples, ff_mode=FF_EVERY, ff_step=2)
+    file_name = str(tmpdir.join('ff.csv'))
+    energy_scan.write_ff_interpolation(file_name)
+    lines = tmpdir.join('ff.csv').read().splitlines()
+    assert lines[0] == 'sample,energy,flat_field,weight'
+    assert lines[1:5] == [
+        'sample1,700.00,sample1_0_FF_700.00.xrm,1.0000',
+        'sample1,700.50,sample1_0_FF_700.00.xrm,0.5000',
+        'sample1,700.50,sample1_0_FF_701.00.xrm,0.5000',
+        'sample1,701.00,sample1_0_FF_701.00.xrm,1.0000']
+    # the weights of every energy add up to 1
+    weights = {}
+    for line in lines[1:]:
+        _, energy, _, weight = line.split(',')
+        weights[energy] = weights.get(energy, 0) + float(weight)
+    assert all(abs(weight - 1) < 1e-9 for weight in weights.values())
+
+
+def test_estimate_ff_modes(samples):
+    energy_scan = EnergyScan(samples, ff_mode=FF_REGION)
+    estimates = energy_scan.estimate_ff_modes()
+    assert energy_scan.ff_mode == FF_REGION
+    assert (estimates[FF_REGION].num_images <
+            estimates[FF_EVERY].num_images == 10)
+
+
+def test_mosaic_order_and_names(energyscan_sample):
+    sample = energyscan_sample(regions=[[0, 0, 0], [10, 0, 0], [20, 0, 0]],
+                               energies=[[700, 701, 0.5, 1, 1]])
+    energy_scan = EnergyScan([sample], mosaic=True, ff_mode=FF_AFTER)
+    names = collected(energy_scan)
+    # every region at every energy, in the reverse order at the next one
+    assert names[:9] == ['sample1_0_700.00_0.xrm', 'sample1_0_700.00_1.xrm',
+                         'sample1_0_700.00_2.xrm', 'sample1_0_700.50_2.xrm',
+                         'sample1_0_700.50_1.xrm', 'sample1_0_700.50_0.xrm',
+                         'sample1_0_701.00_0.xrm', 'sample1_0_701.00_1.xrm',
+                         'sample1_0_701.00_2.xrm']
+    # imaged at the position of their region
+    assert list(simulate(energy_scan.record()).plan['x'][:6]) == [
+        0, 10, 20, 20, 10, 0]
+
+
+def test_without_mosaic_the_last_region_is_imaged(energyscan_sample):
+    sample = energyscan_sample(regions=[[0, 0, 0], [10, 0, 0]])
+    energy_scan = EnergyScan([sample], ff_mode=FF_AFTER)
+    plan = simulate(energy_scan.record()).plan
+    assert collected(energy_scan)[:3] == [
+        'sample1_0_700.00_0.xrm', 'sample1_0_700.50_0.xrm',
+        'sample1_0_701.00_0.xrm']
+    assert list(plan['x'][:3]) == [10, 10, 10]
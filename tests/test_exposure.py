@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from collectlib.energyscanlib import EnergyScan, FF_AFTER
+from collectlib.exposure import ExposurePlanner, TransmissionSpectrum
+
+
+@pytest.fixture
+def spectrum():
+    # absorption edge at 710 eV
+    return TransmissionSpectrum([700, 709, 711, 720],
+                                [0.8, 0.8, 0.2, 0.2])
+
+
+def test_transmission(spectrum):
+    assert spectrum.transmission(690) == 0.8
+    assert spectrum.transmission(710) == pytest.approx(0.5)
+    assert spectrum.transmission(730) == 0.2
+    with pytest.raises(ValueError):
+        TransmissionSpectrum([700], [0])
+    assert TransmissionSpectrum.from_prescan(
+        [700], [50], [100]).transmission(700) == 0.5
+
+
+def test_exposures_clipped(spectrum):
+    # 1.25 s below the edge and 5 s above it
+    planner = ExposurePlanner(spectrum, 1000, 1000)
+    assert planner.exposures([700, 720]) == [1.3, 5.0]
+    planner = ExposurePlanner(spectrum, 1000, 1000, min_exposure=2,
+                              max_exposure=4)
+    assert planner.needed(700) == 2
+    assert planner.needed(720) == 4
+    assert planner.exposures([700, 705, 720]) == [2, 2, 4]
+
+
+def test_exposures_grouped(spectrum):
+    planner = ExposurePlanner(spectrum, 1000, 1000, tolerance=0.5)
+    energies = [700, 705, 709, 710, 711, 715, 720]
+    exp_times = planner.exposures(energies)
+    # one exposure time below the edge, one across it and one above it
+    assert exp_times == [1.3, 1.3, 1.3, 2.0, 5.0, 5.0, 5.0]
+    with pytest.raises(ValueError):
+        ExposurePlanner(spectrum, 0, 1000)
+
+
+def setexp_values(energy_scan):
+    return [value for name, _, value in energy_scan.record()
+            if name == 'setexp']
+
+
+def test_exposure_set_when_changed(energyscan_sample, spectrum):
+    sample = energyscan_sample(energies=[[700, 720, 5, 1, 1]])
+    planner = ExposurePlanner(spectrum, 1000, 1000, tolerance=0.5)
+    energy_scan = EnergyScan([sample], ff_mode=FF_AFTER,
+                             exposure_planner=planner)
+    # the flat fields, the runs of the planner and the return
+    assert setexp_values(energy_scan) == [1.3, 2.0, 5.0, 1.0, 1.0]
+    assert energy_scan.exposure_saved() == pytest.approx(
+        5 - (1.3 + 1.3 + 2.0 + 5.0 + 5.0))
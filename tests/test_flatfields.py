@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+from collectlib.flatfields import FlatFieldCache
+from collectlib.simulator import simulate
+from collectlib.tomoslib import ManyTomos
+
+
+def test_reuse_within_the_window():
+    cache = FlatFieldCache(window=100)
+    key = (700, 50)
+    assert not cache.reuse(key, 0, 0, 700)
+    cache.add(key, 10, 0, 700, ['ff_0.xrm', 'ff_1.xrm'])
+    assert cache.reuse(key, 110, 1, 700)
+    assert not cache.reuse((710, 50), 110, 1, 710)
+    # the window expired
+    assert not cache.reuse(key, 110.5, 2, 700)
+    assert cache.num_reused == 2
+    assert cache.mapping[(0, 700)] == (['ff_0.xrm', 'ff_1.xrm'], False)
+    assert cache.mapping[(1, 700)] == (['ff_0.xrm', 'ff_1.xrm'], True)
+    assert (2, 700) not in cache.mapping
+    cache.reset()
+    assert not cache.reuse(key, 20, 0, 700)
+
+
+def test_write_mapping(tmpdir):
+    cache = FlatFieldCache()
+    cache.add('key', 0, 0, 700, ['ff_0.xrm'])
+    cache.reuse('key', 10, 1, 700)
+    file_name = str(tmpdir.join('ff.csv'))
+    cache.write(file_name, ['sample1', 'sample2'])
+    assert tmpdir.join('ff.csv').read().splitlines() == [
+        'sample,energy,flat_field,shared',
+        'sample1,700.00,ff_0.xrm,0', 'sample2,700.00,ff_0.xrm,1']
+
+
+def num_flat_fields(tomos):
+    return sum('_FF_' in name
+               for name in simulate(tomos.record()).file_names)
+
+
+def test_samples_share_their_flat_fields(tomos_sample):
+    samples = [tomos_sample(), tomos_sample('sample2', 5)]
+    assert num_flat_fields(ManyTomos(samples)) == 4
+    tomos = ManyTomos(samples, ff_cache=FlatFieldCache(3600))
+    assert num_flat_fields(tomos) == 2
+    assert tomos.ff_cache.num_reused == 2
+    # the flat fields of sample1 are too old for sample2
+    tomos = ManyTomos(samples, ff_cache=FlatFieldCache(1))
+    assert num_flat_fields(tomos) == 4
+    assert tomos.ff_cache.num_reused == 0
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from collectlib.limits import Limits, EXPOSURE, report
+from collectlib.tomoslib import ManyTomos
+
+
+@pytest.fixture
+def samples(tomos_sample):
+    return [tomos_sample(regions=[[-60, 60, 30, 1, 50, 0, 1]]),
+            tomos_sample('sample2', 5, regions=[[-10, 10, 10, 2, 50, 0, 1]])]
+
+
+def test_violations_per_sample_and_axis(samples):
+    tomos = ManyTomos(samples)
+    # the unidirectional sweeps are approached from -70.1
+    limits = Limits({'T': (-71, 45), EXPOSURE: (None, 1.5)})
+    violations = tomos.check_limits(limits)
+    assert [(violation.sample, violation.name)
+            for violation in violations] == [('sample1', 'T'),
+                                             ('sample2', EXPOSURE)]
+    theta = violations[0]
+    assert theta.count == 1
+    assert theta.minimum == theta.maximum == 60
+    lines = ''.join(tomos.iter_lines()).splitlines()
+    assert lines[theta.line - 1] == 'moveto T  60.00'
+    assert violations[1].minimum == 2
+
+
+def test_limits_within(samples):
+    tomos = ManyTomos(samples)
+    limits = Limits({'T': (-71, 71), 'X': (-10, 10)})
+    assert tomos.check_limits(limits) == []
+
+
+def test_unknown_limit():
+    with pytest.raises(ValueError):
+        Limits({'theta': (-70, 70)})
+
+
+def test_report(tomos_sample):
+    limits = Limits.from_dict({'X': [None, 3], EXPOSURE: [0.5, None]})
+    assert limits.limits['X'] == (None, 3)
+    tomos = ManyTomos([tomos_sample(pos_x=5)])
+    violations = tomos.check_limits(limits)
+    text = report(violations)
+    assert text.splitlines()[0] == '1 limit violations:'
+    assert 'Sample sample1: 1 X values out of [-inf, 3]: 5.00' in text
+    assert report([]) == 'All the positions are within the limits'
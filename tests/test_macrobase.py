@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+from collectlib.macrobase import TXMMacroBase
+from collectlib.tomoslib import ManyTomos
+
+
+class FakeMacro(TXMMacroBase):
+    """Macro reading its environment from a dictionary."""
+
+    SAMPLE_NAME = 1
+
+    def __init__(self, env=None):
+        self.env = env or {}
+        self.lines = []
+
+    def _get_env(self, name, default=None):
+        return self.env.get(name, default)
+
+    def output(self, line):
+        self.lines.append(line)
+
+    warning = output
+
+
+def test_legacy_zone_plate_limits():
+    macro = FakeMacro({'TXM_limits': {'X': [-100, 100]},
+                       'ZP_Z_limit_neg': -20, 'ZP_Z_limit_pos': 60})
+    limits = macro._get_limits().limits
+    assert tuple(limits['ZPz']) == (-20, 60)
+
+
+def test_write_manifest(tmpdir, tomos_sample):
+    file_name = str(tmpdir.join('tomos.txt'))
+    tomos = ManyTomos([tomos_sample()], file_name)
+    script = tomos.record()
+    tomos.generate(script=script)
+    macro = FakeMacro()
+    macro._write_manifest(tomos, file_name, script, binary=True)
+    for extension in ('csv', 'npy'):
+        name = str(tmpdir.join('tomos_manifest.%s' % extension))
+        assert os.path.exists(name)
+        assert 'Manifest written to %s' % name in macro.lines
+
+
+def test_generate_recorded_script(tmpdir, tomos_sample):
+    recorded = ManyTomos([tomos_sample()], str(tmpdir.join('recorded.txt')),
+                         skip_redundant=True)
+    script = recorded.record()
+    estimate = recorded.generate(estimate=True, script=script)
+    streamed = ManyTomos([tomos_sample()], str(tmpdir.join('streamed.txt')),
+                         skip_redundant=True)
+    assert estimate.total == streamed.generate(estimate=True).total
+    assert (tmpdir.join('recorded.txt').read() ==
+            tmpdir.join('streamed.txt').read())
+    # the summary of the recording is kept
+    assert (recorded.redundant.num_commands ==
+            streamed.redundant.num_commands > 0)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+from collectlib.manifest import build_manifest, manifest_name, read_manifest
+from collectlib.naming import FileNaming, INDEXED
+from collectlib.simulator import simulate
+from collectlib.tomoslib import ManyTomos
+from collectlib.txmscript import load_script
+
+
+def two_samples(tomos_sample, name='sample1'):
+    return [tomos_sample(name),
+            tomos_sample('sample2', 5, regions=[[-10, 10, 20, 1, 50, 0, 1]],
+                         n_images=2)]
+
+
+def test_recorded_image_labels(tomos_sample):
+    # a sample name which looks like a flat field, with indexed names
+    tomos = ManyTomos(two_samples(tomos_sample, 'sample_FF_1'),
+                      naming=FileNaming(INDEXED))
+    script = tomos.record()
+    simulation = simulate(script)
+    plan = simulation.plan
+    flat_fields = ['_700.0_FF_' in name for name in simulation.file_names]
+    assert list(plan['flatfield']) == flat_fields
+    assert list(plan['sample']) == [0] * 5 + [1] * 6
+    assert list(plan['repetition']) == [0, 0, 0, 0, 1,
+                                        0, 1, 0, 1, 0, 1]
+    names = ['sample_FF_1'] * 5 + ['sample2'] * 6
+    assert simulation.sample_names == names
+    rows = build_manifest(script)
+    assert list(rows['sample']) == names
+    assert list(rows['flatfield']) == flat_fields
+    assert list(rows['repetition']) == list(plan['repetition'])
+
+
+def test_text_script_without_labels(tmpdir, tomos_sample):
+    tomos = ManyTomos(two_samples(tomos_sample),
+                      str(tmpdir.join('tomos.txt')))
+    tomos.generate()
+    plan = simulate(load_script(tomos.file_name)).plan
+    recorded_plan = simulate(tomos.record()).plan
+    # the repetitions and flat fields follow from the commands and names
+    assert (plan['repetition'] == recorded_plan['repetition']).all()
+    assert (plan['flatfield'] == recorded_plan['flatfield']).all()
+    assert not plan['sample'].any()
+
+
+def test_manifest_written_with_the_script(tmpdir, tomos_sample):
+    tomos = ManyTomos(two_samples(tomos_sample),
+                      str(tmpdir.join('tomos.txt')))
+    tomos.generate()
+    rows = read_manifest(str(tmpdir.join('tomos_manifest.csv')))
+    assert list(rows['file_name']) == simulate(tomos.record()).file_names
+    tomos.file_name = str(tmpdir.join('without.txt'))
+    tomos.generate(manifest=False)
+    assert not tmpdir.join('without_manifest.csv').exists()
+    assert manifest_name('/data/tomos.txt', '.npy') == (
+        '/data/tomos_manifest.npy')
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from collectlib.naming import (FileNaming, MODES, FIXED, INDEXED,
+                               find_collisions)
+from collectlib.simulator import simulate
+from collectlib.tomoslib import ManyTomos
+
+
+@pytest.fixture
+def samples(tomos_sample):
+    # zone plate positions closer than the precision of the file names
+    return [tomos_sample(regions=[[-10, 10, 10, 1, 50, 0.01, 3]])]
+
+
+def test_fixed_names_collide(samples):
+    tomos = ManyTomos(samples)
+    script = tomos.record()
+    collisions = find_collisions(script)
+    # one file name per angle
+    assert len(collisions) == 3
+    collision = collisions[0]
+    assert collision.file_name == '20171124_sample1_700.0_-10.0_50.0.xrm'
+    assert collision.count == 3
+    assert collision.samples == ['sample1'] * 3
+    # lines of the .txt script
+    lines = ''.join(tomos.iter_lines()).splitlines()
+    assert all(lines[line - 1] == 'collect %s' % collision.file_name
+               for line in collision.lines)
+
+
+@pytest.mark.parametrize('mode', [mode for mode in MODES if mode != FIXED])
+def test_names_without_collisions(samples, mode):
+    tomos = ManyTomos(samples, naming=FileNaming(mode))
+    assert tomos.check_file_names() == []
+
+
+def test_adaptive_precision():
+    naming = FileNaming('adaptive')
+    assert naming.number(50.0, 1) == '50.0'
+    assert naming.number(49.99, 1) == '49.99'
+    assert naming.number(-0.123456789, 1) == '-0.123457'
+    with pytest.raises(ValueError):
+        FileNaming('rounded')
+
+
+def test_indexed_names(samples):
+    naming = FileNaming(INDEXED, index_digits=3)
+    assert naming.image_name('a_700.0.xrm', 12) == 'a_700.0_012.xrm'
+    tomos = ManyTomos(samples, naming=FileNaming(INDEXED))
+    names = simulate(tomos.record()).file_names
+    assert names[0] == '20171124_sample1_700.0_-10.0_50.0_000000.xrm'
+    assert len(set(names)) == len(names) == 11
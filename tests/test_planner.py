@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from collectlib.planner import (PLAN_DTYPE, angular_positions, arange,
+                                linspace, zone_plate_positions)
+from collectlib.simulator import simulate
+from collectlib.tomoslib import ManyTomos
+
+from conftest import TESTS_DIR
+
+
+@pytest.mark.parametrize('start, end, step', [
+    (-10, 10, 5), (0.1, 1.0, 0.1), (-70, 70, 0.3), (5, 5, 1), (10, -10, 5)])
+def test_closed_form_positions(start, end, step):
+    assert arange(start, end, step) == list(np.arange(start, end, step))
+    assert linspace(start, end, 7) == list(np.linspace(start, end, 7))
+    if start < end:
+        assert angular_positions(start, end, step)[-1] == end
+
+
+def test_zone_plate_positions():
+    assert zone_plate_positions(50, 0, 3) == [50.0]
+    assert zone_plate_positions(50, 0.5, 3) == [49.5, 50.0, 50.5]
+
+
+def test_plan(tomos_sample):
+    tomos = ManyTomos([tomos_sample(n_images=2)])
+    plan = tomos.plan()
+    assert plan.dtype == np.dtype(PLAN_DTYPE)
+    # 3 angles of 2 images, and 2 flat fields
+    assert len(plan) == 8
+    assert list(plan['theta'][:6]) == [-10, -10, 0, 0, 10, 10]
+    assert list(plan['flatfield']) == [False] * 6 + [True] * 2
+    assert list(plan['index']) == list(range(8))
+    # nothing left to collect
+    names = simulate(tomos.record()).file_names
+    assert len(tomos.plan(collected=set(names))) == 0
+
+
+def test_sample_stops(tomos_sample):
+    tomos = ManyTomos([tomos_sample(pos_x=5)])
+    first, last = tomos._sample_stops(tomos.samples[0])
+    assert first == {'X': 5, 'Y': 0, 'Z': 0, 'energy': 700}
+    # at the flat field position
+    assert last == {'X': 2, 'Y': 2, 'Z': 0, 'energy': 700}
+
+
+def test_sample_stops_without_images(tomos_sample):
+    tomos = ManyTomos([tomos_sample(energies=[])])
+    assert len(tomos.plan()) == 0
+    assert tomos._sample_stops(tomos.samples[0]) == ({}, {})
+
+
+def test_conditional_delay_without_numpy():
+    code = '\n'.join([
+        'import sys',
+        'from conftest import make_tomos_sample',
+        'from collectlib.scheduler import SampleDelay',
+        'from collectlib.tomoslib import ManyTomos',
+        "samples = [make_tomos_sample(), make_tomos_sample('sample2', 500)]",
+        'delay = SampleDelay(60, min_travel=100)',
+        'tomos = ManyTomos(samples, sample_delay=delay)',
+        'tomos.generate(dry_run=True)',
+        "assert 'numpy' not in sys.modules",
+    ])
+    subprocess.check_call([sys.executable, '-c', code], cwd=TESTS_DIR)
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from collectlib.costmodel import CostModel
+from collectlib.simulator import simulate
+from collectlib.spectrotomolib import SpectroTomo, ORDERS
+from collectlib.thetascan import (ThetaScan, PER_ENERGY,
+                                  MODES as THETA_SCAN_MODES)
+from collectlib.tomoslib import ManyTomos
+from collectlib.txmscript import iter_lines
+
+
+@pytest.fixture
+def samples(tomos_sample):
+    return [tomos_sample(energies=[[700, 20000], [710, 20100]],
+                         regions=[[-10, 10, 5, 1, 50, 0.5, 3]]),
+            tomos_sample('sample2', 5,
+                         regions=[[10, -10, 10, 1, 50, 0, 1, 'golden', 6]],
+                         n_images=2)]
+
+
+def theta_path(script):
+    """Theta moves, without the consecutive repeated positions."""
+    path = []
+    for name, axis, value in script:
+        if axis == 'T' and (not path or path[-1] != value):
+            path.append(value)
+    return path
+
+
+def check_skip_redundant(factory):
+    script = factory(False).record()
+    skipped = factory(True).record()
+    assert len(skipped) < len(script)
+    # the same images with the same motor state, reached the same way
+    assert simulate(skipped).file_names == simulate(script).file_names
+    plan = simulate(script).plan
+    skipped_plan = simulate(skipped).plan
+    for field in ('energy', 'theta', 'zp', 'detz', 'x', 'y', 'z',
+                  'exptime'):
+        assert (skipped_plan[field] == plan[field]).all()
+    assert theta_path(skipped) == theta_path(script)
+
+
+def test_redundancy_summary(samples):
+    script = ManyTomos(samples).record()
+    tomos = ManyTomos(samples, skip_redundant=True)
+    skipped = tomos.record()
+    summary = tomos.redundant
+    # the samples and their flat fields are at the same Z
+    assert summary.moves == {'Z': 2}
+    assert (summary.num_commands ==
+            len(list(iter_lines(script))) - len(list(iter_lines(skipped))))
+    assert summary.seconds(CostModel()) == pytest.approx(
+        summary.num_commands * 0.1 + 2 * 0.5)
+    assert 'Redundant commands removed: %d' % summary.num_commands in (
+        summary.report())
+
+
+@pytest.mark.parametrize('mode', THETA_SCAN_MODES)
+def test_skip_redundant_keeps_the_theta_approach(samples, mode):
+    check_skip_redundant(lambda skip: ManyTomos(
+        samples, skip_redundant=skip, theta_scan=ThetaScan(mode)))
+
+
+@pytest.mark.parametrize('mode', THETA_SCAN_MODES)
+@pytest.mark.parametrize('order', ORDERS)
+def test_skip_redundant_spectrotomo(spectrotomo_sample, mode, order):
+    check_skip_redundant(lambda skip: SpectroTomo(
+        [spectrotomo_sample()], skip_redundant=skip, order=order,
+        theta_scan=ThetaScan(mode)))
+
+
+def test_serpentine_overshoot_with_skip_redundant(samples):
+    tomos = ManyTomos(samples[:1], skip_redundant=True,
+                      theta_scan=ThetaScan(PER_ENERGY, overshoot=1.0))
+    lines = [line.strip() for line in tomos.iter_lines()]
+    # the upward sweep is approached from -11, the downward one from 11
+    assert lines.count('moveto T -11.00') == 1
+    assert lines.count('moveto T  11.00') == 1
+    start = lines.index('moveto T  11.00')
+    assert lines[start + 1] == 'moveto T  10.00'
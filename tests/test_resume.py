@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from collectlib.scheduler import SampleDelay
+from collectlib.sharding import TXMState
+from collectlib.thetascan import (ThetaScan, PER_ENERGY,
+                                  MODES as THETA_SCAN_MODES)
+from collectlib.tomoslib import ManyTomos
+
+
+def two_regions(tomos_sample, sampling='equal'):
+    # a downward region and an upward one, at two energies
+    return [tomos_sample(energies=[[700, 20000], [710, 20100]],
+                         regions=[[10, -10, 5, 1, 50, 0, 1, sampling, 9],
+                                  [20, 40, 5, 1, 50, 0, 1]],
+                         n_images=2)]
+
+
+def arrivals(script):
+    """(theta, side from which it was reached) at every collect."""
+    state = TXMState()
+    result = []
+    for command in script:
+        if command[0] == 'collect':
+            result.append((state.positions.get('T'), state.theta_direction))
+        state.add(*command)
+    return result
+
+
+def collects(script):
+    return [value for name, _, value in script if name == 'collect']
+
+
+@pytest.mark.parametrize('mode', THETA_SCAN_MODES)
+@pytest.mark.parametrize('sampling', ['equal', 'golden'])
+def test_resume_reaches_theta_from_the_same_side(tomos_sample, mode,
+                                                 sampling):
+    tomos = ManyTomos(two_regions(tomos_sample, sampling),
+                      theta_scan=ThetaScan(mode))
+    script = tomos.record()
+    resumed = tomos.record(collected=set())
+    assert collects(resumed) == collects(script)
+    assert arrivals(resumed) == arrivals(script)
+    # no approach is added
+    theta_moves = [command for command in script if command[1] == 'T']
+    resumed_moves = [command for command in resumed if command[1] == 'T']
+    assert len(resumed_moves) <= len(theta_moves)
+
+
+def test_resume_downward_region_is_approached_once(tomos_sample):
+    tomos = ManyTomos(two_regions(tomos_sample))
+    resumed = list(tomos.record(collected=set()))
+    homes = [command for command in resumed
+             if command == ('moveto', 'T', tomos.THETA_HOME)]
+    assert len(homes) == 1
+    assert ('moveto', 'T', -71.0) not in resumed
+
+
+def test_resume_skips_the_collected_images(tomos_sample):
+    tomos = ManyTomos(two_regions(tomos_sample),
+                      theta_scan=ThetaScan(PER_ENERGY))
+    names = collects(tomos.record())
+    collected = set(names[:7])
+    resumed = tomos.record(collected=collected)
+    assert collects(resumed) == names[7:]
+    assert tomos.resume.num_skipped == 7
+    # the first missing image is reached from the side of the script
+    assert arrivals(resumed)[0] == arrivals(tomos.record())[7]
+
+
+def test_resume_keeps_the_waits_between_samples(tomos_sample):
+    samples = [tomos_sample(), tomos_sample('sample2', 5),
+               tomos_sample('sample3', 10)]
+    tomos = ManyTomos(samples, sample_delay=SampleDelay(300))
+    names = collects(tomos.record())
+    # sample1 and sample2 were collected
+    resumed = list(tomos.record(collected=set(names[:10])))
+    waits = [value for name, _, value in resumed if name == 'wait']
+    # one wait before sample3 (not one per sample skipped), before the
+    # approach to the first image
+    assert waits.count(300) == 1
+    assert waits.index(300) < waits.index(60)
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+from collectlib.costmodel import AxisCost, CostModel
+from collectlib.scheduler import (SampleDelay, order_path, path_cost,
+                                  transition_time)
+from collectlib.tomoslib import ManyTomos
+
+
+def line_costs(positions):
+    return [[abs(end - start) for end in positions] for start in positions]
+
+
+def test_order_path_on_a_line():
+    costs = line_costs([0, 300, 100, 200])
+    order = order_path(costs)
+    assert path_cost(order, costs) == 300
+    assert order_path(costs, fixed_first=True) == [0, 2, 3, 1]
+    assert order_path(costs, fixed_first=True, fixed_last=True) in (
+        [0, 2, 1, 3], [0, 1, 2, 3])
+
+
+def test_conditional_delay():
+    delay = SampleDelay(60, min_travel=100)
+    assert delay.delay({'X': 0, 'Y': 0}, {'X': 50, 'Y': 0}) == 0
+    assert delay.delay({'X': 0, 'Y': 0}, {'X': 150, 'Y': 0}) == 60
+    # not after the last sample
+    assert delay.delay({'X': 0}, None) == 0
+    assert SampleDelay(60).delay() == 60
+
+
+def test_schedule_samples(tomos_sample):
+    samples = [tomos_sample(name, pos_x, ff_pos_x=pos_x)
+               for name, pos_x in [('far', 3000), ('near', 0),
+                                   ('middle', 1500)]]
+    tomos = ManyTomos(samples,
+                      sample_delay=SampleDelay(60, min_travel=1000))
+    before = tomos.generate(dry_run=True).total
+    saved = tomos.schedule_samples()
+    assert [sample[1] for sample in tomos.samples] in (
+        ['near', 'middle', 'far'], ['far', 'middle', 'near'])
+    assert saved > 0
+    assert abs(tomos.generate(dry_run=True).total - (before - saved)) < 1e-6
+
+
+def test_transition_time():
+    cost_model = CostModel({'X': AxisCost(10), 'energy': AxisCost(2)})
+    start = {'X': 0, 'Y': 0, 'energy': 700}
+    end = {'X': 100, 'energy': 710, 'Z': 5}
+    # the axes not in the start positions are not counted
+    assert transition_time(start, end, cost_model) == 10 + 5
+
+
+def test_energy_change_delay():
+    delay = SampleDelay.from_dict({'wait': 60, 'min_energy_change': 10})
+    assert delay.is_conditional()
+    assert delay.delay({'energy': 700}, {'energy': 705}) == 0
+    assert delay.delay({'energy': 710}, {'energy': 700}) == 60
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from collectlib.sharding import TXMState, split_script
+from collectlib.thetascan import ThetaScan, PER_ENERGY
+from collectlib.tomoslib import ManyTomos
+
+
+@pytest.fixture
+def samples(tomos_sample):
+    return [tomos_sample(energies=[[700, 20000], [710, 20100]],
+                         regions=[[-10, 10, 5, 1, 50, 0, 1]])]
+
+
+def theta_moves(commands):
+    return [value for name, axis, value in commands if axis == 'T']
+
+
+def state_of(commands):
+    state = TXMState()
+    for command in commands:
+        state.add(*command)
+    return state
+
+
+def test_restore_downward_sweep_serpentine():
+    state = state_of([('moveto', 'T', 11.0), ('moveto', 'T', 10.0),
+                      ('moveto', 'T', 8.0)])
+    assert state.theta_direction == -1
+    commands = state.restore(theta_scan=ThetaScan(PER_ENERGY))
+    # approached from above, as the sweep
+    assert theta_moves(commands) == [9.0, 8.0]
+    assert ('wait', None, 10) not in commands
+
+
+def test_restore_unidirectional_home():
+    state = state_of([('moveto', 'T', -70.1), ('moveto', 'T', 5.0)])
+    commands = state.restore(theta_scan=ThetaScan(), theta_home=-70.1)
+    assert theta_moves(commands) == [-70.1, 5.0]
+    assert ('wait', None, 10) in commands
+
+
+def test_split_restores_theta_from_the_sweep_side(samples):
+    tomos = ManyTomos(samples, theta_scan=ThetaScan(PER_ENERGY))
+    chunks = split_script(tomos.record(), 6,
+                          energy_approach=tomos.energy_approach,
+                          theta_scan=tomos.theta_scan,
+                          theta_home=tomos.THETA_HOME)
+    assert len(chunks) > 2
+    state = TXMState()
+    directions = []
+    for number, chunk in enumerate(chunks):
+        commands = list(chunk)
+        if number:
+            restore = state.restore(tomos.energy_approach, tomos.theta_scan,
+                                    tomos.THETA_HOME)
+            assert commands[:len(restore)] == restore
+            assert (state_of(restore).theta_direction ==
+                    state.theta_direction)
+            directions.append(state.theta_direction)
+            commands = commands[len(restore):]
+        for command in commands:
+            state.add(*command)
+    # the downward sweeps are split too
+    assert -1 in directions
+
+
+def test_chunks_use_the_home_of_the_library(samples, tmp_path):
+    tomos = ManyTomos(samples, str(tmp_path / 'tomos.txt'))
+    chunks = tomos.generate_chunks(2)
+    with open(chunks[1][0]) as chunk:
+        lines = chunk.read().splitlines()
+    theta_lines = [line for line in lines if line.startswith('moveto T')]
+    assert theta_lines[0] == 'moveto T -70.10'
+    assert 'moveto T -71.00' not in lines
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from collectlib.simulator import main, simulate
+from collectlib.txmscript import TXMScript, load_script
+
+
+def script_of(commands):
+    script = TXMScript()
+    script.extend(commands)
+    return script
+
+
+def test_simulate_counts():
+    simulation = simulate(script_of([
+        ('setbinning', None, 1), ('moveto', 'energy', 700.0),
+        ('moveto', 'T', -10.0), ('setexp', None, 2.0),
+        ('collect', None, 'a_-10.xrm'), ('moveto', 'T', 10.0),
+        ('wait', None, 5), ('moveto', 'T', -5.0),
+        ('collect', None, 'a_-5.xrm'), ('setexp', None, 1.0),
+        ('moveto', 'X', 3.0), ('collect', None, 'a_FF_1.xrm')]))
+    assert simulation.num_images == 3
+    assert simulation.file_names == ['a_-10.xrm', 'a_-5.xrm', 'a_FF_1.xrm']
+    assert simulation.moves['T'] == 3
+    # from the first position of theta
+    assert simulation.travel['T'] == 35
+    assert simulation.travel['X'] == 0
+    assert simulation.wait == 5
+    assert simulation.exposure == 5
+    plan = simulation.plan
+    assert list(plan['theta']) == [-10, -5, -5]
+    assert list(plan['exptime']) == [2, 2, 1]
+    # X is not set before the last image
+    assert list(plan['x'][:2] != plan['x'][:2]) == [True, True]
+    assert plan['x'][2] == 3
+    assert list(plan['flatfield']) == [False, False, True]
+
+
+def test_simulate_empty_script():
+    simulation = simulate(TXMScript())
+    assert simulation.num_images == 0
+    assert len(simulation.plan) == 0
+
+
+@pytest.mark.parametrize('line', ['moveto W 1.00', 'setexp fast',
+                                  'sample sample1', 'collect'])
+def test_wrong_txt_commands(tmpdir, line):
+    script_file = tmpdir.join('wrong.txt')
+    script_file.write('setbinning 1\n\n%s\n' % line)
+    with pytest.raises(ValueError) as error:
+        load_script(str(script_file))
+    assert str(error.value) == 'Line 3: wrong command: %s' % line
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        load_script('script.xml')
+
+
+def test_main(tmpdir, capsys):
+    script_file = tmpdir.join('script.txt')
+    script_file.write('moveto T -10.00\nsetexp    1.0\n'
+                      'collect a.xrm\nwait 10\n')
+    collects = str(tmpdir.join('collects.csv'))
+    assert main([str(script_file), '--collects', collects]) == 0
+    output = capsys.readouterr().out
+    assert output.startswith('1 images')
+    assert 'T: 1 moves' in output
+    lines = tmpdir.join('collects.csv').read().splitlines()
+    assert lines[1].startswith('0,a.xrm,')
+    assert main([str(tmpdir.join('missing.txt'))]) == 1
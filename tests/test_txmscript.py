@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from collectlib.simulator import simulate
+from collectlib.spectrotomolib import SpectroTomo
+from collectlib.txmscript import (SERIALIZERS, TXMScript, COLLECT, SAMPLE,
+                                  SETEXP, is_label, load_script, iter_lines,
+                                  moveto_opcode)
+
+
+def test_compact_commands():
+    script = TXMScript()
+    script.extend([('sample', None, 'sample1'), ('moveto', 'T', -10.0),
+                   ('setexp', None, 2.0), ('collect', None, 'a.xrm'),
+                   ('collect', None, 'b.xrm'), ('collect', None, 'a.xrm')])
+    assert len(script) == 6
+    assert list(script.opcodes) == [SAMPLE, moveto_opcode('T'), SETEXP,
+                                    COLLECT, COLLECT, COLLECT]
+    # the strings are stored once
+    assert script.strings == ['sample1', 'a.xrm', 'b.xrm']
+    assert list(script.operands) == [0, -10.0, 2.0, 1, 2, 1]
+    assert list(script)[3:] == [('collect', None, 'a.xrm'),
+                                ('collect', None, 'b.xrm'),
+                                ('collect', None, 'a.xrm')]
+    assert is_label(SAMPLE) and not is_label(COLLECT)
+    # the labels are not written
+    assert list(iter_lines(script)) == [
+        'moveto T -10.00\n', 'setexp    2.0\n', 'collect a.xrm\n',
+        'collect b.xrm\n', 'collect a.xrm\n']
+    script.clear()
+    assert len(script) == 0 and list(script) == []
+
+
+@pytest.mark.parametrize('output_format', sorted(SERIALIZERS))
+def test_round_trip(tmpdir, spectrotomo_sample, output_format):
+    file_name = str(tmpdir.join('spectrotomo.%s' % output_format))
+    spectrotomo = SpectroTomo([spectrotomo_sample(n_images=2)], file_name)
+    spectrotomo.generate(output_format=output_format)
+    script = spectrotomo.record()
+    loaded = load_script(file_name)
+    assert list(iter_lines(loaded)) == list(iter_lines(script))
+    if output_format != 'txt':
+        # the labels are kept
+        assert list(loaded) == list(script)
+    assert simulate(loaded).file_names == simulate(script).file_names